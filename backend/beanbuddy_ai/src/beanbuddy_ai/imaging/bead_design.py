@@ -0,0 +1,359 @@
+import logging
+from io import BytesIO
+from typing import Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+import requests
+from PIL import Image, ImageDraw, ImageFont
+from rembg import remove
+from rembg.sessions import BaseSession
+
+from .bead_grid import grid_from_cell_colors, reduce_palette, render_design_image, save_grid
+from ..utils.artifact_store import get_artifact_store, is_artifact_ref
+from ..utils.cancellation import check_cancelled
+from ..utils.image_cache import resolve_local_image
+from ..utils.output_store import OutputStore, get_output_store
+from ..utils.rembg_session import CUTOUT_KIND
+from ..utils.tracing import SPAN_COMPUTE, SPAN_HTTP, record_bytes, record_cache_lookup, span
+
+logger = logging.getLogger(__name__)
+
+def generate_bead_design(image_url: str, session: BaseSession, color_template: str = "卡卡",
+                         output_store: Optional[OutputStore] = None, max_colors: int = 0,
+                         alpha_matting: bool = True, draw_labels: bool = True,
+                         fast_encoding: bool = False) -> Dict[str, Any]:
+    """
+    生成拼豆设计图并统计颜色数量。
+
+    Args:
+        image_url (str): 输入图片的URL。
+        session (BaseSession): rembg模型。
+        color_template (str): 色卡模板名称。
+        output_store (OutputStore): 设计图输出存储，为空时使用共享的默认存储。
+        max_colors (int): 最多使用的颜色数，0 表示不限制。
+        alpha_matting (bool): 抠图时是否启用Alpha Matting精细边缘处理。
+        draw_labels (bool): 是否在每颗豆子上绘制颜色编号。
+        fast_encoding (bool): 使用低压缩级别快速编码PNG（文件更大，编码更快）。
+
+    Returns:
+        dict: 包含设计图文件名（内容哈希）和颜色统计结果。
+    """
+
+    # 处理单张图像
+    result = process_large_image_optimized(
+        image_url=image_url,
+        session=session,
+        output_store=output_store or get_output_store(),
+        draw_labels=draw_labels,
+        color_template=color_template,
+        max_colors=max_colors,
+        alpha_matting=alpha_matting,
+        fast_encoding=fast_encoding
+    )
+
+    return result
+
+
+def remove_background_rembg_optimized(image_url: str,
+                                      session: BaseSession,
+                                      enable_alpha_matting: bool = True) -> Image.Image:
+    """
+    使用rembg库进行高质量背景移除（优化版）
+
+    参数:
+    image_url: 图片链接或 artifact:// 制品引用
+    session: rembg模型会话
+    enable_alpha_matting: 是否启用Alpha Matting精细边缘处理
+
+    返回:
+    PIL Image对象（RGBA模式，背景透明）
+    """
+    try:
+        # 制品引用（或已预取到本地的URL）直接读取制品存储，解码结果与抠图结果按制品缓存
+        artifact_ref = resolve_local_image(image_url)
+        if not is_artifact_ref(image_url):
+            record_cache_lookup("local_image", "hit" if artifact_ref is not None else "miss")
+        if artifact_ref is not None:
+            store = get_artifact_store()
+            removed_kind = f"rembg:{getattr(session, 'model_name', type(session).__name__)}:{enable_alpha_matting}"
+            # 抠图工具在本地完成的透明背景主体无需再次移除背景
+            cached_output = store.get_decoded(artifact_ref, CUTOUT_KIND)
+            if cached_output is None:
+                cached_output = store.get_decoded(artifact_ref, removed_kind)
+            record_cache_lookup("background_removal", "hit" if cached_output is not None else "miss")
+            if cached_output is not None:
+                logger.info(f"复用已缓存的背景移除结果：{artifact_ref}")
+                return cached_output
+            input_image = store.get_decoded(artifact_ref, "rgba",
+                                            lambda data: Image.open(BytesIO(data)).convert("RGBA"))
+            logger.info(f"从制品存储读取图像，尺寸: {input_image.size}")
+        elif is_artifact_ref(image_url):
+            raise KeyError(f"制品不存在或已过期: {image_url}")
+        else:
+            # 下载图像（使用流式下载减少内存使用）
+            with span("image_download", SPAN_HTTP):
+                response = requests.get(image_url, timeout=10, stream=True)
+                response.raise_for_status()
+
+                # 使用BytesIO进行流式处理
+                content = BytesIO()
+                for chunk in response.iter_content(chunk_size=8192):
+                    content.write(chunk)
+                    check_cancelled("image_download")
+                record_bytes("image_download", content.tell())
+                content.seek(0)
+
+            input_image = Image.open(content).convert("RGBA")
+            logger.info(f"图像下载成功，尺寸: {input_image.size}")
+
+        # 移除背景（模型推理无法中断，推理前检查请求是否已取消）
+        check_cancelled("remove_background")
+        with span("bead_design.remove_background", SPAN_COMPUTE, width=input_image.width, height=input_image.height):
+            output_image = remove(
+                input_image,
+                session=session,
+                alpha_matting=enable_alpha_matting,
+                alpha_matting_foreground_threshold=240,
+                alpha_matting_background_threshold=10,
+                alpha_matting_erode_size=5,
+                post_process_mask=True
+            )
+        if artifact_ref is not None:
+            get_artifact_store().put_decoded(artifact_ref, removed_kind, output_image)
+
+        return output_image
+
+    except Exception as e:
+        logger.error(f"背景移除处理失败: {e}")
+        raise
+
+
+def cell_mean_colors(image_np: np.ndarray, alpha: np.ndarray, cell_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按 cell_size 划分网格，计算每个单元的平均颜色（向下取整）与占用掩膜（单元内存在不透明像素）
+    最后一行/列可能是不完整单元，按实际像素数求平均
+    """
+    height, width = alpha.shape[:2]
+    row_starts = np.arange(0, height, cell_size)
+    col_starts = np.arange(0, width, cell_size)
+    sums = np.add.reduceat(np.add.reduceat(image_np[..., :3].astype(np.int64), row_starts, axis=0), col_starts, axis=1)
+    pixels = np.outer(np.diff(np.append(row_starts, height)), np.diff(np.append(col_starts, width)))
+    colors = (sums // pixels[..., None]).astype(np.uint8)
+    opaque = np.add.reduceat(np.add.reduceat((alpha > 0).astype(np.int64), row_starts, axis=0), col_starts, axis=1)
+    return colors, opaque > 0
+
+
+def optimized_resize(image: Image.Image, target_size: Tuple[int, int]) -> Image.Image:
+    """
+    优化图像缩放函数，减少格式转换开销
+    """
+    # 直接使用PIL进行缩放，减少格式转换
+    return image.resize(target_size, Image.Resampling.LANCZOS)
+
+
+def resize_image_pil(image, scale_factor, interpolation=cv2.INTER_NEAREST):
+    """使用PIL进行图像缩放（内存中操作）"""
+    width, height = image.size
+    new_size = (int(width * scale_factor), int(height * scale_factor))
+    return image.resize(new_size, interpolation)
+
+
+def add_coordinates_and_statistics(canvas, width, height, grid_size, sorted_dict, color_rgbs, color_template):
+    """
+    添加坐标网格和颜色统计信息
+
+    参数:
+    canvas: 画布对象
+    draw: ImageDraw对象
+    width: 画布宽度
+    height: 画布高度
+    grid_size: 网格大小
+    sorted_dict: 排序后的颜色次数字典
+    color_rgbs: 颜色标识 -> RGB
+    color_template: 颜色模板名称
+    """
+
+    # 设置坐标区域高度（底部和右侧各留50像素用于坐标和统计信息）
+    # 计算颜色块尺寸
+    bar_height = 140
+    # 每个颜色块的固定宽度（等宽）
+    color_width = grid_size * 12
+    # 坐标字体大小
+    coordinates_font_size = 20
+    # 统计条字体大小
+    statistics_font_size = 80
+    max_rows = sorted_dict.__len__() * color_width // width + 1
+    coordinate_area_height = bar_height * (max_rows + 2) + coordinates_font_size
+    coordinate_area_width = 50
+
+    # 调整画布大小以容纳坐标和统计信息
+    new_width = width + coordinate_area_width
+    new_height = height + coordinate_area_height
+    new_canvas = Image.new('RGB', (new_width, new_height), (255, 255, 255))
+    new_canvas.paste(canvas, (0, bar_height * 2))
+
+    # 创建新的draw对象
+    new_draw = ImageDraw.Draw(new_canvas)
+
+    # 绘制色卡系列
+    new_draw.text(
+        (coordinates_font_size, coordinates_font_size),
+        f"COLOR TEMPLATE: {color_template}",
+        fill='black',
+        font=ImageFont.truetype("arial.ttf", 160)
+    )
+
+    # 1. 添加坐标网格
+    try:
+        coordinate_font = ImageFont.truetype("arial.ttf", coordinates_font_size)
+        statistics_font = ImageFont.truetype("arial.ttf", statistics_font_size)
+    except:
+        coordinate_font = ImageFont.load_default()
+        statistics_font = ImageFont.load_default()
+    # 添加X轴坐标
+    new_draw.line([(0, height + bar_height * 2), (width, height + bar_height * 2)], fill='black', width=1)
+    for x in range(0, width, grid_size):
+        if x % grid_size == 0 or x == width - grid_size:  # 每5个网格标记一次
+            new_draw.text((x + 5, height + bar_height * 2), str(x // grid_size + 1), fill='black',
+                          font=coordinate_font)
+
+    # 添加Y轴坐标
+    new_draw.line([(width, 0), (width, height + bar_height * 2)], fill='black', width=1)
+    for y in range(0, height, grid_size):
+        if y % grid_size == 0 or y == height - grid_size:  # 每5个网格标记一次
+            new_draw.text((width, y + 5 + bar_height * 2), str(y // grid_size + 1), fill='black',
+                          font=coordinate_font)
+
+    # 2. 添加颜色统计条
+    # 绘制颜色统计条
+    row = 0
+    current_x = 0
+
+    for color_name, count in sorted_dict.items():
+        color, _ = color_name.split('_')
+        color_rgb = color_rgbs[color_name]
+
+        # 如果当前行放不下，换到下一行
+        if current_x + color_width > width and row < max_rows - 1:
+            row += 1
+            current_x = 0
+
+        # 绘制颜色块
+        if row < max_rows:
+            y_start = height + coordinates_font_size + row * bar_height
+            new_draw.rectangle(
+                [current_x, y_start + bar_height * 2, current_x + color_width, y_start + bar_height + bar_height * 2],
+                fill=color_rgb, outline='white', width=10)
+
+            # 添加颜色标签（根据亮度选择文字颜色）
+            brightness = (color_rgb[0] * 299 + color_rgb[1] * 587 + color_rgb[2] * 114) // 1000
+            text_color = 'black' if brightness > 128 else 'white'
+
+            new_draw.text((current_x + color_width // 2, y_start + bar_height // 2 + bar_height * 2),
+                          f"{color} ({count})", fill=text_color, font=statistics_font, anchor='mm')
+
+            current_x += color_width
+
+    return new_canvas
+
+
+def process_large_image_optimized(image_url: str, session: Any,
+                                  grid_base_size: int = 10,
+                                  image_output_path: str = None,
+                                  output_store: Optional[OutputStore] = None,
+                                  draw_labels: bool = False,
+                                  replace_colors: bool = True,
+                                  color_template: str = "卡卡",
+                                  max_colors: int = 0,
+                                  alpha_matting: bool = True,
+                                  fast_encoding: bool = False) -> Dict[str, Any]:
+    """
+    优化版的大图像处理函数
+    """
+    # 1. 移除背景
+    transparent_result = remove_background_rembg_optimized(
+        image_url=image_url,
+        session=session,
+        enable_alpha_matting=alpha_matting
+    )
+    # transparent_result = Image.open("temp.png").convert("RGBA")
+
+    # 各阶段之间检查请求是否已取消（客户端断开），已取消时不再执行后续阶段
+    check_cancelled("resize")
+
+    # 2. 转换为RGB并调整大小（全部在内存中完成）
+    # 使用PIL直接缩放, scale_factor 缩放系数，1 默认不缩放，越大质量越高，但处理越慢
+    resized_img = resize_image_pil(transparent_result, 1, interpolation=cv2.INTER_NEAREST)
+
+    # 3. 放大图像（使用OpenCV但在内存中处理）
+    magnification = 5
+    width, height = resized_img.size
+    new_size = (width * magnification, height * magnification)
+
+    # 将PIL图像转换为numpy数组供OpenCV使用
+    resized_np = np.array(resized_img)
+    # 转换为BGR格式（OpenCV默认格式）
+    resized_np = cv2.cvtColor(resized_np, cv2.COLOR_RGB2BGR)
+    # 使用OpenCV放大（内存中操作）
+    resized_image = cv2.resize(resized_np, new_size, interpolation=cv2.INTER_NEAREST)
+    final_image_np = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
+    # 将OpenCV图像（BGR格式）转换回PIL图像（RGB格式）
+    final_image = Image.fromarray(final_image_np)
+
+    # 同时处理透明通道的放大
+    alpha_channel = np.array(transparent_result.split()[-1])  # 提取alpha通道
+    alpha_resized = cv2.resize(alpha_channel, new_size, interpolation=cv2.INTER_NEAREST)
+    width, height = final_image.size
+    grid_size = grid_base_size * magnification
+
+    check_cancelled("color_matching")
+    # 4. 向量化计算各单元平均颜色，匹配结果写入紧凑网格（每颗豆子一个调色板索引）
+    with span("bead_design.color_matching", SPAN_COMPUTE) as match_span:
+        cell_colors, occupied = cell_mean_colors(final_image_np, alpha_resized, grid_size)
+        grid, matched_colors = grid_from_cell_colors(cell_colors, occupied, color_template, grid_size, width, height)
+        match_span.set(cells=int(occupied.sum()), matched_colors=matched_colors, palette_colors=len(grid.palette))
+
+    if max_colors:
+        # 合并用量最少的颜色，材料清单与设计图使用合并后的颜色
+        with span("bead_design.reduce_palette", SPAN_COMPUTE, max_colors=max_colors) as reduce_span:
+            grid, merged = reduce_palette(grid, max_colors)
+            reduce_span.set(merged_colors=len(merged))
+        if merged:
+            logger.info(f"颜色数超过{max_colors}，已合并{len(merged)}种颜色：{merged}")
+
+    check_cancelled("render")
+    # 5. 由网格渲染设计图（颜色替换、网格线与颜色编号）
+    with span("bead_design.render", SPAN_COMPUTE, rows=grid.rows, cols=grid.cols):
+        canvas = render_design_image(grid, fill_colors=replace_colors, draw_labels=draw_labels)
+
+        # 6. 按数量降序统计各颜色豆子数
+        sorted_dict = grid.statistics()
+
+        # 7. 添加坐标和统计信息
+        canvas = add_coordinates_and_statistics(canvas, width, height, grid_size, sorted_dict, grid.color_rgbs(),
+                                                color_template)
+
+    check_cancelled("encode")
+    # 8. 保存结果
+    result = {
+        'color_statistics': sorted_dict,
+        'total_beads': sum(sorted_dict.values()),
+    }
+    if output_store is not None:
+        # 紧凑网格供分块查看接口按需渲染任意缩放级别
+        result['grid_id'] = save_grid(grid)
+        # 内容哈希命名，先写临时文件再原子重命名，并发请求互不覆盖
+        with span("bead_design.encode", SPAN_COMPUTE, fast=fast_encoding) as encode_span:
+            buffer = BytesIO()
+            if fast_encoding:
+                # 降级档位：最低压缩级别，编码耗时远低于 optimize
+                canvas.save(buffer, format="PNG", compress_level=1)
+            else:
+                canvas.save(buffer, format="PNG", optimize=True)
+            encode_span.set(bytes_out=buffer.tell())
+            result['image_name'] = output_store.put(buffer.getvalue())
+    elif image_output_path:
+        canvas.save(image_output_path, optimize=True, quality=95)
+
+    return result
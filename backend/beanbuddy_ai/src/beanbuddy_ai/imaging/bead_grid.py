@@ -0,0 +1,504 @@
+import json
+import math
+import struct
+import zlib
+from dataclasses import dataclass, field
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from ..utils.cancellation import check_cancelled
+from ..utils.output_store import OUTPUT_GRIDS, get_output_store
+from ..utils.paths import CONFIGS_DIR
+from ..utils.tracing import SPAN_COMPUTE, record_cache_lookup, span
+from ..utils.ttl_cache import TTLCache
+
+# 网格文件格式：魔术字 + 元数据长度 + 元数据JSON + zlib压缩的 int16 调色板索引
+_GRID_MAGIC = b"BBGRID1\n"
+# 空单元（透明背景，不放豆子）
+EMPTY = -1
+# 分块边长（像素）
+TILE_SIZE = 256
+# 超过原始分辨率后允许继续放大的层级数
+_EXTRA_ZOOM_LEVELS = 2
+# 预览图的最长边（像素）：对话中内嵌预览图而不是完整设计图，首屏只需下载一张小图
+PREVIEW_SIZE = 1024
+# 单元在屏幕上小于该像素数时不绘制网格线/编号，避免整块变黑或文字糊成一片
+_MIN_LINE_CELL_PX = 4
+_MIN_LABEL_CELL_PX = 20
+
+# 颜色匹配：抽样唯一颜色占比不超过该值时先去重再匹配，样本数与每批匹配的颜色数
+_DEDUP_MAX_UNIQUE_RATIO = 0.5
+_DEDUP_SAMPLE_SIZE = 4096
+_MATCH_CHUNK = 8192
+
+# 分块渲染结果缓存（LRU）：(网格ID, z, x, y) -> PNG字节
+_tile_cache = TTLCache(max_entries=4096, ttl=3600.0)
+# 预览图缓存：网格ID -> PNG字节
+_preview_cache = TTLCache(max_entries=256, ttl=3600.0)
+# 已加载的网格：网格ID -> BeadGrid
+_grid_cache = TTLCache(max_entries=64, ttl=3600.0)
+
+
+@dataclass(frozen=True)
+class PaletteColor:
+    """色卡中的一种豆子颜色"""
+    name: str
+    hex: str
+    rgb: Tuple[int, int, int]
+
+    @property
+    def key(self) -> str:
+        """材料清单中的颜色标识：<编号>_<十六进制颜色>"""
+        return f"{self.name}_{self.hex}"
+
+
+@dataclass
+class BeadGrid:
+    """
+    紧凑的拼豆网格：每颗豆子一个调色板索引（EMPTY 表示空位）
+    完整分辨率下每颗豆子为 cell_size 像素，画布尺寸为 width x height（最后一行/列可能是不完整单元）
+    设计图与任意缩放级别的分块都由网格实时渲染
+    """
+    indices: np.ndarray
+    palette: List[PaletteColor]
+    color_template: str
+    cell_size: int
+    width: int
+    height: int
+    # 各调色板索引的豆子数量（首次统计时计算，编辑时按变化量增量更新）
+    _counts: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+
+    @property
+    def rows(self) -> int:
+        return int(self.indices.shape[0])
+
+    @property
+    def cols(self) -> int:
+        return int(self.indices.shape[1])
+
+    @property
+    def max_zoom(self) -> int:
+        """原始分辨率对应的缩放级别（级别0时整张设计图缩放到一个分块内）"""
+        return max(0, math.ceil(math.log2(max(self.width, self.height) / TILE_SIZE)))
+
+    def counts(self) -> np.ndarray:
+        if self._counts is None:
+            self._counts = np.bincount(self.indices[self.indices != EMPTY].ravel(), minlength=len(self.palette))
+        return self._counts
+
+    def statistics(self) -> Dict[str, int]:
+        """各颜色豆子数量（按数量降序）"""
+        counts = self.counts()
+        order = sorted(range(len(self.palette)), key=lambda i: -counts[i])
+        return {self.palette[i].key: int(counts[i]) for i in order if counts[i] > 0}
+
+    def color_rgbs(self) -> Dict[str, Tuple[int, int, int]]:
+        return {color.key: color.rgb for color in self.palette}
+
+    def color_lut(self, empty_rgb: Tuple[int, int, int] = (255, 255, 255)) -> np.ndarray:
+        """颜色查找表：索引 i -> 调色板颜色，最后一行为空位颜色（EMPTY=-1 恰好取到最后一行）"""
+        lut = np.array([color.rgb for color in self.palette] + [empty_rgb], dtype=np.uint8)
+        return lut.reshape(-1, 3)
+
+    def to_bytes(self) -> bytes:
+        meta = json.dumps({
+            "palette": [[c.name, c.hex, list(c.rgb)] for c in self.palette],
+            "color_template": self.color_template,
+            "cell_size": self.cell_size,
+            "width": self.width,
+            "height": self.height,
+            "shape": [self.rows, self.cols],
+        }, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        body = zlib.compress(self.indices.astype("<i2").tobytes(), 6)
+        return _GRID_MAGIC + struct.pack("<I", len(meta)) + meta + body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BeadGrid":
+        if not data.startswith(_GRID_MAGIC):
+            raise ValueError("不是有效的拼豆网格文件")
+        offset = len(_GRID_MAGIC)
+        (meta_len,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        meta = json.loads(data[offset:offset + meta_len].decode("utf-8"))
+        indices = np.frombuffer(zlib.decompress(data[offset + meta_len:]), dtype="<i2")
+        return cls(indices=indices.reshape(meta["shape"]).astype(np.int16),
+                   palette=[PaletteColor(name, hex_str, tuple(rgb)) for name, hex_str, rgb in meta["palette"]],
+                   color_template=meta["color_template"],
+                   cell_size=meta["cell_size"],
+                   width=meta["width"],
+                   height=meta["height"])
+
+
+@lru_cache(maxsize=32)
+def _label_font(size: int):
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _label_color(rgb: Tuple[int, int, int]) -> str:
+    brightness = (rgb[0] * 299 + rgb[1] * 587 + rgb[2] * 114) // 1000
+    return 'black' if brightness > 128 else 'white'
+
+
+def render_region(grid: BeadGrid, x0: float, y0: float, out_width: int, out_height: int, scale: float,
+                  fill_colors: bool = True, draw_lines: bool = True, draw_labels: bool = True) -> Image.Image:
+    """
+    渲染设计图的任意区域：输出像素 (i, j) 对应完整分辨率下的点 (x0 + (j + 0.5) / scale, y0 + (i + 0.5) / scale)
+    只按输出尺寸计算，渲染开销与可视区域大小成正比，与整张设计图的尺寸无关
+    """
+    cell = grid.cell_size
+    lut = grid.color_lut() if fill_colors else np.full((len(grid.palette) + 1, 3), 255, dtype=np.uint8)
+
+    xs = x0 + (np.arange(out_width) + 0.5) / scale
+    ys = y0 + (np.arange(out_height) + 0.5) / scale
+    cols = np.clip((xs // cell).astype(np.int64), 0, grid.cols - 1)
+    rows = np.clip((ys // cell).astype(np.int64), 0, grid.rows - 1)
+    inside = (ys < grid.height)[:, None] & (xs < grid.width)[None, :]
+    indices = np.where(inside, grid.indices[rows[:, None], cols[None, :]], EMPTY)
+    pixels = lut[indices]
+
+    cell_px = cell * scale
+    if draw_lines and cell_px >= _MIN_LINE_CELL_PX:
+        # 输出像素覆盖的完整分辨率区间 [left, right) 内存在单元边界时绘制网格线
+        left_x = x0 + np.arange(out_width) / scale
+        left_y = y0 + np.arange(out_height) / scale
+        line_x = np.ceil(left_x / cell) * cell < left_x + 1 / scale
+        line_y = np.ceil(left_y / cell) * cell < left_y + 1 / scale
+        pixels[(line_y[:, None] | line_x[None, :]) & inside] = 0
+
+    image = Image.fromarray(pixels, "RGB")
+    if draw_labels and cell_px >= _MIN_LABEL_CELL_PX:
+        _draw_labels(image, grid, x0, y0, scale, rows, cols)
+    return image
+
+
+def _draw_labels(image: Image.Image, grid: BeadGrid, x0: float, y0: float, scale: float,
+                 rows: np.ndarray, cols: np.ndarray) -> None:
+    """在可视区域内的每颗豆子中心绘制颜色编号"""
+    draw = ImageDraw.Draw(image)
+    cell = grid.cell_size
+    font = _label_font(max(1, round(cell * scale * 0.3)))
+    for row in range(int(rows.min()), int(rows.max()) + 1):
+        # 整张设计图逐颗绘制编号耗时较长，每行检查一次请求是否已取消
+        check_cancelled("render_labels")
+        for col in range(int(cols.min()), int(cols.max()) + 1):
+            index = int(grid.indices[row, col])
+            if index == EMPTY:
+                continue
+            color = grid.palette[index]
+            # 单元中心（不完整单元取其实际范围的中心）
+            center_x = (col * cell + min((col + 1) * cell, grid.width)) / 2
+            center_y = (row * cell + min((row + 1) * cell, grid.height)) / 2
+            draw.text(((center_x - x0) * scale, (center_y - y0) * scale), color.name,
+                      fill=_label_color(color.rgb), font=font, anchor='mm')
+
+
+def render_design_image(grid: BeadGrid, fill_colors: bool = True, draw_labels: bool = True) -> Image.Image:
+    """按原始分辨率渲染整张设计图（不含坐标与材料统计）"""
+    return render_region(grid, 0, 0, grid.width, grid.height, 1.0,
+                         fill_colors=fill_colors, draw_labels=draw_labels)
+
+
+def tile_range(grid: BeadGrid, z: int) -> Tuple[int, int]:
+    """缩放级别 z 下的分块列数与行数"""
+    scale = 2.0 ** (z - grid.max_zoom)
+    return math.ceil(grid.width * scale / TILE_SIZE), math.ceil(grid.height * scale / TILE_SIZE)
+
+
+def render_tile(grid: BeadGrid, z: int, x: int, y: int) -> Optional[bytes]:
+    """渲染缩放级别 z 下第 (x, y) 个 256 像素分块，超出范围时返回 None"""
+    if z < 0 or z > grid.max_zoom + _EXTRA_ZOOM_LEVELS:
+        return None
+    tiles_x, tiles_y = tile_range(grid, z)
+    if not (0 <= x < tiles_x and 0 <= y < tiles_y):
+        return None
+    scale = 2.0 ** (z - grid.max_zoom)
+    image = render_region(grid, x * TILE_SIZE / scale, y * TILE_SIZE / scale, TILE_SIZE, TILE_SIZE, scale)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=False, compress_level=1)
+    return buffer.getvalue()
+
+
+def save_grid(grid: BeadGrid) -> str:
+    """持久化网格，返回网格ID（内容摘要）"""
+    name = get_output_store(OUTPUT_GRIDS).put(grid.to_bytes())
+    grid_id = name.split(".", 1)[0]
+    _grid_cache.set(grid_id, grid)
+    return grid_id
+
+
+def load_grid(grid_id: str) -> Optional[BeadGrid]:
+    """按网格ID加载网格（带缓存），不存在或已被清理时返回 None"""
+    grid = _grid_cache.get(grid_id)
+    if grid is None:
+        store = get_output_store(OUTPUT_GRIDS)
+        path = store.resolve(f"{grid_id}{store.suffix}")
+        if path is None:
+            return None
+        grid = BeadGrid.from_bytes(path.read_bytes())
+        _grid_cache.set(grid_id, grid)
+    return grid
+
+
+def get_tile(grid_id: str, z: int, x: int, y: int) -> Optional[bytes]:
+    """读取（或按需渲染并缓存）一个分块的PNG字节"""
+    key = (grid_id, z, x, y)
+    tile = _tile_cache.get(key)
+    record_cache_lookup("design_tile", "hit" if tile is not None else "miss")
+    if tile is None:
+        grid = load_grid(grid_id)
+        if grid is None:
+            return None
+        tile = render_tile(grid, z, x, y)
+        if tile is not None:
+            _tile_cache.set(key, tile)
+    return tile
+
+
+def render_preview(grid: BeadGrid, max_size: int = PREVIEW_SIZE) -> bytes:
+    """将整张设计图缩放到最长边不超过 max_size 渲染（不放大，缩小后豆子过小时不绘制编号与网格线）"""
+    scale = min(1.0, max_size / max(grid.width, grid.height))
+    image = render_region(grid, 0, 0, max(1, round(grid.width * scale)), max(1, round(grid.height * scale)), scale)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=False, compress_level=1)
+    return buffer.getvalue()
+
+
+def get_preview(grid_id: str) -> Optional[bytes]:
+    """读取（或按需渲染并缓存）网格的预览图PNG字节"""
+    preview = _preview_cache.get(grid_id)
+    record_cache_lookup("design_preview", "hit" if preview is not None else "miss")
+    if preview is None:
+        grid = load_grid(grid_id)
+        if grid is None:
+            return None
+        preview = render_preview(grid)
+        _preview_cache.set(grid_id, preview)
+    return preview
+
+
+def reduce_palette(grid: BeadGrid, max_colors: int) -> Tuple[BeadGrid, Dict[str, str]]:
+    """
+    将设计图的颜色数限制为 max_colors：每次把用量最少的颜色合并到与之最接近（RGB欧氏距离）的保留颜色，直到颜色数达标
+    合并在颜色直方图与调色板距离矩阵上进行，开销只与颜色数有关；最后按映射表一次性改写网格索引
+    返回 (新网格, 被合并颜色 -> 合并后颜色 的映射)，颜色数未超出时原样返回
+    """
+    counts = grid.counts().astype(np.int64)
+    active = counts > 0
+    if max_colors <= 0 or int(active.sum()) <= max_colors:
+        return grid, {}
+
+    rgbs = np.array([color.rgb for color in grid.palette], dtype=np.float64).reshape(-1, 3)
+    distances = np.sqrt(((rgbs[:, None, :] - rgbs[None, :, :]) ** 2).sum(axis=-1))
+    np.fill_diagonal(distances, np.inf)
+    mapping = np.arange(len(grid.palette))
+    while int(active.sum()) > max_colors:
+        smallest = int(np.argmin(np.where(active, counts, np.iinfo(np.int64).max)))
+        active[smallest] = False
+        survivor = int(np.argmin(np.where(active, distances[smallest], np.inf)))
+        counts[survivor] += counts[smallest]
+        counts[smallest] = 0
+        # 之前已合并到 smallest 的颜色一并改指向 survivor
+        mapping[mapping == smallest] = survivor
+
+    # 末尾追加 EMPTY，使索引 -1（空位）映射后仍为空位
+    lut = np.append(mapping, EMPTY).astype(np.int16)
+    reduced = BeadGrid(indices=lut[grid.indices], palette=grid.palette, color_template=grid.color_template,
+                       cell_size=grid.cell_size, width=grid.width, height=grid.height, _counts=counts)
+    merged = {grid.palette[i].key: grid.palette[int(target)].key
+              for i, target in enumerate(mapping) if i != target and grid.counts()[i] > 0}
+    return reduced, merged
+
+
+@lru_cache(maxsize=16)
+def _color_card(color_template: str) -> Dict[str, PaletteColor]:
+    """色卡：珠子编号 -> 颜色"""
+    data = json.loads((CONFIGS_DIR / "color_cards.json").read_text(encoding="utf-8"))
+    return {name: PaletteColor(name, info["hex"], tuple(info["rgb"])) for name, info in data.get(color_template, {}).items()}
+
+
+@lru_cache(maxsize=16)
+def _card_rgbs(color_template: str) -> Tuple[List[PaletteColor], np.ndarray]:
+    colors = list(_color_card(color_template).values())
+    return colors, np.array([color.rgb for color in colors], dtype=np.int32).reshape(-1, 3)
+
+
+def _nearest_card_colors(colors: np.ndarray, card_rgbs: np.ndarray) -> np.ndarray:
+    """每个颜色在色卡中最接近（RGB欧氏距离，距离相同时取色卡中靠前的）颜色的下标，分块计算控制内存"""
+    # |c - p|^2 = |c|^2 - 2c·p + |p|^2，|c|^2 不影响 argmin；整数运算在 float64 下精确，结果与逐个比较一致
+    card = card_rgbs.astype(np.float64)
+    card_norms = (card ** 2).sum(axis=1)
+    nearest = np.empty(len(colors), dtype=np.int64)
+    for start in range(0, len(colors), _MATCH_CHUNK):
+        chunk = colors[start:start + _MATCH_CHUNK].astype(np.float64)
+        nearest[start:start + len(chunk)] = (card_norms - 2.0 * chunk @ card.T).argmin(axis=1)
+    return nearest
+
+
+def match_card_colors(colors: np.ndarray, card_rgbs: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    颜色匹配：colors 为 (N, 3) 的 uint8 颜色，返回 (色卡下标, 实际匹配的颜色数)
+    扁平卡通图的颜色高度重复：把颜色打包为 24 位整数去重，只匹配唯一颜色后按逆索引写回，匹配开销只与唯一颜色数有关
+    抽样估计的唯一颜色占比超过 _DEDUP_MAX_UNIQUE_RATIO 时（照片等渐变图）去重收益不抵排序开销，直接逐个匹配
+    """
+    if len(colors) == 0:
+        return np.empty(0, dtype=np.int64), 0
+    keys = (colors[:, 0].astype(np.int32) << 16) | (colors[:, 1].astype(np.int32) << 8) | colors[:, 2]
+    sample = keys
+    if len(keys) > _DEDUP_SAMPLE_SIZE:
+        sample = keys[np.linspace(0, len(keys) - 1, _DEDUP_SAMPLE_SIZE).astype(np.int64)]
+    if len(np.unique(sample)) > len(sample) * _DEDUP_MAX_UNIQUE_RATIO:
+        return _nearest_card_colors(colors, card_rgbs), len(colors)
+
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    unique_colors = np.stack([unique_keys >> 16, (unique_keys >> 8) & 0xFF, unique_keys & 0xFF], axis=1)
+    return _nearest_card_colors(unique_colors, card_rgbs)[inverse.ravel()], len(unique_keys)
+
+
+def grid_from_cell_colors(colors: np.ndarray, occupied: np.ndarray, color_template: str, cell_size: int,
+                          width: int, height: int) -> Tuple[BeadGrid, int]:
+    """
+    由各单元的平均颜色（rows x cols x 3）与占用掩膜（非空位）构建网格：占用单元匹配色卡中最接近的颜色
+    调色板只包含用到的颜色（按行优先首次出现的顺序），返回 (网格, 实际匹配的颜色数)
+    """
+    card, card_rgbs = _card_rgbs(color_template)
+    if not card:
+        raise ValueError(f"色卡 {color_template} 不存在或没有颜色")
+    matched, match_count = match_card_colors(colors[occupied], card_rgbs)
+    used, first_seen = np.unique(matched, return_index=True)
+    used = used[np.argsort(first_seen)]
+    lut = np.full(len(card), EMPTY, dtype=np.int16)
+    lut[used] = np.arange(len(used), dtype=np.int16)
+    indices = np.full(occupied.shape, EMPTY, dtype=np.int16)
+    indices[occupied] = lut[matched]
+    grid = BeadGrid(indices=indices, palette=[card[i] for i in used], color_template=color_template,
+                    cell_size=cell_size, width=width, height=height)
+    return grid, match_count
+
+
+def _palette_index(grid: BeadGrid, palette: List[PaletteColor], name: Optional[str], create: bool) -> int:
+    """珠子编号 -> 调色板索引，为空时表示空位；色卡中有但设计图中尚未使用的颜色追加到调色板末尾"""
+    if name is None:
+        return EMPTY
+    for i, color in enumerate(palette):
+        if color.name == name:
+            return i
+    color = _color_card(grid.color_template).get(name) if create else None
+    if color is None:
+        raise ValueError(f"颜色 {name} 不在{'色卡 ' + grid.color_template if create else '设计图'}中")
+    palette.append(color)
+    return len(palette) - 1
+
+
+def _region_slices(grid: BeadGrid, region: Optional[Sequence[int]]) -> Tuple[slice, slice]:
+    if region is None:
+        return slice(0, grid.rows), slice(0, grid.cols)
+    row0, col0, row1, col1 = (int(v) for v in region)
+    row0, row1 = max(0, row0), min(grid.rows, row1)
+    col0, col1 = max(0, col0), min(grid.cols, col1)
+    if row0 >= row1 or col0 >= col1:
+        raise ValueError(f"编辑区域 {list(region)} 与设计图（{grid.rows}行 x {grid.cols}列）没有交集")
+    return slice(row0, row1), slice(col0, col1)
+
+
+def _get(operation: Any, name: str) -> Any:
+    return operation.get(name) if isinstance(operation, dict) else getattr(operation, name, None)
+
+
+def apply_edits(grid: BeadGrid, operations: Sequence[Any]) -> Tuple[BeadGrid, np.ndarray]:
+    """
+    按顺序应用编辑操作（recolor / replace / paint，见 models.BeadEditOperation），返回新网格与变化单元的掩膜
+    原网格保持不变（网格ID即内容摘要，旧版本的分块与地址依然有效）；颜色计数按变化单元增量更新，不重新全量统计
+    """
+    indices = grid.indices.copy()
+    palette = list(grid.palette)
+    for operation in operations:
+        op = _get(operation, "op")
+        target = _palette_index(grid, palette, _get(operation, "to_color"), create=True)
+        if op == "recolor":
+            if not _get(operation, "from_color"):
+                raise ValueError("recolor 操作需要指定 from_color")
+            source = _palette_index(grid, palette, _get(operation, "from_color"), create=False)
+            rows, cols = _region_slices(grid, _get(operation, "region"))
+            view = indices[rows, cols]
+            view[view == source] = target
+        elif op == "replace":
+            if _get(operation, "region") is None:
+                raise ValueError("replace 操作需要指定 region")
+            rows, cols = _region_slices(grid, _get(operation, "region"))
+            view = indices[rows, cols]
+            view[view != EMPTY] = target
+        elif op == "paint":
+            cells = np.asarray(_get(operation, "cells") or [], dtype=np.int64).reshape(-1, 2)
+            outside = (cells[:, 0] < 0) | (cells[:, 0] >= grid.rows) | (cells[:, 1] < 0) | (cells[:, 1] >= grid.cols)
+            if outside.any():
+                raise ValueError(f"位置 {cells[outside][0].tolist()} 超出设计图范围（{grid.rows}行 x {grid.cols}列）")
+            indices[cells[:, 0], cells[:, 1]] = target
+        else:
+            raise ValueError(f"不支持的编辑操作：{op}")
+
+    changed = indices != grid.indices
+    counts = np.zeros(len(palette), dtype=np.int64)
+    counts[:len(grid.palette)] = grid.counts()
+    before, after = grid.indices[changed], indices[changed]
+    counts -= np.bincount(before[before != EMPTY], minlength=len(palette))
+    counts += np.bincount(after[after != EMPTY], minlength=len(palette))
+    edited = BeadGrid(indices=indices, palette=palette, color_template=grid.color_template,
+                      cell_size=grid.cell_size, width=grid.width, height=grid.height, _counts=counts)
+    return edited, changed
+
+
+def _tile_cells(grid: BeadGrid, z: int, x: int, y: int) -> Tuple[int, int, int, int]:
+    """分块覆盖的单元范围 (起始行, 起始列, 结束行, 结束列)，不含结束行列"""
+    span_px = TILE_SIZE / 2.0 ** (z - grid.max_zoom)
+    cell = grid.cell_size
+    row0, col0 = int(y * span_px // cell), int(x * span_px // cell)
+    row1 = min(grid.rows, math.ceil((y + 1) * span_px / cell))
+    col1 = min(grid.cols, math.ceil((x + 1) * span_px / cell))
+    return row0, col0, row1, col1
+
+
+def _carry_over_tiles(grid_id: str, edited_id: str, edited: BeadGrid, changed: np.ndarray) -> Tuple[int, int]:
+    """
+    将旧网格已缓存且不含变化单元的分块直接复用到新网格，包含变化单元的分块在下次请求时重新渲染
+    （网格线与编号只画在各自单元内，未变化区域的像素与旧分块完全相同），返回 (复用数, 需重绘数)
+    """
+    # 二维前缀和：任意矩形内的变化单元数 O(1) 查询
+    prefix = np.zeros((edited.rows + 1, edited.cols + 1), dtype=np.int64)
+    prefix[1:, 1:] = changed.cumsum(0).cumsum(1)
+    reused = dirty = 0
+    for key in _tile_cache.keys():
+        if key[0] != grid_id:
+            continue
+        row0, col0, row1, col1 = _tile_cells(edited, *key[1:])
+        if prefix[row1, col1] - prefix[row0, col1] - prefix[row1, col0] + prefix[row0, col0]:
+            dirty += 1
+            continue
+        tile = _tile_cache.get(key)
+        if tile is not None:
+            _tile_cache.set((edited_id, *key[1:]), tile)
+            reused += 1
+    return reused, dirty
+
+
+def edit_grid(grid_id: str, grid: BeadGrid, operations: Sequence[Any]) -> Dict[str, Any]:
+    """
+    编辑已保存的设计网格：应用编辑操作、保存为新网格（新的网格ID），并复用未受影响的分块
+    操作不合法时抛出 ValueError
+    """
+    with span("bead_grid.edit", SPAN_COMPUTE, operations=len(operations)) as edit_span:
+        edited, changed = apply_edits(grid, operations)
+        changed_beads = int(changed.sum())
+        if not changed_beads:
+            return {"grid_id": grid_id, "grid": grid, "changed_beads": 0, "reused_tiles": 0, "dirty_tiles": 0}
+        edited_id = save_grid(edited)
+        reused, dirty = _carry_over_tiles(grid_id, edited_id, edited, changed)
+        edit_span.set(changed_beads=changed_beads, reused_tiles=reused, dirty_tiles=dirty)
+    return {"grid_id": edited_id, "grid": edited, "changed_beads": changed_beads,
+            "reused_tiles": reused, "dirty_tiles": dirty}
@@ -0,0 +1,170 @@
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from ..utils.cancellation import CancellationToken, OperationCancelled, cancellation_scope
+from ..utils.job_queue import JOB_KIND_DESIGN, STATUS_RUNNING, Job, JobQueue, get_job_queue
+from ..utils.output_store import configure_output_store
+
+logger = logging.getLogger(__name__)
+
+# 默认可见性超时（秒）：工作进程每隔三分之一超时续期一次，进程崩溃后最多等待该时长任务即可被重新领取
+DEFAULT_VISIBILITY_TIMEOUT = 120.0
+# 失败重试的基础延迟（秒），按尝试次数指数增长
+DEFAULT_RETRY_DELAY = 5.0
+# 已结束任务的默认保留时长（秒），超过后由工作进程定期清理
+DEFAULT_JOB_RETENTION = 7 * 86400.0
+# 清理已结束任务的间隔（秒）
+_PURGE_INTERVAL = 3600.0
+# 执行期间检查任务是否已被取消的间隔（秒）
+_CANCEL_POLL_INTERVAL = 2.0
+
+
+def run_design_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    执行一个设计图生成任务，返回结果摘要（设计图与网格通过共享的输出存储获取）
+    payload: image_url、color_template、max_colors、rembg_model_name、output_max_age、output_max_bytes，
+    以及质量档位 quality（alpha_matting、draw_labels、fast_encoding，缺省为完整质量）
+    """
+    from ..utils.rembg_session import get_session
+    from .bead_design import generate_bead_design
+
+    output_store = configure_output_store(payload["output_max_age"], payload["output_max_bytes"])
+    session = get_session(payload["rembg_model_name"])
+    quality = payload.get("quality") or {}
+    result = generate_bead_design(payload["image_url"], session, payload["color_template"], output_store,
+                                  max_colors=payload.get("max_colors", 0),
+                                  alpha_matting=quality.get("alpha_matting", True),
+                                  draw_labels=quality.get("draw_labels", True),
+                                  fast_encoding=quality.get("fast_encoding", False))
+    return {key: result[key] for key in ("image_name", "grid_id", "color_statistics", "total_beads")}
+
+
+class DesignWorker:
+    """
+    无状态的设计图工作进程：循环领取队列中的设计任务并执行，执行期间定期续期租约
+    需与服务进程共享任务队列和数据目录（BEANBUDDY_DATA_DIR：输出存储与制品溢出区）；默认的 SQLite 队列仅限同一主机
+    同时定期清理超过保留时长的已结束任务，避免队列无限增长
+    """
+
+    def __init__(self,
+                 queue: JobQueue,
+                 worker_id: str = "",
+                 visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT,
+                 poll_interval: float = 1.0,
+                 retry_delay: float = DEFAULT_RETRY_DELAY,
+                 job_retention: float = DEFAULT_JOB_RETENTION):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.job_retention = job_retention
+        self._purge_at = 0.0
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """处理完当前任务后退出"""
+        self._stop.set()
+
+    def _keep_alive(self, job: Job, done: threading.Event, token: CancellationToken) -> None:
+        """定期续期租约；任务被取消或租约已被其他工作进程接手时置位取消标记，执行在下一个检查点停止"""
+        renew_at = time.monotonic() + self.visibility_timeout / 3
+        while not done.wait(min(_CANCEL_POLL_INTERVAL, self.visibility_timeout / 3)):
+            current = self.queue.get(job.id)
+            if current is None or current.status != STATUS_RUNNING or current.worker != self.worker_id:
+                logger.warning(f"任务 {job.id} 已被取消或被其他工作进程接手，停止执行")
+                token.cancel()
+                return
+            if time.monotonic() >= renew_at:
+                if not self.queue.heartbeat(job.id, self.worker_id, self.visibility_timeout):
+                    logger.warning(f"任务 {job.id} 的租约已被其他工作进程接手，本次执行结果将被丢弃")
+                    token.cancel()
+                    return
+                renew_at = time.monotonic() + self.visibility_timeout / 3
+
+    def run_once(self) -> Optional[Job]:
+        """领取并执行一个任务，队列为空时返回 None"""
+        job = self.queue.claim([JOB_KIND_DESIGN], self.worker_id, self.visibility_timeout)
+        if job is None:
+            return None
+        logger.info(f"开始执行任务 {job.id}（第{job.attempts}/{job.max_attempts}次）")
+        done = threading.Event()
+        token = CancellationToken()
+        keep_alive = threading.Thread(target=self._keep_alive, args=(job, done, token), daemon=True)
+        keep_alive.start()
+        try:
+            with cancellation_scope(token):
+                result = run_design_job(job.payload)
+        except OperationCancelled as e:
+            logger.info(f"任务 {job.id} {e}，已停止执行")
+            return job
+        except Exception as e:
+            delay = self.retry_delay * 2 ** (job.attempts - 1)
+            logger.error(f"任务 {job.id} 执行失败：{e}", exc_info=True)
+            self.queue.fail(job.id, self.worker_id, f"{type(e).__name__}: {e}", retry_delay=delay)
+            return job
+        finally:
+            done.set()
+            keep_alive.join()
+        if self.queue.complete(job.id, self.worker_id, result):
+            logger.info(f"任务 {job.id} 完成：{result['image_name']}")
+        return job
+
+    def purge_finished(self) -> None:
+        """按间隔清理超过保留时长的已结束任务（job_retention 为 0 时不清理）"""
+        if not self.job_retention or time.monotonic() < self._purge_at:
+            return
+        self._purge_at = time.monotonic() + _PURGE_INTERVAL
+        try:
+            purged = self.queue.purge(self.job_retention)
+        except Exception as e:
+            logger.warning(f"清理已结束任务失败：{e}")
+            return
+        if purged:
+            logger.info(f"已清理{purged}个超过保留时长的已结束任务")
+
+    def run(self) -> None:
+        logger.info(f"设计工作进程 {self.worker_id} 已启动")
+        while not self._stop.is_set():
+            self.purge_finished()
+            if self.run_once() is None:
+                self._stop.wait(self.poll_interval)
+        logger.info(f"设计工作进程 {self.worker_id} 已退出")
+
+
+def main() -> None:
+    """
+    启动设计图工作进程：python -m beanbuddy_ai.imaging.design_worker --queue sqlite:///srv/beanbuddy/queue.db
+    按需启动多个进程，设计吞吐量可独立于对话服务扩展（默认的 SQLite 队列仅限同一主机，跨节点需注册其他队列后端）
+    """
+    parser = argparse.ArgumentParser(description="BeanBuddy-AI 设计图工作进程")
+    parser.add_argument("--queue", default="", help="任务队列地址，默认使用环境变量 BEANBUDDY_JOB_QUEUE 或数据目录下的 jobs/queue.db")
+    parser.add_argument("--worker-id", default="", help="工作进程标识，默认 <主机名>-<进程号>-<随机后缀>")
+    parser.add_argument("--visibility-timeout", type=float, default=DEFAULT_VISIBILITY_TIMEOUT,
+                        help="任务租约时长（秒），进程失联超过该时长后任务由其他工作进程重试")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="队列为空时的轮询间隔（秒）")
+    parser.add_argument("--retry-delay", type=float, default=DEFAULT_RETRY_DELAY, help="失败重试的基础延迟（秒）")
+    parser.add_argument("--job-retention", type=float, default=DEFAULT_JOB_RETENTION,
+                        help="已结束任务的保留时长（秒），超过后定期清理；0 表示不清理")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    worker = DesignWorker(get_job_queue(args.queue), args.worker_id, args.visibility_timeout,
+                          args.poll_interval, args.retry_delay, args.job_retention)
+    # 收到终止信号后处理完当前任务再退出
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
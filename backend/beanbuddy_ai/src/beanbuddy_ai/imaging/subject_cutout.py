@@ -0,0 +1,74 @@
+from io import BytesIO
+from typing import Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+from rembg import remove
+from rembg.bg import post_process
+from rembg.sessions import BaseSession
+
+from ..utils.artifact_store import get_artifact_store, is_artifact_ref
+from ..utils.cancellation import check_cancelled, run_cancellable
+from ..utils.image_cache import fetch_image_artifact
+from ..utils.rembg_session import CUTOUT_KIND
+
+
+async def extract_subject_locally(image_url: str, session: BaseSession, stylize: bool,
+                                   colors: int) -> Tuple[str, float]:
+    """本地抠图：返回 (透明背景主体的 artifact:// 引用, 掩膜置信度)"""
+    if not is_artifact_ref(image_url) and not image_url.startswith(("http://", "https://")):
+        raise ValueError(f"无效图片URL：{image_url}（必须是HTTP/HTTPS链接或 artifact:// 引用）")
+    image_ref = image_url if is_artifact_ref(image_url) else await fetch_image_artifact(image_url)
+    if image_ref is None:
+        raise ValueError(f"图片下载失败：{image_url}")
+    # 模型推理与图像处理为CPU密集操作，放到线程中执行（请求取消后在阶段之间停止）
+    return await run_cancellable(cut_out_subject, image_ref, session, stylize, colors)
+
+
+def cut_out_subject(image_ref: str, session: BaseSession, stylize: bool, colors: int) -> Tuple[str, float]:
+    store = get_artifact_store()
+    image = store.get_decoded(image_ref, "rgba", lambda data: Image.open(BytesIO(data)).convert("RGBA"))
+    check_cancelled("cutout_mask")
+    # 只计算原始软掩膜评估置信度：rembg 的后处理会把掩膜二值化为 0/255，半透明的不确定像素随之消失
+    soft_mask = np.asarray(remove(image, session=session, only_mask=True, post_process_mask=False))
+    confidence = mask_confidence(soft_mask)
+
+    check_cancelled("cutout_compose")
+    # 合成透明背景前再做后处理（去除噪点、平滑边缘）
+    mask = Image.fromarray(post_process(soft_mask))
+    subject = image.copy()
+    subject.putalpha(mask)
+    if stylize:
+        subject = flatten_colors(subject, colors)
+
+    buffer = BytesIO()
+    subject.save(buffer, format="PNG")
+    subject_ref = store.put_bytes(buffer.getvalue(), "image/png")
+    store.put_decoded(subject_ref, "rgba", subject)
+    # 标记为已抠图主体，设计工具无需再次移除背景
+    store.put_decoded(subject_ref, CUTOUT_KIND, subject)
+    return subject_ref, confidence
+
+
+def mask_confidence(mask: np.ndarray) -> float:
+    """
+    掩膜置信度：前景中"边缘不确定"（半透明）像素以外的占比
+    前景过小（未识别到主体）或几乎铺满画面（背景未分离）时置信度为0
+    """
+    alpha = mask.astype(np.float32) / 255.0
+    foreground = int((alpha > 0.5).sum())
+    if foreground < alpha.size * 0.02 or foreground > alpha.size * 0.95:
+        return 0.0
+    uncertain = int(((alpha > 0.1) & (alpha < 0.9)).sum())
+    return max(0.0, 1.0 - uncertain / foreground)
+
+
+def flatten_colors(subject: Image.Image, colors: int) -> Image.Image:
+    """简单的平涂风格化：透明区域先填白避免占用调色板，中值滤波去纹理后量化颜色"""
+    alpha = subject.getchannel("A")
+    rgb = Image.new("RGB", subject.size, (255, 255, 255))
+    rgb.paste(subject, mask=alpha)
+    rgb = rgb.filter(ImageFilter.MedianFilter(5))
+    flat = rgb.quantize(colors=colors, method=Image.Quantize.MEDIANCUT).convert("RGBA")
+    flat.putalpha(alpha)
+    return flat
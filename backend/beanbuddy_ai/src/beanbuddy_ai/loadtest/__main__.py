@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+from pathlib import Path
+from typing import List, Optional
+
+from .driver import DEFAULT_PROMPTS, default_work_dir, prepare_config, run_load
+from .report import format_report
+from .stubs import ErrorProfile, LatencyProfile, StubConfig, run_stubs_process, start_stubs
+
+logger = logging.getLogger(__name__)
+
+# 默认压测的工作流配置
+_DEFAULT_CONFIG = Path(__file__).resolve().parent.parent / "configs" / "config.yml"
+# 等待桩服务子进程启动的超时时间（秒），首次生成示例图片需要导入PIL
+_STUB_START_TIMEOUT = 60
+
+
+def _stub_config(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        llm_latency=LatencyProfile(args.llm_median, args.llm_p99),
+        llm_errors=ErrorProfile(args.llm_error_rate, args.llm_429_rate, args.retry_after),
+        llm_chunk_interval=args.llm_chunk_interval,
+        image_latency=LatencyProfile(args.image_median, args.image_p99),
+        image_errors=ErrorProfile(args.image_error_rate, args.image_429_rate, args.retry_after),
+        images_dir=args.images_dir,
+        seed=args.seed,
+    )
+
+
+def _add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("桩服务（延迟为对数正态分布，由中位数与p99确定，单位秒）")
+    group.add_argument("--host", default="127.0.0.1")
+    group.add_argument("--llm-port", type=int, default=0, help="OpenAI兼容桩端口，0为自动分配")
+    group.add_argument("--dashscope-port", type=int, default=0, help="DashScope桩端口，0为自动分配")
+    group.add_argument("--llm-median", type=float, default=0.6)
+    group.add_argument("--llm-p99", type=float, default=2.5)
+    group.add_argument("--llm-chunk-interval", type=float, default=0.02, help="流式输出数据块间隔")
+    group.add_argument("--llm-error-rate", type=float, default=0.0, help="LLM返回5xx的概率")
+    group.add_argument("--llm-429-rate", type=float, default=0.0, help="LLM返回429的概率")
+    group.add_argument("--image-median", type=float, default=6.0)
+    group.add_argument("--image-p99", type=float, default=15.0)
+    group.add_argument("--image-error-rate", type=float, default=0.0, help="图片接口返回5xx的概率")
+    group.add_argument("--image-429-rate", type=float, default=0.0, help="图片接口返回429的概率")
+    group.add_argument("--retry-after", type=float, default=1.0, help="429响应的 Retry-After 秒数")
+    group.add_argument("--images-dir", default=None, help="作为生成结果返回的本地图片目录，为空时生成示例图片")
+    group.add_argument("--seed", type=int, default=None)
+
+
+async def _serve_stubs(args: argparse.Namespace) -> None:
+    servers = await start_stubs(_stub_config(args), args.host, args.llm_port, args.dashscope_port)
+    print(f"OpenAI兼容桩: {servers.llm_url}/v1")
+    print(f"DashScope桩: {servers.dashscope_url}/api/v1（图片: {', '.join(servers.images)}）")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await servers.close()
+
+
+def _load_prompts(path: Optional[str], image_url: str) -> List[str]:
+    prompts = DEFAULT_PROMPTS
+    if path:
+        prompts = [line.strip() for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()]
+    return [prompt.replace("{image_url}", image_url) for prompt in prompts]
+
+
+async def _fetch_stub_stats(urls: List[str]) -> dict:
+    from aiohttp import ClientSession
+
+    stats = {}
+    async with ClientSession() as session:
+        for url in urls:
+            try:
+                async with session.get(f"{url}/stats") as response:
+                    stats[url] = await response.json()
+            except Exception as e:
+                stats[url] = {"error": str(e)}
+    return stats
+
+
+def _run(args: argparse.Namespace) -> None:
+    # 桩服务运行在独立进程中，避免与被测工作流争用事件循环与CPU
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    process = context.Process(target=run_stubs_process, daemon=True,
+                              args=(_stub_config(args), args.host, (args.llm_port, args.dashscope_port), ready))
+    process.start()
+    try:
+        llm_url, dashscope_url, images = ready.get(timeout=_STUB_START_TIMEOUT)
+        work_dir = Path(args.work_dir) if args.work_dir else default_work_dir()
+        config_file = prepare_config(Path(args.config_file), llm_url, dashscope_url, work_dir)
+        prompts = _load_prompts(args.prompts, f"{dashscope_url}/files/{images[0]}")
+        logger.info(f"桩服务已启动：LLM {llm_url}，DashScope {dashscope_url}；压测配置 {config_file}")
+
+        report = asyncio.run(run_load(config_file, prompts, args.requests, args.concurrency,
+                                      rate=args.rate, warmup=args.warmup, seed=args.seed))
+        report["stubs"] = asyncio.run(_fetch_stub_stats([llm_url, dashscope_url]))
+    finally:
+        process.terminate()
+        process.join()
+
+    print(format_report(report))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n完整结果已写入 {args.output}")
+
+
+def main() -> None:
+    """
+    离线压测：启动本地 OpenAI 兼容桩与 DashScope 桩，按指定并发驱动完整工作流，输出各工具与端到端的延迟分位数
+    python -m beanbuddy_ai.loadtest run --requests 50 --concurrency 8
+    python -m beanbuddy_ai.loadtest stubs --llm-port 18080 --dashscope-port 18081
+    """
+    parser = argparse.ArgumentParser(prog="python -m beanbuddy_ai.loadtest", description="BeanBuddy 离线压测工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="启动桩服务并压测工作流")
+    run_parser.add_argument("--config_file", default=str(_DEFAULT_CONFIG), help="工作流配置文件（默认 config.yml）")
+    run_parser.add_argument("--requests", type=int, default=30, help="计入统计的请求数")
+    run_parser.add_argument("--concurrency", type=int, default=4, help="同时执行的请求数上限")
+    run_parser.add_argument("--rate", type=float, default=None,
+                            help="开环压测的到达速率（个/秒），为空时为闭环压测")
+    run_parser.add_argument("--warmup", type=int, default=1, help="不计入统计的预热请求数")
+    run_parser.add_argument("--prompts", default=None,
+                            help="请求样本文件（每行一条，{image_url} 替换为桩服务图片地址），默认文本/实体/图片各一条")
+    run_parser.add_argument("--work-dir", default=None, help="改写后的配置文件存放目录，默认临时目录")
+    run_parser.add_argument("--output", default=None, help="将完整结果（JSON）写入该文件")
+    _add_stub_arguments(run_parser)
+
+    stubs_parser = subparsers.add_parser("stubs", help="只启动桩服务（手动指向 nat serve 等场景）")
+    _add_stub_arguments(stubs_parser)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.command == "stubs":
+        asyncio.run(_serve_stubs(args))
+    else:
+        _run(args)
+
+
+if __name__ == "__main__":
+    main()
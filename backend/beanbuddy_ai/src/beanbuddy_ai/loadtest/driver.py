@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import random
+import resource
+import tempfile
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from .report import summarize
+
+logger = logging.getLogger(__name__)
+
+# 指向桩服务时使用的占位API密钥
+STUB_API_KEY = "stub-api-key"
+# 调用 DashScope 接口的工具类型（配置项 dashscope_base_url）
+_DASHSCOPE_TOOL_TYPES = ("extract_subject", "generate_image_from_text")
+# 默认请求样本：文本描述、实体名称、图片（{image_url} 替换为桩服务提供的图片地址）
+DEFAULT_PROMPTS = (
+    "帮我设计一只戴着红色围巾、抱着胡萝卜的小兔子",
+    "皮卡丘",
+    "{image_url}",
+)
+# 事件循环延迟采样间隔（秒）
+_LOOP_LAG_INTERVAL = 0.1
+
+
+def prepare_config(config_file: Path, llm_url: str, dashscope_url: str, output_dir: Path) -> Path:
+    """
+    复制工作流配置并改写外部依赖地址：所有LLM指向OpenAI兼容桩，调用DashScope的工具指向DashScope桩
+    返回改写后的配置文件路径
+    """
+    config = yaml.safe_load(Path(config_file).read_text(encoding="utf-8"))
+    for llm in (config.get("llms") or {}).values():
+        llm["base_url"] = f"{llm_url}/v1"
+        llm["api_key"] = STUB_API_KEY
+    for function in (config.get("functions") or {}).values():
+        if function.get("_type") in _DASHSCOPE_TOOL_TYPES:
+            function["dashscope_base_url"] = f"{dashscope_url}/api/v1"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / f"loadtest_{Path(config_file).name}"
+    path.write_text(yaml.safe_dump(config, allow_unicode=True, sort_keys=False), encoding="utf-8")
+    return path
+
+
+@dataclass
+class RequestRecord:
+    """一次工作流调用的测量结果"""
+    prompt: str
+    queued: float = 0.0
+    latency: float = 0.0
+    error: Optional[str] = None
+    # 函数名 -> 各次调用耗时；LLM模型名 -> 各次调用耗时
+    functions: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    llm: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+
+
+def _record_step(record: RequestRecord, step: Any) -> None:
+    """订阅中间步骤：按 FUNCTION_END / LLM_END 事件的起止时间记录各函数与LLM调用耗时"""
+    from nat.data_models.intermediate_step import IntermediateStepType
+
+    if step.span_event_timestamp is None:
+        return
+    elapsed = step.event_timestamp - step.span_event_timestamp
+    if step.event_type == IntermediateStepType.FUNCTION_END:
+        record.functions[step.name or "unknown"].append(elapsed)
+    elif step.event_type == IntermediateStepType.LLM_END:
+        record.llm[step.name or "unknown"].append(elapsed)
+
+
+async def _run_one(session_manager: Any, record: RequestRecord) -> None:
+    started = time.perf_counter()
+    try:
+        async with session_manager.run(record.prompt) as runner:
+            subscription = runner.context.intermediate_step_manager.subscribe(
+                lambda step: _record_step(record, step))
+            try:
+                await runner.result(to_type=str)
+            finally:
+                subscription.unsubscribe()
+    except Exception as e:
+        record.error = f"{type(e).__name__}: {str(e)[:120]}"
+        logger.debug(f"压测请求失败: {record.prompt[:40]}", exc_info=True)
+    record.latency = time.perf_counter() - started
+
+
+async def _sample_loop_lag(samples: List[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(_LOOP_LAG_INTERVAL)
+        samples.append(max(0.0, loop.time() - started - _LOOP_LAG_INTERVAL))
+
+
+def _usage_snapshot() -> Dict[str, float]:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {"user": own.ru_utime, "system": own.ru_stime,
+            "children": children.ru_utime + children.ru_stime,
+            # Linux 下 ru_maxrss 单位为KB
+            "max_rss": own.ru_maxrss / 1024, "children_max_rss": children.ru_maxrss / 1024}
+
+
+async def run_load(config_file: Path,
+                   prompts: List[str],
+                   requests: int,
+                   concurrency: int,
+                   rate: Optional[float] = None,
+                   warmup: int = 1,
+                   seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    加载工作流并施加负载，返回压测报告（字典）
+    - rate 为空时为闭环压测：concurrency 个并发请求，完成一个立即发起下一个
+    - rate 不为空时为开环压测：按泊松过程以 rate 个/秒到达，最多 concurrency 个同时执行，记录到达后的排队时间
+    warmup 个预热请求（加载模型、建立连接）不计入统计
+    """
+    from nat.runtime.loader import load_workflow
+
+    from ..utils.dashscope_client import dashscope_client_stats
+    from ..utils.hedging import hedge_stats
+    from ..utils.rate_limiter import rate_limiter_stats
+
+    rng = random.Random(seed)
+    records = [RequestRecord(prompt=prompts[i % len(prompts)]) for i in range(requests)]
+
+    async with load_workflow(config_file) as session_manager:
+        for i in range(warmup):
+            warmup_record = RequestRecord(prompt=prompts[i % len(prompts)])
+            await _run_one(session_manager, warmup_record)
+            logger.info(f"预热请求 {i + 1}/{warmup} 完成，耗时{warmup_record.latency:.1f}秒"
+                        + (f"，失败：{warmup_record.error}" if warmup_record.error else ""))
+
+        loop_lag: List[float] = []
+        lag_task = asyncio.create_task(_sample_loop_lag(loop_lag))
+        usage_before = _usage_snapshot()
+        started = time.perf_counter()
+
+        if rate is None:
+            pending = iter(records)
+
+            async def worker() -> None:
+                for record in pending:
+                    await _run_one(session_manager, record)
+
+            await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+        else:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def arrive(record: RequestRecord) -> None:
+                arrived = time.perf_counter()
+                async with semaphore:
+                    record.queued = time.perf_counter() - arrived
+                    await _run_one(session_manager, record)
+
+            tasks = []
+            for record in records:
+                tasks.append(asyncio.create_task(arrive(record)))
+                await asyncio.sleep(rng.expovariate(rate))
+            await asyncio.gather(*tasks)
+
+        wall_time = time.perf_counter() - started
+        usage_after = _usage_snapshot()
+        lag_task.cancel()
+        queues = {"rate_limiter": rate_limiter_stats(), "dashscope": dashscope_client_stats(), "hedge": hedge_stats()}
+
+    functions: Dict[str, List[float]] = defaultdict(list)
+    llm: Dict[str, List[float]] = defaultdict(list)
+    for record in records:
+        for name, values in record.functions.items():
+            functions[name].extend(values)
+        for name, values in record.llm.items():
+            llm[name].extend(values)
+
+    succeeded = [r for r in records if r.error is None]
+    cpu_user = usage_after["user"] - usage_before["user"]
+    cpu_system = usage_after["system"] - usage_before["system"]
+    return {
+        "run": {"requests": requests, "succeeded": len(succeeded), "failed": requests - len(succeeded),
+                "concurrency": concurrency, "rate": rate, "wall_time": wall_time,
+                "throughput": len(succeeded) / wall_time if wall_time else 0.0},
+        "end_to_end": summarize([r.latency for r in succeeded]),
+        "driver_queue": summarize([r.queued for r in records]) if rate is not None else None,
+        "functions": {name: summarize(values) for name, values in sorted(functions.items())},
+        "llm": {name: summarize(values) for name, values in sorted(llm.items())},
+        "queues": queues,
+        "resources": {
+            "cpu_user": cpu_user,
+            "cpu_system": cpu_system,
+            "children_cpu": usage_after["children"] - usage_before["children"],
+            "cpu_percent": (cpu_user + cpu_system) / wall_time * 100 if wall_time else 0.0,
+            "max_rss_mb": usage_after["max_rss"],
+            "children_max_rss_mb": usage_after["children_max_rss"],
+            "loop_lag": summarize(loop_lag),
+        },
+        "errors": dict(Counter(r.error for r in records if r.error is not None).most_common()),
+    }
+
+
+def default_work_dir() -> Path:
+    return Path(tempfile.mkdtemp(prefix="beanbuddy_loadtest_"))
@@ -0,0 +1,75 @@
+import math
+from typing import Any, Dict, List, Sequence
+
+# 报告中输出的分位数
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """线性插值分位数，sorted_values 须已升序排列"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """样本数、均值、各分位数与最大值（秒）"""
+    ordered = sorted(values)
+    summary = {"count": len(ordered), "mean": sum(ordered) / len(ordered) if ordered else 0.0}
+    for q in PERCENTILES:
+        summary[f"p{q}"] = percentile(ordered, q)
+    summary["max"] = ordered[-1] if ordered else 0.0
+    return summary
+
+
+def _latency_table(title: str, rows: Dict[str, Dict[str, float]]) -> List[str]:
+    header = f"{title:<36}{'count':>7}{'mean':>9}" + "".join(f"{f'p{q}':>9}" for q in PERCENTILES) + f"{'max':>9}"
+    lines = [header, "-" * len(header)]
+    for name, summary in rows.items():
+        lines.append(f"{name:<36}{summary['count']:>7}{summary['mean']:>9.3f}"
+                     + "".join(f"{summary[f'p{q}']:>9.3f}" for q in PERCENTILES)
+                     + f"{summary['max']:>9.3f}")
+    return lines
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """将压测结果格式化为文本报告（时间单位：秒）"""
+    run = report["run"]
+    lines = [
+        f"请求数 {run['requests']}（成功 {run['succeeded']}，失败 {run['failed']}），并发 {run['concurrency']}，"
+        f"耗时 {run['wall_time']:.1f}s，吞吐 {run['throughput']:.2f} req/s",
+        "",
+    ]
+    lines += _latency_table("end_to_end", {"end_to_end": report["end_to_end"]})
+    if report.get("driver_queue"):
+        lines += _latency_table("driver_queue", {"driver_queue": report["driver_queue"]})
+    lines.append("")
+    lines += _latency_table("function", report["functions"])
+    lines.append("")
+    lines += _latency_table("llm", report["llm"])
+
+    lines += ["", "排队统计（限流器 / DashScope并发）"]
+    for name, stats in report["queues"]["rate_limiter"].items():
+        lines.append(f"  limiter {name}: {stats}")
+    for name, stats in report["queues"]["dashscope"].items():
+        lines.append(f"  dashscope {name}: {stats}")
+    for name, stats in report["queues"].get("hedge", {}).items():
+        lines.append(f"  hedge {name}: {stats}")
+
+    resources = report["resources"]
+    lines += ["", "资源占用",
+              f"  CPU 用户态 {resources['cpu_user']:.1f}s / 内核态 {resources['cpu_system']:.1f}s"
+              f"（子进程 {resources['children_cpu']:.1f}s），平均 {resources['cpu_percent']:.0f}% 单核",
+              f"  峰值内存 {resources['max_rss_mb']:.0f}MB（子进程 {resources['children_max_rss_mb']:.0f}MB）",
+              f"  事件循环延迟 p50 {resources['loop_lag']['p50'] * 1000:.1f}ms"
+              f" / p99 {resources['loop_lag']['p99'] * 1000:.1f}ms / max {resources['loop_lag']['max'] * 1000:.1f}ms"]
+
+    if report.get("errors"):
+        lines += ["", "失败原因"]
+        lines += [f"  {count:>5} × {error}" for error, count in report["errors"].items()]
+    if report.get("stubs"):
+        lines += ["", f"桩服务统计: {report['stubs']}"]
+    return "\n".join(lines)
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# 标准正态分布的99分位点，用于由 (中位数, p99) 推出对数正态分布的 sigma
+_Z99 = 2.3263
+# 流式输出时每个数据块的字符数
+_STREAM_CHUNK_CHARS = 4
+# 工具内部LLM调用的固定回答
+_YES_NO_MARKER = "只需输出“是”或“否”"
+_FILLER_TEXT = ("一只圆滚滚的Q版小猫，大眼睛，粉色腮红，戴着红色围巾，"
+                "身体以奶油白为主、耳朵内侧为浅粉色，轮廓线条简洁，色块分明，适合拼豆制作。")
+# ReAct 工作流的工具调用顺序（按识别结果路由）
+_ROUTES = {"image": "extract_subject", "entity_name": "query_knowledge_graph",
+           "text_description": "enhance_description"}
+_NEXT_TOOL = {"enhance_description": "generate_image_from_text",
+              "query_knowledge_graph": "generate_image_from_text",
+              "extract_subject": "generate_bean_buddy_design",
+              "generate_image_from_text": "generate_bean_buddy_design"}
+
+
+@dataclass
+class LatencyProfile:
+    """延迟分布：对数正态分布，由中位数与p99确定（秒），中位数为0时不等待"""
+    median: float = 0.5
+    p99: float = 2.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        sigma = math.log(max(self.p99, self.median) / self.median) / _Z99
+        return rng.lognormvariate(math.log(self.median), sigma)
+
+
+@dataclass
+class ErrorProfile:
+    """错误分布：按概率返回5xx或429（429带 Retry-After 响应头）"""
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+
+    def sample(self, rng: random.Random) -> Optional[int]:
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return rng.choice((500, 503))
+        return None
+
+
+@dataclass
+class StubConfig:
+    """本地桩服务配置"""
+    # LLM：非流式为完整响应延迟，流式为首个数据块延迟
+    llm_latency: LatencyProfile = field(default_factory=lambda: LatencyProfile(0.6, 2.5))
+    llm_errors: ErrorProfile = field(default_factory=ErrorProfile)
+    # 流式输出时相邻数据块的间隔（秒）
+    llm_chunk_interval: float = 0.02
+    # 工具内部LLM调用（描述增强、实体特征）的回答长度（字符）
+    llm_output_chars: int = 240
+    # 图片生成 / 图片编辑
+    image_latency: LatencyProfile = field(default_factory=lambda: LatencyProfile(6.0, 15.0))
+    image_errors: ErrorProfile = field(default_factory=ErrorProfile)
+    # 作为"生成结果"返回的本地图片目录，为空时生成几张示例图片
+    images_dir: Optional[str] = None
+    seed: Optional[int] = None
+
+
+class _StubState:
+    def __init__(self, config: StubConfig, images: List[Path]):
+        self.config = config
+        self.images = images
+        self.rng = random.Random(config.seed)
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"requests": dict(self.requests), "injected_errors": dict(self.errors)}
+
+
+def write_sample_images(directory: Path, count: int = 4, size: int = 512) -> List[Path]:
+    """生成示例图片（白底上的几个彩色色块），模拟文生图 / 抠图结果"""
+    from PIL import Image, ImageDraw
+
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(0)
+    paths = []
+    for i in range(count):
+        image = Image.new("RGB", (size, size), (255, 255, 255))
+        draw = ImageDraw.Draw(image)
+        margin = size // 6
+        draw.ellipse([margin, margin, size - margin, size - margin],
+                     fill=tuple(rng.randrange(40, 230) for _ in range(3)))
+        for _ in range(6):
+            x, y = rng.randrange(margin, size - margin), rng.randrange(margin, size - margin)
+            radius = rng.randrange(size // 20, size // 8)
+            draw.ellipse([x - radius, y - radius, x + radius, y + radius],
+                         fill=tuple(rng.randrange(0, 256) for _ in range(3)))
+        path = directory / f"sample_{i}.png"
+        image.save(path, format="PNG")
+        paths.append(path)
+    return paths
+
+
+def _list_images(config: StubConfig) -> List[Path]:
+    if config.images_dir:
+        images = sorted(p for p in Path(config.images_dir).iterdir()
+                        if p.suffix.lower() in (".png", ".jpg", ".jpeg", ".webp"))
+        if not images:
+            raise ValueError(f"图片目录中没有可用图片: {config.images_dir}")
+        return images
+    import tempfile
+    return write_sample_images(Path(tempfile.mkdtemp(prefix="beanbuddy_stub_images_")))
+
+
+# --------------------------
+# OpenAI 兼容接口桩
+# --------------------------
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def _observation_field(observation: str, name: str) -> Optional[str]:
+    """从工具输出（JSON 或 pydantic 模型的字符串形式）中取出字段值"""
+    try:
+        data = json.loads(observation)
+        if isinstance(data, dict) and data.get(name) is not None:
+            return str(data[name])
+    except ValueError:
+        pass
+    match = re.search(rf"{name}=(['\"])(.*?)\1(?=\s+\w+=|\s*$)", observation, re.S)
+    return match.group(2) if match else None
+
+
+def _react_step(messages: List[Dict[str, Any]]) -> str:
+    """
+    按对话历史编排 ReAct 工作流的下一步：识别输入 -> 按识别结果路由 -> 生成图片 -> 设计图 -> 最终答案
+    之前的 Agent 输出（assistant）中记录了上一次调用的工具，其后的用户消息即工具输出（Observation）
+    """
+    last_action = None
+    observation = ""
+    question = ""
+    for message in messages:
+        text = _message_text(message)
+        if message.get("role") == "assistant":
+            match = re.search(r"Action:\s*(\w+)", text)
+            last_action = match.group(1) if match else last_action
+        elif message.get("role") == "user":
+            if last_action is None:
+                question = text
+            else:
+                observation = text
+
+    if last_action is None:
+        return _react_action("identify_input_type", question)
+    input_data = _observation_field(observation, "input_data") or observation
+    if last_action == "identify_input_type":
+        # input_type 可能是 JSON 字符串，也可能是枚举的字符串形式 <InputType.IMAGE: 'image'>
+        match = re.search(r"input_type\W*(?:InputType\.\w+:\s*)?['\"]?(text_description|entity_name|image)",
+                          observation)
+        return _react_action(_ROUTES[match.group(1) if match else "text_description"], input_data)
+    if last_action in _NEXT_TOOL:
+        return _react_action(_NEXT_TOOL[last_action], input_data)
+    return f"Thought: I now know the final answer\nFinal Answer: {input_data}"
+
+
+def _react_action(tool: str, input_data: str) -> str:
+    return (f"Thought: 下一步调用 {tool}\n"
+            f"Action: {tool}\n"
+            f"Action Input: {json.dumps({'input_data': input_data}, ensure_ascii=False)}")
+
+
+def _completion_text(messages: List[Dict[str, Any]], config: StubConfig) -> str:
+    if any(m.get("role") == "system" and "Action Input" in _message_text(m) for m in messages):
+        return _react_step(messages)
+    prompt = "".join(_message_text(m) for m in messages)
+    if _YES_NO_MARKER in prompt:
+        return "是"
+    repeats = config.llm_output_chars // len(_FILLER_TEXT) + 1
+    return (_FILLER_TEXT * repeats)[:config.llm_output_chars]
+
+
+def _usage(messages: List[Dict[str, Any]], text: str) -> Dict[str, int]:
+    prompt_tokens = sum(len(_message_text(m)) for m in messages) // 2 + 1
+    completion_tokens = len(text) // 2 + 1
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _error_response(status: int, errors: ErrorProfile) -> web.Response:
+    headers = {"Retry-After": str(errors.retry_after)} if status == 429 else {}
+    code = "Throttling" if status == 429 else "InternalError"
+    body = {"code": code, "message": "stub injected error", "request_id": uuid.uuid4().hex,
+            "error": {"message": "stub injected error", "type": code, "code": code}}
+    return web.json_response(body, status=status, headers=headers)
+
+
+async def _chat_completions(request: web.Request) -> web.StreamResponse:
+    state: _StubState = request.app["state"]
+    config = state.config
+    body = await request.json()
+    model = body.get("model", "stub")
+    state.requests[model] += 1
+    status = config.llm_errors.sample(state.rng)
+    if status is not None:
+        state.errors[f"{model}:{status}"] += 1
+        return _error_response(status, config.llm_errors)
+
+    messages = body.get("messages") or []
+    text = _completion_text(messages, config)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    await asyncio.sleep(config.llm_latency.sample(state.rng))
+
+    if not body.get("stream"):
+        return web.json_response({
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": _usage(messages, text),
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    async def send(choices: List[Dict[str, Any]], **extra: Any) -> None:
+        chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": choices, **extra}
+        await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    for i in range(0, len(text), _STREAM_CHUNK_CHARS):
+        if i:
+            await asyncio.sleep(config.llm_chunk_interval)
+        delta = {"content": text[i:i + _STREAM_CHUNK_CHARS]}
+        if i == 0:
+            delta["role"] = "assistant"
+        await send([{"index": 0, "delta": delta, "finish_reason": None}])
+    await send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    if (body.get("stream_options") or {}).get("include_usage"):
+        await send([], usage=_usage(messages, text))
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+# --------------------------
+# DashScope 多模态生成接口桩
+# --------------------------
+async def _multimodal_generation(request: web.Request) -> web.Response:
+    state: _StubState = request.app["state"]
+    config = state.config
+    body = await request.json()
+    model = body.get("model", "stub")
+    state.requests[model] += 1
+    status = config.image_errors.sample(state.rng)
+    if status is not None:
+        state.errors[f"{model}:{status}"] += 1
+        return _error_response(status, config.image_errors)
+
+    await asyncio.sleep(config.image_latency.sample(state.rng))
+    image = state.rng.choice(state.images)
+    image_url = f"{request.url.origin()}/files/{image.name}"
+    return web.json_response({
+        "request_id": uuid.uuid4().hex,
+        "output": {"choices": [{"finish_reason": "stop",
+                                "message": {"role": "assistant", "content": [{"image": image_url}]}}]},
+        "usage": {"width": 1024, "height": 1024, "image_count": 1},
+    })
+
+
+async def _serve_file(request: web.Request) -> web.StreamResponse:
+    state: _StubState = request.app["state"]
+    name = request.match_info["name"]
+    for image in state.images:
+        if image.name == name:
+            state.requests["files"] += 1
+            return web.FileResponse(image)
+    raise web.HTTPNotFound()
+
+
+async def _stats(request: web.Request) -> web.Response:
+    return web.json_response(request.app["state"].as_dict())
+
+
+def create_llm_app(config: StubConfig) -> web.Application:
+    """OpenAI 兼容接口桩：POST /v1/chat/completions（支持流式）"""
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app["state"] = _StubState(config, [])
+    app.router.add_post("/v1/chat/completions", _chat_completions)
+    app.router.add_get("/stats", _stats)
+    return app
+
+
+def create_dashscope_app(config: StubConfig) -> web.Application:
+    """DashScope 接口桩：多模态生成接口返回本地图片的访问地址，图片由 GET /files/<文件名> 提供"""
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app["state"] = _StubState(config, _list_images(config))
+    app.router.add_post("/api/v1/services/aigc/multimodal-generation/generation", _multimodal_generation)
+    app.router.add_get("/files/{name}", _serve_file)
+    app.router.add_get("/stats", _stats)
+    return app
+
+
+@dataclass
+class StubServers:
+    """已启动的桩服务"""
+    llm_url: str
+    dashscope_url: str
+    images: List[str]
+    runners: List[web.AppRunner] = field(default_factory=list, repr=False)
+
+    async def close(self) -> None:
+        for runner in self.runners:
+            await runner.cleanup()
+
+
+async def start_stubs(config: StubConfig, host: str = "127.0.0.1",
+                      llm_port: int = 0, dashscope_port: int = 0) -> StubServers:
+    """在当前事件循环中启动两个桩服务，端口为0时自动分配"""
+    runners = []
+    urls = []
+    for app, port in ((create_llm_app(config), llm_port), (create_dashscope_app(config), dashscope_port)):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        runners.append(runner)
+        urls.append(f"http://{host}:{runner.addresses[0][1]}")
+    images = [image.name for image in runners[1].app["state"].images]
+    return StubServers(llm_url=urls[0], dashscope_url=urls[1], images=images, runners=runners)
+
+
+def run_stubs_process(config: StubConfig, host: str, ports: Tuple[int, int], ready) -> None:
+    """子进程入口：启动桩服务并通过队列回传地址，直到进程被终止（避免桩服务与被测工作流争用同一CPU）"""
+
+    async def serve() -> None:
+        servers = await start_stubs(config, host, *ports)
+        ready.put((servers.llm_url, servers.dashscope_url, servers.images))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await servers.close()
+
+    asyncio.run(serve())
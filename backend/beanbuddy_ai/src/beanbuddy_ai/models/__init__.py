@@ -1,3 +1,4 @@
+from .bead_edit import BeadEditOperation, BeadEditRequest
 from .enhance_description import EnhanceDescriptionInput, EnhanceDescriptionOutput
 from .extract_subject import ExtractSubjectInput, ExtractSubjectOutput
 from .generate_bean_buddy_design import GenerateBeanBuddyDesignInput, GenerateBeanBuddyDesignOutput
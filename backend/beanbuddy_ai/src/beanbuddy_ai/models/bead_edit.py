@@ -0,0 +1,34 @@
+from typing import List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class BeadEditOperation(BaseModel):
+    """
+    设计图编辑操作（颜色以色卡中的珠子编号表示，to_color 为空表示移除豆子）
+    - recolor：将 from_color 的豆子全部换成 to_color（可用 region 限定范围）
+    - replace：将 region 内的所有豆子换成 to_color
+    - paint：将 cells 中的每个位置设为 to_color（可在空位上添加豆子）
+    """
+    op: Literal["recolor", "replace", "paint"] = Field(..., description="操作类型：recolor / replace / paint")
+    from_color: Optional[str] = Field(default=None, description="recolor 操作中被替换的珠子编号（recolor 必填）")
+    to_color: Optional[str] = Field(default=None, description="目标珠子编号，为空表示移除豆子（变为空位）")
+    region: Optional[Tuple[int, int, int, int]] = Field(
+        default=None,
+        description="矩形区域 [起始行, 起始列, 结束行, 结束列]（不含结束行列），recolor 省略时为整张设计图"
+    )
+    cells: Optional[List[Tuple[int, int]]] = Field(default=None, description="paint 操作的豆子位置列表 [[行, 列], ...]")
+
+    @model_validator(mode="after")
+    def _check_recolor_source(self) -> "BeadEditOperation":
+        # 缺少 from_color 时会把空位当作被替换的颜色，整张背景都会填满豆子
+        if self.op == "recolor" and not self.from_color:
+            raise ValueError("recolor 操作需要指定 from_color")
+        return self
+
+
+class BeadEditRequest(BaseModel):
+    """
+    设计图编辑请求：按顺序应用的编辑操作
+    """
+    operations: List[BeadEditOperation] = Field(..., min_length=1, description="按顺序应用的编辑操作")
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import Field, BaseModel
 
 
@@ -9,6 +11,10 @@ class ExtractSubjectInput(BaseModel):
         ...,
         description="用户的原始输入内容：文本字符串"
     )
+    stylize: Optional[bool] = Field(
+        default=None,
+        description="用户是否要求Q版风格化：true 时使用远程图片编辑模型；为空时按工具配置的模式处理"
+    )
 
 
 class ExtractSubjectOutput(BaseModel):
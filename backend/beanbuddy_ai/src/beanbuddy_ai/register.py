@@ -1,4 +1,5 @@
 # flake8: noqa
 
 # Import any tools which need to be automatically registered here
-from .tools import register
+from .tools import register as tools_register
+from .workflows import register as workflows_register
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, Response
+from nat.builder.workflow_builder import WorkflowBuilder
+from nat.front_ends.fastapi.fastapi_front_end_plugin_worker import FastApiFrontEndPluginWorker
+
+from ..models import BeadEditRequest
+from ..utils.image_ingest import ImageIngestError, ImageTooLarge, ingest_stream, max_upload_bytes
+from ..utils.metrics import CONTENT_TYPE, render_metrics
+from ..utils.output_store import DESIGN_ROUTE_PREFIX, get_output_store
+from .grid_viewer import GRID_VIEWER_HTML
+
+logger = logging.getLogger(__name__)
+
+# 文件名即内容摘要，内容不会变化，可长期缓存
+_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class BeanBuddyFastApiWorker(FastApiFrontEndPluginWorker):
+    """
+    FastAPI front end worker that adds the BeanBuddy routes (rendered designs, image uploads, metrics) to the default NAT routes.
+    Enable it with `general.front_end.runner_class` in the workflow config.
+    """
+
+    async def add_routes(self, app: FastAPI, builder: WorkflowBuilder):
+        await super().add_routes(app, builder)
+        add_design_routes(app)
+        add_grid_routes(app)
+        add_job_routes(app)
+        add_upload_routes(app)
+        add_metrics_route(app)
+
+
+def add_design_routes(app: FastAPI) -> None:
+    """注册设计图访问路由：GET /designs/<sha256>.png"""
+
+    @app.get(f"{DESIGN_ROUTE_PREFIX}/{{name}}", include_in_schema=False)
+    async def get_design(name: str, request: Request):
+        path = get_output_store().resolve(name)
+        if path is None:
+            raise HTTPException(status_code=404, detail="设计图不存在或已被清理")
+        etag = f'"{path.stem}"'
+        headers = {"Cache-Control": _CACHE_CONTROL, "ETag": etag}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return FileResponse(path, media_type="image/png", headers=headers)
+
+    logger.info(f"已注册设计图路由 {DESIGN_ROUTE_PREFIX}/{{name}}")
+
+
+def add_grid_routes(app: FastAPI) -> None:
+    """
+    注册拼豆网格分块查看路由（按需渲染，不预先生成分块）：
+    GET /designs/grids/<网格ID>                       网格元数据（尺寸、缩放级别范围、分块地址模板、材料统计）
+    GET /designs/grids/<网格ID>/tiles/<z>/<x>/<y>.png  缩放级别 z 下第 (x, y) 个256像素分块
+    GET /designs/grids/<网格ID>/preview.png            整张设计图的缩略预览（最长边 1024 像素）
+    GET /designs/grids/<网格ID>/view                   分块查看页（滚轮缩放、拖动平移）
+    POST /designs/grids/<网格ID>/edits                  编辑设计（换色、区域替换、逐颗修改），返回新网格的元数据
+    """
+    grid_prefix = f"{DESIGN_ROUTE_PREFIX}/grids"
+
+    @app.get(f"{grid_prefix}/{{grid_id}}", include_in_schema=False)
+    async def get_grid(grid_id: str):
+        # 按需导入网格渲染模块（numpy/PIL），保持服务启动轻量
+        from ..imaging.bead_grid import load_grid
+        grid = await asyncio.to_thread(_load_grid_or_none, load_grid, grid_id)
+        if grid is None:
+            raise HTTPException(status_code=404, detail="拼豆网格不存在或已被清理")
+        return _grid_metadata(grid_prefix, grid_id, grid)
+
+    @app.post(f"{grid_prefix}/{{grid_id}}/edits", include_in_schema=False)
+    async def post_grid_edits(grid_id: str, request: BeadEditRequest):
+        from ..imaging.bead_grid import edit_grid, load_grid
+        grid = await asyncio.to_thread(_load_grid_or_none, load_grid, grid_id)
+        if grid is None:
+            raise HTTPException(status_code=404, detail="拼豆网格不存在或已被清理")
+        try:
+            result = await asyncio.to_thread(edit_grid, grid_id, grid, request.operations)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {
+            **_grid_metadata(grid_prefix, result["grid_id"], result["grid"]),
+            "parent_grid_id": grid_id,
+            "changed_beads": result["changed_beads"],
+            "reused_tiles": result["reused_tiles"],
+            "dirty_tiles": result["dirty_tiles"],
+        }
+
+    @app.get(f"{grid_prefix}/{{grid_id}}/tiles/{{z}}/{{x}}/{{y}}.png", include_in_schema=False)
+    async def get_grid_tile(grid_id: str, z: int, x: int, y: int):
+        from ..imaging.bead_grid import get_tile
+        tile = await asyncio.to_thread(_load_grid_or_none, get_tile, grid_id, z, x, y)
+        if tile is None:
+            raise HTTPException(status_code=404, detail="分块不存在或网格已被清理")
+        # 网格ID即内容摘要，同一地址的分块内容不会变化
+        return Response(content=tile, media_type="image/png", headers={"Cache-Control": _CACHE_CONTROL})
+
+    @app.get(f"{grid_prefix}/{{grid_id}}/preview.png", include_in_schema=False)
+    async def get_grid_preview(grid_id: str):
+        from ..imaging.bead_grid import get_preview
+        preview = await asyncio.to_thread(_load_grid_or_none, get_preview, grid_id)
+        if preview is None:
+            raise HTTPException(status_code=404, detail="拼豆网格不存在或已被清理")
+        return Response(content=preview, media_type="image/png", headers={"Cache-Control": _CACHE_CONTROL})
+
+    @app.get(f"{grid_prefix}/{{grid_id}}/view", include_in_schema=False)
+    async def get_grid_viewer(grid_id: str):
+        # 页面本身与网格无关，网格不存在时由页面读取元数据后提示
+        return HTMLResponse(GRID_VIEWER_HTML)
+
+    logger.info(f"已注册拼豆网格分块路由 {grid_prefix}/{{grid_id}}/tiles/{{z}}/{{x}}/{{y}}.png")
+
+
+def add_job_routes(app: FastAPI) -> None:
+    """注册设计任务查询路由：GET /designs/jobs/<任务ID>（队列模式下的状态、尝试次数与结果地址）"""
+
+    @app.get(f"{DESIGN_ROUTE_PREFIX}/jobs/{{job_id}}", include_in_schema=False)
+    async def get_job(job_id: str):
+        from ..utils.job_queue import STATUS_SUCCEEDED, get_job_queue
+        job = await asyncio.to_thread(get_job_queue().get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="设计任务不存在")
+        response = job.as_dict()
+        response.pop("kind")
+        if job.status == STATUS_SUCCEEDED:
+            response["design_url"] = f"{DESIGN_ROUTE_PREFIX}/{job.result['image_name']}"
+            response["grid_url"] = f"{DESIGN_ROUTE_PREFIX}/grids/{job.result['grid_id']}"
+            response["viewer_url"] = f"{response['grid_url']}/view"
+        return response
+
+    logger.info(f"已注册设计任务查询路由 {DESIGN_ROUTE_PREFIX}/jobs/{{job_id}}")
+
+
+# 上传接口前缀：POST /uploads
+UPLOAD_ROUTE = "/uploads"
+# multipart 上传逐块读取的大小
+_UPLOAD_CHUNK_SIZE = 256 * 1024
+# multipart 边界与表单头部的额外字节（Content-Length 预检时放宽）
+_MULTIPART_OVERHEAD = 16 * 1024
+
+
+def add_upload_routes(app: FastAPI) -> None:
+    """
+    注册图片直传路由：POST /uploads
+    请求体为图片原始字节（Content-Type: image/*）或 multipart/form-data 的 file 字段，逐块写入制品存储并校验大小上限
+    返回 artifact:// 引用，作为工作流输入（input_data）传入即可，后续工具直接读取本地字节，不经过对象存储上传与下载
+    """
+
+    @app.post(UPLOAD_ROUTE, include_in_schema=False)
+    async def post_upload(request: Request):
+        limit = max_upload_bytes()
+        content_type = request.headers.get("content-type", "")
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit + _MULTIPART_OVERHEAD:
+            raise HTTPException(status_code=413, detail=str(ImageTooLarge(limit)))
+        try:
+            if content_type.startswith("multipart/form-data"):
+                form = await request.form()
+                upload = form.get("file")
+                if upload is None or isinstance(upload, str):
+                    raise HTTPException(status_code=400, detail="缺少上传文件（表单字段 file）")
+                try:
+                    ref = await ingest_stream(_read_chunks(upload), upload.content_type or "", limit)
+                finally:
+                    await form.close()
+            else:
+                ref = await ingest_stream(request.stream(), content_type.split(";")[0].strip(), limit)
+        except ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ImageIngestError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"ref": ref}
+
+    logger.info(f"已注册图片直传路由 {UPLOAD_ROUTE}")
+
+
+async def _read_chunks(upload):
+    while True:
+        chunk = await upload.read(_UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _grid_metadata(grid_prefix: str, grid_id: str, grid) -> dict:
+    from ..imaging.bead_grid import _EXTRA_ZOOM_LEVELS, TILE_SIZE
+    statistics = grid.statistics()
+    return {
+        "grid_id": grid_id,
+        "rows": grid.rows,
+        "cols": grid.cols,
+        "width": grid.width,
+        "height": grid.height,
+        "cell_size": grid.cell_size,
+        "tile_size": TILE_SIZE,
+        "min_zoom": 0,
+        "native_zoom": grid.max_zoom,
+        "max_zoom": grid.max_zoom + _EXTRA_ZOOM_LEVELS,
+        "tile_url_template": f"{grid_prefix}/{grid_id}/tiles/{{z}}/{{x}}/{{y}}.png",
+        "color_template": grid.color_template,
+        "color_statistics": statistics,
+        "total_beads": sum(statistics.values()),
+    }
+
+
+def add_metrics_route(app: FastAPI) -> None:
+    """注册指标导出路由：GET /metrics（Prometheus 文本格式：耗时、token 用量、缓存命中率、排队情况）"""
+
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics():
+        return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
+    logger.info("已注册指标路由 /metrics")
+
+
+def _load_grid_or_none(func, *args):
+    """网格文件损坏时按不存在处理（记录日志），避免返回500"""
+    try:
+        return func(*args)
+    except ValueError as e:
+        logger.warning(f"拼豆网格读取失败：{e}")
+        return None
@@ -0,0 +1,140 @@
+# 拼豆网格分块查看页：读取网格元数据，按 tile_url_template 加载当前视野内的分块，支持滚轮缩放与拖动
+# 不依赖外部脚本，由 GET /designs/grids/<网格ID>/view 返回
+GRID_VIEWER_HTML = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>拼豆设计图</title>
+<style>
+  html, body { margin: 0; height: 100%; overflow: hidden; background: #f4f4f4; font-family: sans-serif; }
+  #viewer { width: 100%; height: 100%; display: block; cursor: grab; touch-action: none; }
+  #viewer.dragging { cursor: grabbing; }
+  #info { position: fixed; top: 8px; left: 8px; padding: 6px 10px; background: rgba(255, 255, 255, 0.9);
+          border-radius: 4px; font-size: 13px; box-shadow: 0 1px 3px rgba(0, 0, 0, 0.2); }
+  #controls { position: fixed; bottom: 12px; right: 12px; display: flex; gap: 6px; }
+  #controls button { width: 36px; height: 36px; font-size: 18px; border: none; border-radius: 4px; background: #fff;
+                     box-shadow: 0 1px 3px rgba(0, 0, 0, 0.3); cursor: pointer; }
+</style>
+</head>
+<body>
+<canvas id="viewer"></canvas>
+<div id="info">加载中…</div>
+<div id="controls"><button id="zoom-in">+</button><button id="zoom-out">−</button><button id="fit">⤢</button></div>
+<script>
+(async () => {
+  const canvas = document.getElementById('viewer');
+  const info = document.getElementById('info');
+  const ctx = canvas.getContext('2d');
+  const response = await fetch(location.pathname.replace(/\\/view\\/?$/, ''));
+  if (!response.ok) {
+    info.textContent = '设计图不存在或已被清理';
+    return;
+  }
+  const meta = await response.json();
+  info.textContent = `${meta.cols} × ${meta.rows} 颗 · 共 ${meta.total_beads} 颗 · 色卡 ${meta.color_template}`;
+
+  const tiles = new Map();
+  // 视图状态：缩放级别 z 与设计图左上角在画布中的位置（CSS 像素）
+  let z = 0, originX = 0, originY = 0;
+  const ratio = () => window.devicePixelRatio || 1;
+  const levelSize = (level) => {
+    const scale = Math.pow(2, level - meta.native_zoom);
+    return [meta.width * scale, meta.height * scale];
+  };
+
+  function tileImage(level, x, y) {
+    const key = `${level}/${x}/${y}`;
+    if (!tiles.has(key)) {
+      const image = new Image();
+      image.onload = draw;
+      image.src = meta.tile_url_template.replace('{z}', level).replace('{x}', x).replace('{y}', y);
+      tiles.set(key, image);
+    }
+    return tiles.get(key);
+  }
+
+  function draw() {
+    const dpr = ratio();
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    ctx.imageSmoothingEnabled = false;
+    const [width, height] = levelSize(z);
+    const size = meta.tile_size;
+    const viewWidth = canvas.width / dpr, viewHeight = canvas.height / dpr;
+    const x0 = Math.max(0, Math.floor(-originX / size)), y0 = Math.max(0, Math.floor(-originY / size));
+    const x1 = Math.min(Math.ceil(width / size), Math.ceil((viewWidth - originX) / size));
+    const y1 = Math.min(Math.ceil(height / size), Math.ceil((viewHeight - originY) / size));
+    for (let y = y0; y < y1; y++) {
+      for (let x = x0; x < x1; x++) {
+        const image = tileImage(z, x, y);
+        if (image.complete && image.naturalWidth) {
+          ctx.drawImage(image, Math.round(originX + x * size), Math.round(originY + y * size));
+        }
+      }
+    }
+  }
+
+  function zoomTo(level, anchorX, anchorY) {
+    level = Math.max(meta.min_zoom, Math.min(meta.max_zoom, level));
+    if (level === z) return;
+    const factor = Math.pow(2, level - z);
+    originX = anchorX - (anchorX - originX) * factor;
+    originY = anchorY - (anchorY - originY) * factor;
+    z = level;
+    draw();
+  }
+
+  function fit() {
+    const viewWidth = canvas.width / ratio(), viewHeight = canvas.height / ratio();
+    z = meta.min_zoom;
+    while (z < meta.native_zoom) {
+      const [width, height] = levelSize(z + 1);
+      if (width > viewWidth || height > viewHeight) break;
+      z++;
+    }
+    const [width, height] = levelSize(z);
+    originX = (viewWidth - width) / 2;
+    originY = (viewHeight - height) / 2;
+    draw();
+  }
+
+  function resize() {
+    canvas.width = window.innerWidth * ratio();
+    canvas.height = window.innerHeight * ratio();
+    draw();
+  }
+
+  let drag = null;
+  canvas.addEventListener('pointerdown', (e) => {
+    drag = { x: e.clientX, y: e.clientY };
+    canvas.setPointerCapture(e.pointerId);
+    canvas.classList.add('dragging');
+  });
+  canvas.addEventListener('pointermove', (e) => {
+    if (!drag) return;
+    originX += e.clientX - drag.x;
+    originY += e.clientY - drag.y;
+    drag = { x: e.clientX, y: e.clientY };
+    draw();
+  });
+  const endDrag = () => { drag = null; canvas.classList.remove('dragging'); };
+  canvas.addEventListener('pointerup', endDrag);
+  canvas.addEventListener('pointercancel', endDrag);
+  canvas.addEventListener('wheel', (e) => {
+    e.preventDefault();
+    zoomTo(z + (e.deltaY < 0 ? 1 : -1), e.clientX, e.clientY);
+  }, { passive: false });
+  document.getElementById('zoom-in').onclick = () => zoomTo(z + 1, window.innerWidth / 2, window.innerHeight / 2);
+  document.getElementById('zoom-out').onclick = () => zoomTo(z - 1, window.innerWidth / 2, window.innerHeight / 2);
+  document.getElementById('fit').onclick = fit;
+  window.addEventListener('resize', resize);
+
+  canvas.width = window.innerWidth * ratio();
+  canvas.height = window.innerHeight * ratio();
+  fit();
+})();
+</script>
+</body>
+</html>
+"""
@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 from nat.builder.builder import Builder
 from nat.builder.framework_enum import LLMFrameworkEnum
@@ -9,6 +10,11 @@ from nat.data_models.function import FunctionBaseConfig
 from pydantic import Field
 
 from ..models import EnhanceDescriptionInput, EnhanceDescriptionOutput
+from ..utils.llm_stream import stream_llm_text
+from ..utils.rate_limiter import get_llm_rate_limiter, rate_limited, response_total_tokens
+from ..utils.response_cache import (ResponseCache, estimate_tokens, get_response_cache, llm_signature,
+                                    template_version)
+from ..utils.tracing import SPAN_LLM, llm_model_name, record_error, record_llm_usage, span, traced_tool
 
 logger = logging.getLogger(__name__)
 
@@ -19,18 +25,50 @@ class EnhanceDescriptionConfig(FunctionBaseConfig, name="enhance_description"):
     """
     # Add your custom configuration parameters here
     llm_name: LLMRef = Field(description="The LLM to use for generating responses.")
+    cache_enabled: bool = Field(
+        default=True,
+        description="是否缓存LLM生成的描述（按归一化输入、提示词模版版本和LLM配置作为键）"
+    )
+    cache_ttl: float = Field(
+        default=86400.0,
+        description="描述缓存的有效期（秒）"
+    )
+    cache_max_entries: int = Field(
+        default=1024,
+        description="描述缓存的最大条目数"
+    )
+    stream_output: bool = Field(
+        default=True,
+        description="是否以流式方式调用LLM，并通过中间步骤实时推送生成进度"
+    )
+    similarity_threshold: float = Field(
+        default=0.0,
+        description="近似输入复用缓存的字符bigram相似度阈值（0~1），0 表示只使用精确匹配"
+    )
+    max_queue_wait: Optional[float] = Field(
+        default=None,
+        description="共享限流器预计排队时间超过该秒数时直接失败（快速失败），为空时排队等待配额"
+    )
 
 
 @register_function(config_type=EnhanceDescriptionConfig, framework_wrappers=[LLMFrameworkEnum.LANGCHAIN])
 async def enhance_description_function(
         config: EnhanceDescriptionConfig, builder: Builder
 ):
+    cache: Optional[ResponseCache] = None
+    if config.cache_enabled:
+        cache = get_response_cache("enhance_description",
+                                   max_entries=config.cache_max_entries,
+                                   ttl=config.cache_ttl,
+                                   similarity_threshold=config.similarity_threshold)
+
     # Implement your function logic here
+    @traced_tool("enhance_description")
     async def _enhance_description_function(input_data: EnhanceDescriptionInput) -> EnhanceDescriptionOutput:
         try:
             description = input_data.input_data.strip()
             # 根据主体名称获取的增强后的主体特征
-            description = await _enhance_description(description, config, builder)
+            description = await _enhance_description(description, config, builder, cache)
 
             return EnhanceDescriptionOutput(input_data=(f"• 描述信息：{description}。\n"
                                                         "• 风格：卡通渲染，色彩明亮且区块化，线条简洁清晰。\n"
@@ -38,6 +76,7 @@ async def enhance_description_function(
                                                         "• 细节： **不可以产生阴影**，无复杂纹理，整体设计易于识别和制作。\n"))
         except Exception as e:
             logger.error(f"根据简短文本生成丰富的拼豆设计描述过程中发生错误: {str(e)}", exc_info=True)
+            record_error(e)
             # 在出现错误时提供一个安全且符合格式的默认输出
             # 默认视为文本描述，由后续工具链处理
             safe_text = str(input_data.input_data) if not isinstance(input_data.input_data,
@@ -54,11 +93,12 @@ async def enhance_description_function(
     except GeneratorExit:
         logger.warning("Function exited early!")
     finally:
+        if cache is not None:
+            cache.log_stats()
         logger.info("Cleaning up enhance_description workflow.")
 
 
-async def _enhance_description(description: str, config: EnhanceDescriptionConfig, builder: Builder) -> str:
-    prompt = f"""角色设定：  
+_ENHANCE_PROMPT_TEMPLATE = """角色设定：  
 你是一名资深的风光摄影师兼场景概念设计师，擅长将简洁的场景主题转化为极具画面感、细节饱满的文本描述，用于AI绘画生成。你的描述需涵盖环境、光影、色彩、构图、氛围及细节纹理，确保内容层次分明且易于视觉化。
 
 核心任务：  
@@ -107,13 +147,46 @@ async def _enhance_description(description: str, config: EnhanceDescriptionConfi
 处理流程：
     现在，请根据用户输入的文本，生成相应的详细描述。
     用户输入：“{description}”"""
+
+# 提示词模版版本号，模版修改后缓存自动失效
+_ENHANCE_PROMPT_VERSION = template_version(_ENHANCE_PROMPT_TEMPLATE)
+# 回答的预估token数（用于限流预扣，调用完成后按实际用量修正）
+_EXPECTED_OUTPUT_TOKENS = 400
+
+
+async def _enhance_description(description: str, config: EnhanceDescriptionConfig, builder: Builder,
+                               cache: Optional[ResponseCache] = None) -> str:
+    prompt = _ENHANCE_PROMPT_TEMPLATE.format(description=description)
+
+    async def _invoke_llm() -> str:
+        llm = await builder.get_llm(config.llm_name, wrapper_type=LLMFrameworkEnum.LANGCHAIN)
+        llm_config = builder.get_llm_config(config.llm_name)
+        model = llm_model_name(llm_config)
+        async with rate_limited(get_llm_rate_limiter(llm_config), estimate_tokens(prompt) + _EXPECTED_OUTPUT_TOKENS,
+                                config.max_queue_wait) as reservation:
+            with span("enhance_description.llm", SPAN_LLM, model=model, stream=config.stream_output) as llm_span:
+                if config.stream_output:
+                    text = await stream_llm_text(llm, prompt, step_name="enhance_description")
+                    reservation.record_tokens(estimate_tokens(prompt) + estimate_tokens(text))
+                    record_llm_usage(llm_span, model, input_tokens=estimate_tokens(prompt),
+                                     output_tokens=estimate_tokens(text))
+                    return text
+                response = await llm.ainvoke(prompt)
+                reservation.record_tokens(response_total_tokens(response))
+                record_llm_usage(llm_span, model, response)
+                return response.content
+
     # 调用LLM并获取响应
     try:
-        llm = await builder.get_llm(config.llm_name, wrapper_type=LLMFrameworkEnum.LANGCHAIN)
-        response = await llm.ainvoke(prompt)
-        # 清理和解析响应，去除可能的首尾空格或换行，进行小写比较以确保鲁棒性
-        return response.content
+        if cache is None:
+            return await _invoke_llm()
+        return await cache.get_or_compute(description,
+                                          _ENHANCE_PROMPT_VERSION,
+                                          llm_signature(builder.get_llm_config(config.llm_name)),
+                                          _invoke_llm,
+                                          prompt_tokens=estimate_tokens(prompt))
     except Exception as e:
-        # 异常处理：如果LLM调用失败，记录错误并默认返回False，避免阻塞主流程
+        # 异常处理：如果LLM调用失败，记录错误并默认返回原始描述，避免阻塞主流程（失败结果不会被缓存）
         logger.error(f"在增强描述 '{description}' 时调用LLM失败: {str(e)}")
+        record_error(e)
         return description
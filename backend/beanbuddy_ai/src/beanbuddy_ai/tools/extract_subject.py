@@ -1,8 +1,8 @@
 import asyncio
-import functools
-import json
+import base64
 import logging
 import os
+from typing import Literal, Optional
 
 from nat.builder.builder import Builder
 from nat.builder.function_info import FunctionInfo
@@ -11,19 +11,21 @@ from nat.data_models.function import FunctionBaseConfig
 from pydantic import Field
 
 from ..models import ExtractSubjectInput, ExtractSubjectOutput
-
-# 检查 dashscope 依赖，缺失则提示安装
-try:
-    from dashscope import MultiModalConversation
-except ImportError:
-    raise ImportError(
-        "ExtractSubjectTool 依赖 'dashscope' 包，请执行安装：\n"
-        "pip install dashscope"
-    )
+from ..utils.artifact_store import get_artifact_store, is_artifact_ref
+from ..utils.dashscope_client import DashScopeError, get_dashscope_client
+from ..utils.hedging import hedge_policy_for
+from ..utils.http_session import acquire_http_session, release_http_session
+from ..utils.image_cache import fetch_image_artifact
+from ..utils.image_probe import sniff_image_format
+from ..utils.import_timing import PHASE_IMPLEMENTATION, timed_import
+from ..utils.tracing import SPAN_COMPUTE, record_error, span, traced_tool
 
 # 初始化日志（遵循框架日志规范）
 logger = logging.getLogger(__name__)
 
+# 阿里云通义千问-图片编辑模型
+_MODEL_NAME = "qwen-image-edit"
+
 
 class ExtractSubjectConfig(FunctionBaseConfig, name="extract_subject"):
     """
@@ -52,6 +54,78 @@ class ExtractSubjectConfig(FunctionBaseConfig, name="extract_subject"):
         description="Qwen-Image-Edit API调用的超时时间，默认30秒。"
     )
 
+    dashscope_base_url: str = Field(
+        default="",
+        description="DashScope接口地址，为空时使用环境变量 DASHSCOPE_BASE_URL 或官方地址（可指向本地桩服务测试）"
+    )
+
+    max_concurrency: int = Field(
+        default=4,
+        description="同时进行中的图片编辑请求上限，超出的请求在事件循环中排队"
+    )
+
+    mode: Literal["remote", "local", "auto"] = Field(
+        default="remote",
+        description="主体提取方式：remote 调用远程图片编辑模型；local 使用进程内的rembg会话本地抠图；"
+                    "auto 默认本地抠图，用户要求Q版风格化或本地掩膜置信度过低时改用远程编辑"
+    )
+
+    rembg_model_name: str = Field(
+        default="isnet-general-use",
+        description="本地抠图使用的rembg模型名称，与设计工具相同时共享同一模型会话"
+    )
+
+    min_mask_confidence: float = Field(
+        default=0.85,
+        description="auto 模式下本地掩膜置信度（前景中边缘不确定像素以外的占比）低于该值时改用远程编辑"
+    )
+
+    local_stylize: bool = Field(
+        default=False,
+        description="本地抠图后是否进行简单的平涂风格化（中值滤波 + 颜色量化）"
+    )
+
+    stylize_colors: int = Field(
+        default=16,
+        description="平涂风格化保留的颜色数量"
+    )
+
+    output_artifact_ref: bool = Field(
+        default=False,
+        description="是否将处理后的图片下载到进程内制品存储并返回 artifact:// 引用，"
+                    "后续设计工具无需再次下载与解码（下载失败时仍返回图片URL）"
+    )
+
+    max_retries: int = Field(
+        default=3,
+        description="遇到429/5xx或网络错误时的最大重试次数（带抖动的指数退避）"
+    )
+
+    max_queue_wait: Optional[float] = Field(
+        default=None,
+        description="共享限流器预计排队时间超过该秒数时直接失败（快速失败），为空时排队等待配额"
+    )
+
+    hedge_percentile: float = Field(
+        default=0.0,
+        ge=0.0,
+        lt=100.0,
+        description="对冲请求触发分位数（如 95）：请求耗时超过近期该分位数仍未完成时，利用空闲并发与配额发起一个重复请求，取先返回的结果；0 表示不对冲"
+    )
+
+    hedge_max_ratio: float = Field(
+        default=0.05,
+        ge=0.0,
+        le=1.0,
+        description="对冲请求占调用次数的上限比例（预算），控制额外的API调用费用"
+    )
+
+    hedge_min_samples: int = Field(
+        default=20,
+        ge=1,
+        description="近期耗时样本少于该数量时不对冲（分位数不可靠）"
+    )
+
 
 @register_function(config_type=ExtractSubjectConfig)
 async def extract_subject_function(
@@ -78,6 +152,17 @@ async def extract_subject_function(
         logger.error(error_msg)
         raise ValueError(error_msg)
 
+    client = get_dashscope_client(dashscope_api_key, config.dashscope_base_url)
+    client.set_concurrency_limit(_MODEL_NAME, config.max_concurrency)
+    # 本地抠图与设计工具共享同一rembg会话；仅远程模式时不导入rembg等重量级依赖
+    subject_cutout = None
+    session = None
+    if config.mode != "remote":
+        subject_cutout = timed_import("..imaging.subject_cutout", "extract_subject", PHASE_IMPLEMENTATION,
+                                      package=__package__)
+        from ..utils.rembg_session import get_session
+        session = await asyncio.to_thread(get_session, config.rembg_model_name)
+
     # 提取配置参数
     extraction_instruction = config.text_instruction
     api_timeout = config.timeout
@@ -88,6 +173,7 @@ async def extract_subject_function(
     # --------------------------
     # 2. 核心工具函数（异步实现）
     # --------------------------
+    @traced_tool("extract_subject")
     async def _extract_subject(input_data: ExtractSubjectInput) -> ExtractSubjectOutput:
         """
         工具核心逻辑（nemo-agent实际调用的函数）
@@ -98,12 +184,34 @@ async def extract_subject_function(
             失败：带错误信息的字符串（便于agent后续处理）
         """
 
-        try:
-            image_url = input_data.input_data
-            logger.info(f"开始处理图片：{image_url}")
+        image_url = input_data.input_data
+        logger.info(f"开始处理图片：{image_url}")
+
+        # 本地抠图：仅在用户未要求Q版风格化（或强制本地模式）时使用
+        if config.mode == "local" or (config.mode == "auto" and not input_data.stylize):
+            stylize = bool(input_data.stylize) or config.local_stylize
+            try:
+                with span("extract_subject.local_cutout", SPAN_COMPUTE, stylize=stylize) as cutout_span:
+                    subject_ref, confidence = await subject_cutout.extract_subject_locally(image_url, session, stylize,
+                                                                                          config.stylize_colors)
+                    cutout_span.set(confidence=round(confidence, 3))
+                if config.mode == "local" or confidence >= config.min_mask_confidence:
+                    logger.info(f"本地主体提取完成（掩膜置信度{confidence:.2f}）：{subject_ref}")
+                    return ExtractSubjectOutput(input_data=subject_ref)
+                logger.info(f"本地掩膜置信度{confidence:.2f}低于{config.min_mask_confidence}，改用远程图片编辑")
+            except Exception as e:
+                if config.mode == "local":
+                    e = f"本地主体提取失败：{str(e)}"
+                    logger.exception(e)
+                    record_error(e)
+                    return ExtractSubjectOutput(input_data=e)
+                logger.warning(f"本地主体提取失败，改用远程图片编辑：{e}")
 
-            # 第一步：校验输入URL合法性
-            if not image_url.startswith(("http://", "https://")):
+        try:
+            # 第一步：校验输入URL合法性（制品引用以内联 data URI 的形式提交）
+            if is_artifact_ref(image_url):
+                image_url = _artifact_to_data_uri(image_url)
+            elif not image_url.startswith(("http://", "https://")):
                 e = f"无效图片URL：{image_url}（必须是公网HTTP/HTTPS链接）"
                 raise Exception(e)
 
@@ -117,81 +225,72 @@ async def extract_subject_function(
                     ]
                 }
             ]
-            # 第三步：异步调用API（用线程避免阻塞事件循环）
+            # 第三步：原生异步调用API（等待期间不占用线程池）
             logger.debug("正在调用Qwen-Image-Edit API...")
-            # 预先绑定参数
-            sync_call = functools.partial(
-                MultiModalConversation.call,
-                api_key=dashscope_api_key,
-                model="qwen-image-edit",  # 固定使用图片编辑模型
+            result = await client.multimodal_generation(
+                model=_MODEL_NAME,  # 固定使用图片编辑模型
                 messages=messages,
-                result_format="message",  # 结构化返回格式
-                stream=False,  # 非流式返回
-                watermark=False,  # 启用水印（可选关闭）
-                negative_prompt="背景残留、主体残缺、边缘白边、非PNG格式",  # 负向提示
-                timeout=api_timeout  # 超时控制
+                parameters={
+                    "watermark": False,  # 关闭水印
+                    "negative_prompt": "背景残留、主体残缺、边缘白边、非PNG格式",  # 负向提示
+                },
+                timeout=api_timeout,  # 超时控制
+                max_retries=config.max_retries,
+                max_queue_wait=config.max_queue_wait,
+                hedge=hedge_policy_for(_MODEL_NAME, config)
             )
 
-            # 用asyncio.to_thread包装同步API调用，避免阻塞agent事件循环
-            response = await asyncio.to_thread(sync_call)
-
         # 捕获API调用异常（网络错误、超时等）
         except asyncio.TimeoutError:
             e = f"API调用超时（超过{api_timeout}秒），请检查图片URL有效性或延长超时时间"
 
             logger.exception(e)
+            record_error(e)
+            return ExtractSubjectOutput(input_data=e)
+        except DashScopeError as e:
+            # 第四步：响应解析失败（未找到处理后的图片URL）同样以 DashScopeError 抛出
+            e = f"API调用异常：{str(e)}（请检查API密钥有效性或网络连接），request_id={e.request_id}"
+            logger.exception(e)
+            record_error(e)
             return ExtractSubjectOutput(input_data=e)
         except Exception as e:
             e = f"API调用异常：{str(e)}（请检查API密钥有效性或网络连接）"
             logger.exception(e)
+            record_error(e)
             return ExtractSubjectOutput(input_data=e)
 
-        # 第四步：解析API响应（提取处理后的图片URL）
-        try:
-            # 将DashScope响应对象转为JSON可解析格式
-            response_data = json.loads(json.dumps(response, ensure_ascii=False))
-
-            # 按API返回结构提取图片URL（通义千问标准格式）
-            output_content = response_data.get("output", {}).get("choices", [{}])[0]
-            message_content = output_content.get("message", {}).get("content", [])
-
-            # 遍历内容找到图片URL
-            processed_url = None
-            for item in message_content:
-                if isinstance(item, dict) and "image" in item:
-                    processed_url = item["image"]
-                    break
-
-            # 校验提取结果
-            if not processed_url:
-                e = "API响应解析失败：未找到处理后的图片URL（响应结构异常）"
-                logger.error(f"{e}\n原始响应：{json.dumps(response_data, indent=2)}")
-                return ExtractSubjectOutput(input_data=e)
-
-            # 成功返回URL
-            logger.info(f"图片主体提取成功！处理后URL：{processed_url}")
-            return ExtractSubjectOutput(input_data=processed_url)
-
-        except Exception as e:
-            e = f"响应解析异常：{str(e)}"
-            logger.exception(f"{e}\n原始响应：{json.dumps(response, indent=2)}")
-            return ExtractSubjectOutput(input_data=e)
+        # 成功返回URL
+        processed_url = result.image_url
+        logger.info(f"图片主体提取成功！耗时{result.latency:.1f}秒，处理后URL：{processed_url}")
+        if config.output_artifact_ref:
+            processed_url = await fetch_image_artifact(processed_url) or processed_url
+        return ExtractSubjectOutput(input_data=processed_url)
 
     # --------------------------
     # 3. 注册工具到Nemo-Agent
     # --------------------------
+    acquire_http_session()
     try:
         yield FunctionInfo.from_fn(
             _extract_subject,
             description=(
                 "【图片主体提取工具】适用于BeanBuddy-AI的图片输入路径：\n"
-                "1. 输入：公网可访问的原始图片HTTP/HTTPS URL（如用户上传图片的临时链接）；\n"
-                "2. 处理：调用Qwen-Image-Edit API自动抠图、移除背景、保留主体细节；\n"
-                "3. 输出：处理后的图片URL（PNG-24格式，含透明背景，可直接用于后续Q版风格化）。\n"
+                "1. 输入：公网可访问的原始图片HTTP/HTTPS URL（如用户上传图片的临时链接），"
+                "用户要求Q版风格化时将 stylize 设为 true；\n"
+                "2. 处理：本地rembg抠图，或调用Qwen-Image-Edit API自动抠图、移除背景、保留主体细节；\n"
+                "3. 输出：处理后的图片URL或 artifact:// 引用（PNG-24格式，含透明背景，可直接用于后续Q版风格化）。\n"
                 "⚠️  必须在用户输入为图片时优先调用（遵循 workflow 中 '图片输入路径' 规则）。"
             ),
         )
     except GeneratorExit:
         logger.warning("ExtractSubject工具生成器提前退出，正在清理资源...")
     finally:
+        await release_http_session()
         logger.info("ExtractSubject工具初始化流程结束（或已完成资源清理）")
+
+
+def _artifact_to_data_uri(ref: str) -> str:
+    """将制品引用转换为 base64 data URI，供只接受URL的图片编辑接口使用"""
+    data = get_artifact_store().get_bytes(ref)
+    image_format = sniff_image_format(data) or "png"
+    return f"data:image/{image_format.lower()};base64,{base64.b64encode(data).decode('ascii')}"
@@ -1,45 +1,135 @@
-import asyncio
-import functools
-import json
 import logging
+from typing import Optional
 
-from dashscope import MultiModalConversation
 from nat.builder.builder import Builder
 from nat.builder.function_info import FunctionInfo
 from nat.cli.register_workflow import register_function
 from nat.data_models.function import FunctionBaseConfig
+from pydantic import Field
 
 from ..models import GenerateImageFromTextInput, GenerateImageFromTextOutput
+from ..utils.dashscope_client import DashScopeClient, get_dashscope_client
+from ..utils.hedging import hedge_policy_for
+from ..utils.http_session import acquire_http_session, release_http_session
+from ..utils.image_cache import GeneratedImageCache, fetch_image_artifact, image_cache_key, prefetch_image
+from ..utils.tracing import record_cache_lookup, record_error, traced_tool
 
 logger = logging.getLogger(__name__)
 
+# 阿里云通义千问-文生图模型及生成参数
+_MODEL_NAME = "qwen-image"
+_IMAGE_SIZE = '1328*1328'
+_NEGATIVE_PROMPT = '背景残留、主体残缺、边缘白边、存在阴影'
+
 
 class GenerateImageFromTextConfig(FunctionBaseConfig, name="generate_image_from_text"):
     """
     A tool for generating images from text descriptions
     """
     # Add your custom configuration parameters here
-    pass
+    dashscope_base_url: str = Field(
+        default="",
+        description="DashScope接口地址，为空时使用环境变量 DASHSCOPE_BASE_URL 或官方地址（可指向本地桩服务测试）"
+    )
+    timeout: float = Field(
+        default=120.0,
+        description="单次文生图API调用的超时时间（秒）"
+    )
+    max_concurrency: int = Field(
+        default=4,
+        description="同一模型同时进行中的文生图请求上限，超出的请求在事件循环中排队"
+    )
+    max_retries: int = Field(
+        default=3,
+        description="遇到429/5xx或网络错误时的最大重试次数（带抖动的指数退避）"
+    )
+    max_queue_wait: Optional[float] = Field(
+        default=None,
+        description="共享限流器预计排队时间超过该秒数时直接失败（快速失败），为空时排队等待配额"
+    )
+    hedge_percentile: float = Field(
+        default=0.0,
+        ge=0.0,
+        lt=100.0,
+        description="对冲请求触发分位数（如 95）：请求耗时超过近期该分位数仍未完成时，利用空闲并发与配额发起一个重复请求，取先返回的结果；0 表示不对冲"
+    )
+    hedge_max_ratio: float = Field(
+        default=0.05,
+        ge=0.0,
+        le=1.0,
+        description="对冲请求占调用次数的上限比例（预算），控制额外的API调用费用"
+    )
+    hedge_min_samples: int = Field(
+        default=20,
+        ge=1,
+        description="近期耗时样本少于该数量时不对冲（分位数不可靠）"
+    )
+    cache_enabled: bool = Field(
+        default=True,
+        description="是否按提示词、模型、尺寸和负向提示词的哈希缓存生成结果"
+    )
+    cache_ttl: float = Field(
+        default=86400.0,
+        description="生成结果缓存的最长有效期（秒），实际有效期不超过图片URL本身的过期时间"
+    )
+    url_expiry_margin: float = Field(
+        default=600.0,
+        description="图片URL距离过期不足该秒数时视为已过期，不再从缓存返回"
+    )
+    prefetch_images: bool = Field(
+        default=True,
+        description="是否在后台将生成的图片下载到本地内容寻址存储，供后续工具直接读取而不再走网络"
+    )
+    output_artifact_ref: bool = Field(
+        default=False,
+        description="是否等待图片下载到进程内制品存储后返回 artifact:// 引用（而不是图片URL），"
+                    "后续工具无需网络I/O与重复解码；下载失败时仍返回图片URL"
+    )
 
 
 @register_function(config_type=GenerateImageFromTextConfig)
 async def generate_image_from_text_function(
         config: GenerateImageFromTextConfig, builder: Builder
 ):
+    # 获取默认配置中的api_key
+    api_key = builder.get_llm_config("default_llm").__dict__.get("api_key")
+    client = get_dashscope_client(api_key, config.dashscope_base_url)
+    client.set_concurrency_limit(_MODEL_NAME, config.max_concurrency)
+    image_cache: Optional[GeneratedImageCache] = None
+    if config.cache_enabled:
+        image_cache = GeneratedImageCache(ttl=config.cache_ttl, expiry_margin=config.url_expiry_margin)
+
     # Implement your function logic here
+    @traced_tool("generate_image_from_text")
     async def _generate_image_from_text_function(input_data: GenerateImageFromTextInput) -> GenerateImageFromTextOutput:
 
         try:
-
-            # 获取默认配置中的api_key
-            api_key = builder.get_llm_config("default_llm").__dict__.get("api_key")
-            # 调用阿里云通义千问-文生图模型生成图片
-            image_url = await _generate_image_from_text(input_data.input_data, api_key)
+            prompt = input_data.input_data
+            cache_key = image_cache_key(prompt, _MODEL_NAME, _IMAGE_SIZE, _NEGATIVE_PROMPT)
+            cached = image_cache.get(cache_key) if image_cache is not None else None
+            if image_cache is not None:
+                record_cache_lookup("generated_image", "hit" if cached is not None else "miss")
+            if cached is not None:
+                logger.info(f"文生图缓存命中（{cache_key[:12]}），直接返回已生成图片")
+                image_url = cached.url
+            else:
+                # 调用阿里云通义千问-文生图模型生成图片
+                image_url = await _generate_image_from_text(prompt, client, config)
+                if image_cache is not None:
+                    image_cache.set(cache_key, image_url)
+
+            # 返回制品引用：等待图片字节落入制品存储
+            if config.output_artifact_ref:
+                image_url = await fetch_image_artifact(image_url) or image_url
+            # 后台预取图片字节，设计工具可直接从本地读取
+            elif config.prefetch_images:
+                prefetch_image(image_url)
 
             return GenerateImageFromTextOutput(input_data=image_url)
 
         except Exception as e:
             logger.error(f"描述生成文本过程中发生错误: {str(e)}", exc_info=True)
+            record_error(e)
             # 在出现错误时提供一个安全且符合格式的默认输出
             # 默认视为文本描述，由后续工具链处理
             safe_text = str(input_data.input_data) if not isinstance(input_data.input_data,
@@ -49,6 +139,7 @@ async def generate_image_from_text_function(
                 input_data=safe_text
             )
 
+    acquire_http_session()
     try:
         yield FunctionInfo.from_fn(
             _generate_image_from_text_function,
@@ -56,10 +147,13 @@ async def generate_image_from_text_function(
     except GeneratorExit:
         logger.warning("Function exited early!")
     finally:
+        if image_cache is not None:
+            logger.info(f"文生图缓存统计：命中{image_cache.hits}次，未命中{image_cache.misses}次")
+        await release_http_session()
         logger.info("Cleaning up generate_image_from_text workflow.")
 
 
-async def _generate_image_from_text(prompt: str, api_key: str) -> str:
+async def _generate_image_from_text(prompt: str, client: DashScopeClient, config: GenerateImageFromTextConfig) -> str:
     messages = [
         {
             "role": "user",
@@ -70,42 +164,20 @@ async def _generate_image_from_text(prompt: str, api_key: str) -> str:
             ]
         }
     ]
-    try:
-
-        # 预先绑定参数
-        sync_call = functools.partial(
-            MultiModalConversation.call,
-            api_key=api_key,
-            model="qwen-image",
-            messages=messages,
-            result_format='message',
-            stream=False,
-            watermark=False,
-            prompt_extend=True,
-            negative_prompt='背景残留、主体残缺、边缘白边、存在阴影',
-            size='1328*1328'
-        )
-
-        # 使用 asyncio.to_thread 在单独线程中执行同步的API调用
-        response = await asyncio.to_thread(sync_call)
-
-        if response.status_code == 200:
-            # 提取图片链接的关键代码
-            # 注意：response 可能已经是对象，无需再 json.dumps 和 json.loads
-            # 根据实际情况调整，如果 response 是对象且支持属性访问，可直接使用 response.output.choices[0]...
-            response_data = json.loads(
-                json.dumps(response, ensure_ascii=False, default=lambda o: o.__dict__)) if hasattr(response,
-                                                                                                   '__dict__') else response
-            # 访问嵌套结构：output -> choices -> 第一个元素 -> message -> content -> 第一个元素 -> image
-            image_url = response_data['output']['choices'][0]['message']['content'][0]['image']
-            return image_url
-        else:
-            raise Exception(f"HTTP返回码：{response.status_code}\n"
-                            f"错误码：{response.code}\n"
-                            f"错误信息：{response.message}")
-    except KeyError as e:
-        raise Exception(f"在解析JSON时出错，未能找到预期的键: {e}")
-    except IndexError as e:
-        raise Exception(f"在访问列表时出错，可能列表为空: {e}")
-    except Exception as e:
-        raise Exception(f"发生未知错误: {e}")
+    # 原生异步调用，等待期间不占用线程池
+    result = await client.multimodal_generation(
+        model=_MODEL_NAME,
+        messages=messages,
+        parameters={
+            "watermark": False,
+            "prompt_extend": True,
+            "negative_prompt": _NEGATIVE_PROMPT,
+            "size": _IMAGE_SIZE,
+        },
+        timeout=config.timeout,
+        max_retries=config.max_retries,
+        max_queue_wait=config.max_queue_wait,
+        hedge=hedge_policy_for(_MODEL_NAME, config)
+    )
+    logger.info(f"文生图完成，耗时{result.latency:.1f}秒（尝试{result.attempts}次），request_id={result.request_id}")
+    return result.image_url
@@ -1,6 +1,7 @@
+import asyncio
 import logging
+from typing import Optional
 
-import aiohttp
 from nat.builder.builder import Builder
 from nat.builder.framework_enum import LLMFrameworkEnum
 from nat.builder.function_info import FunctionInfo
@@ -10,6 +11,15 @@ from nat.data_models.function import FunctionBaseConfig
 from pydantic import Field
 
 from ..models import InputType, IdentifyInputTypeInput, IdentifyInputTypeOutput
+from ..utils.artifact_store import is_artifact_ref
+from ..utils.http_session import acquire_http_session, release_http_session
+from ..utils.image_cache import resolve_local_image
+from ..utils.image_ingest import ingest_data_uri, is_data_uri
+from ..utils.image_probe import check_image_async
+from ..utils.rate_limiter import get_llm_rate_limiter, rate_limited, response_total_tokens
+from ..utils.response_cache import estimate_tokens
+from ..utils.tracing import (SPAN_LLM, llm_model_name, record_cache_lookup, record_error, record_llm_usage, span,
+                             traced_tool)
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +33,18 @@ class IdentifyInputTypeConfig(FunctionBaseConfig, name="identify_input_type"):
         default=True,
         description="是否启用高级文本分析（如LLM）来更准确地区分实体名称和文本描述"
     )
+    image_probe_timeout: float = Field(
+        default=5.0,
+        description="探测URL是否为图片的网络超时时间（秒）"
+    )
+    image_probe_cache_ttl: float = Field(
+        default=600.0,
+        description="URL图片探测结论的缓存时间（秒），后续工具可直接复用该结论"
+    )
+    max_queue_wait: Optional[float] = Field(
+        default=None,
+        description="共享限流器预计排队时间超过该秒数时直接失败（快速失败），为空时排队等待配额"
+    )
     llm_name: LLMRef = Field(description="The LLM to use for generating responses.")
 
 
@@ -37,6 +59,7 @@ async def identify_input_type_function(
     """
 
     # Implement your function logic here
+    @traced_tool("identify_input_type")
     async def _identify_input_type_function(input_data: IdentifyInputTypeInput) -> IdentifyInputTypeOutput:
         """
         核心识别逻辑
@@ -56,8 +79,21 @@ async def identify_input_type_function(
         raw_input = input_data.input_data
 
         try:
+            # 内联图片（data URI）写入制品存储，后续工具只传递 artifact:// 引用
+            if is_data_uri(raw_input):
+                ref = await asyncio.to_thread(ingest_data_uri, raw_input)
+                return IdentifyInputTypeOutput(input_data=ref, input_type=InputType.IMAGE)
+            # 制品引用及已下载到本地的图片URL无需网络探测
+            if is_artifact_ref(raw_input) or raw_input.startswith(("http://", "https://")):
+                local_ref = resolve_local_image(raw_input)
+                if not is_artifact_ref(raw_input):
+                    record_cache_lookup("local_image", "hit" if local_ref is not None else "miss")
+                if local_ref is not None:
+                    return IdentifyInputTypeOutput(input_data=input_data.input_data, input_type=InputType.IMAGE)
             if raw_input.startswith("http://") or raw_input.startswith("https://"):
-                validate_content_type = await check_image_async(raw_input)
+                validate_content_type = await check_image_async(raw_input,
+                                                                timeout=config.image_probe_timeout,
+                                                                cache_ttl=config.image_probe_cache_ttl)
                 if validate_content_type:
                     return IdentifyInputTypeOutput(input_data=input_data.input_data, input_type=InputType.IMAGE)
 
@@ -76,7 +112,11 @@ async def identify_input_type_function(
 
         except Exception as e:
             safe_text = str(raw_input) if not isinstance(raw_input, bytes) else "binary_data_input"
+            if is_data_uri(safe_text):
+                # 无效或超限的内联图片不写入日志与输出
+                safe_text = "data_uri_input"
             logger.error(f"{safe_text}: 输入识别过程中发生错误: {str(e)}", exc_info=True)
+            record_error(e)
             # 在出现错误时提供一个安全且符合格式的默认输出
             # 默认视为文本描述，由后续工具链处理
 
@@ -85,6 +125,8 @@ async def identify_input_type_function(
                 input_type=InputType.TEXT_DESCRIPTION
             )
 
+    # 共享的连接池会话由工作流统一持有，工作流结束时释放
+    acquire_http_session()
     try:
         yield FunctionInfo.from_fn(
             _identify_input_type_function,
@@ -92,32 +134,10 @@ async def identify_input_type_function(
     except GeneratorExit:
         logger.warning("Function exited early!")
     finally:
+        await release_http_session()
         logger.info("Cleaning up identify_input_type workflow.")
 
 
-async def check_image_async(url):
-    magic_numbers = {
-        b'\xFF\xD8\xFF': 'JPEG',
-        b'\x89PNG\r\n\x1a\n': 'PNG',
-        b'GIF87a': 'GIF',
-        b'GIF89a': 'GIF',
-        b'RIFF': 'WEBP',
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.head(url) as response:
-            content_type = response.headers.get('Content-Type')
-            if content_type.startswith('image/'):
-                return True
-
-            # 第二重校验：魔术数字（异步读取前4字节）
-            header = await response.content.read(4)  # 异步读取操作
-            for magic, img_type in magic_numbers.items():
-                if header.startswith(magic):
-                    return True
-
-    return False
-
-
 async def _analyze_image_input(image_data: bytes) -> str:
     """分析图像输入，返回图像类型、置信度和推理原因"""
     # 实现图像格式检测和简单内容分析
@@ -201,10 +221,19 @@ async def _validate_entity(entity_name: str, config: IdentifyInputTypeConfig, bu
     """
     # 调用LLM并获取响应
     try:
-        response = await llm.ainvoke(prompt)
+        # 只需回答"是"或"否"，回答部分按几个token预扣
+        llm_config = builder.get_llm_config(config.llm_name)
+        model = llm_model_name(llm_config)
+        async with rate_limited(get_llm_rate_limiter(llm_config),
+                                estimate_tokens(prompt) + 4, config.max_queue_wait) as reservation:
+            with span("identify_input_type.llm", SPAN_LLM, model=model) as llm_span:
+                response = await llm.ainvoke(prompt)
+                reservation.record_tokens(response_total_tokens(response))
+                record_llm_usage(llm_span, model, response)
         # 清理和解析响应，去除可能的首尾空格或换行，进行小写比较以确保鲁棒性
         return response.content == "是"
     except Exception as e:
         # 异常处理：如果LLM调用失败，记录错误并默认返回False，避免阻塞主流程
         logger.error(f"在验证实体 '{entity_name}' 时调用LLM失败: {str(e)}")
+        record_error(e)
         return False
@@ -1,4 +1,6 @@
 import logging
+from datetime import datetime
+from typing import Optional
 
 from nat.builder.builder import Builder
 from nat.builder.framework_enum import LLMFrameworkEnum
@@ -9,9 +11,18 @@ from nat.data_models.function import FunctionBaseConfig
 from pydantic import Field
 
 from ..models import QueryKnowledgeGraphInput, QueryKnowledgeGraphOutput
+from ..utils.entity_store import EntityRecord, EntityStore, SOURCE_LLM, get_entity_store, normalize_alias
+from ..utils.llm_stream import stream_llm_text
+from ..utils.rate_limiter import get_llm_rate_limiter, rate_limited, response_total_tokens
+from ..utils.response_cache import estimate_tokens
+from ..utils.tracing import (SPAN_LLM, llm_model_name, record_cache_lookup, record_error, record_llm_usage, span,
+                             traced_tool)
 
 logger = logging.getLogger(__name__)
 
+# 回答的预估token数（用于限流预扣，调用完成后按实际用量修正）
+_EXPECTED_OUTPUT_TOKENS = 300
+
 
 class QueryKnowledgeGraphConfig(FunctionBaseConfig, name="query_knowledge_graph"):
     """
@@ -19,6 +30,34 @@ class QueryKnowledgeGraphConfig(FunctionBaseConfig, name="query_knowledge_graph"
     """
     # Add your custom configuration parameters here
     llm_name: LLMRef = Field(description="The LLM to use for generating responses.")
+    enable_local_store: bool = Field(
+        default=True,
+        description="是否优先查询本地实体特征库，未命中时才调用LLM"
+    )
+    entity_db_path: str = Field(
+        default="",
+        description="本地实体特征库（SQLite）路径，默认位于数据目录下的 knowledge_graph.db"
+    )
+    seed_file: str = Field(
+        default="",
+        description="精选实体种子数据文件（JSON），默认使用 configs/entities.json"
+    )
+    enable_fuzzy_match: bool = Field(
+        default=True,
+        description="精确别名未命中时，是否使用trigram索引进行模糊匹配（仅接受与查询高度重合的别名）"
+    )
+    stream_output: bool = Field(
+        default=True,
+        description="是否以流式方式调用LLM，并通过中间步骤实时推送生成进度"
+    )
+    write_back: bool = Field(
+        default=True,
+        description="是否将LLM生成的实体特征回写到本地特征库（记录模型来源）"
+    )
+    max_queue_wait: Optional[float] = Field(
+        default=None,
+        description="共享限流器预计排队时间超过该秒数时直接失败（快速失败），为空时排队等待配额"
+    )
 
 
 @register_function(config_type=QueryKnowledgeGraphConfig, framework_wrappers=[LLMFrameworkEnum.LANGCHAIN])
@@ -30,13 +69,18 @@ async def query_knowledge_graph_function(
     严格遵循工作流规则：根据用户输入的主体名称，返回文本增强后的主体特征
     返回类型标识，由ReAct Agent根据结果进行路由决策
     """
+    store: Optional[EntityStore] = None
+    if config.enable_local_store:
+        store = get_entity_store(config.entity_db_path, config.seed_file)
+        logger.info(f"本地实体特征库已就绪: {store.db_path} {store.stats()}")
 
+    @traced_tool("query_knowledge_graph")
     async def _query_knowledge_graph_function(input_data: QueryKnowledgeGraphInput) -> QueryKnowledgeGraphOutput:
 
         try:
             subject_name = input_data.input_data.strip()
             # 根据主体名称获取的增强后的主体特征
-            entity_features = await _generate_entity_features(subject_name, config, builder)
+            entity_features = await _query_entity_features(subject_name, store, config, builder)
             processed_text = (f"一个可爱的Q版{subject_name}形象\n"
                               f"1.  **主体**：{entity_features.replace('\n', '; ')}，排除背景杂物。\n"
                               "2.  **风格**：卡通渲染，色彩明亮且区块化，线条简洁清晰。\n"
@@ -51,6 +95,7 @@ async def query_knowledge_graph_function(
 
         except Exception as e:
             logger.error(f"描述增强过程中发生错误: {str(e)}", exc_info=True)
+            record_error(e)
             # 在出现错误时提供一个安全且符合格式的默认输出
             # 默认视为文本描述，由后续工具链处理
             safe_text = str(input_data.input_data) if not isinstance(input_data.input_data,
@@ -70,6 +115,47 @@ async def query_knowledge_graph_function(
         logger.info("Cleaning up query_knowledge_graph workflow.")
 
 
+async def _query_entity_features(subject_name: str, store: Optional[EntityStore],
+                                 config: QueryKnowledgeGraphConfig, builder: Builder) -> str:
+    """查询实体特征：本地特征库命中直接返回，未命中时调用LLM生成并回写"""
+    if store is not None:
+        record = store.lookup(subject_name)
+        if record is None and config.enable_fuzzy_match:
+            record = _fuzzy_lookup(store, subject_name)
+        record_cache_lookup("entity_store", "hit" if record is not None else "miss")
+        if record is not None:
+            logger.info(f"本地特征库命中 '{subject_name}' -> '{record.name}'（来源：{record.source}）")
+            return record.features
+
+    entity_features = await _generate_entity_features(subject_name, config, builder)
+
+    # LLM调用失败时返回的是主体名称本身，不回写
+    if store is not None and config.write_back and entity_features and entity_features != subject_name:
+        model_name = llm_model_name(builder.get_llm_config(config.llm_name))
+        try:
+            store.upsert(EntityRecord(name=subject_name,
+                                      features=entity_features,
+                                      source=SOURCE_LLM,
+                                      provenance=f"{model_name}@{datetime.now().isoformat(timespec='seconds')}"),
+                         overwrite=False)
+        except Exception as e:
+            logger.warning(f"回写实体特征 '{subject_name}' 失败: {str(e)}")
+    return entity_features
+
+
+def _fuzzy_lookup(store: EntityStore, subject_name: str) -> Optional[EntityRecord]:
+    """模糊匹配：候选别名与查询互相包含且长度接近时才视为同一实体，避免误命中"""
+    query = normalize_alias(subject_name)
+    for record in store.search(subject_name, limit=5):
+        for alias in (record.name, *record.aliases):
+            alias_norm = normalize_alias(alias)
+            if not alias_norm or (query not in alias_norm and alias_norm not in query):
+                continue
+            if min(len(query), len(alias_norm)) / max(len(query), len(alias_norm)) >= 0.75:
+                return record
+    return None
+
+
 async def _generate_entity_features(subject_name: str, config: QueryKnowledgeGraphConfig, builder: Builder) -> str:
     prompt = f"""
     你是一个专业的角色形象设计助手，擅长根据简单的主体名称，生成丰富、具体且富有表现力的特征描述。
@@ -101,10 +187,24 @@ async def _generate_entity_features(subject_name: str, config: QueryKnowledgeGra
     # 调用LLM并获取响应
     try:
         llm = await builder.get_llm(config.llm_name, wrapper_type=LLMFrameworkEnum.LANGCHAIN)
-        response = await llm.ainvoke(prompt)
-        # 清理和解析响应，去除可能的首尾空格或换行，进行小写比较以确保鲁棒性
-        return response.content
+        llm_config = builder.get_llm_config(config.llm_name)
+        model = llm_model_name(llm_config)
+        async with rate_limited(get_llm_rate_limiter(llm_config), estimate_tokens(prompt) + _EXPECTED_OUTPUT_TOKENS,
+                                config.max_queue_wait) as reservation:
+            with span("query_knowledge_graph.llm", SPAN_LLM, model=model, stream=config.stream_output) as llm_span:
+                if config.stream_output:
+                    text = await stream_llm_text(llm, prompt, step_name="query_knowledge_graph")
+                    reservation.record_tokens(estimate_tokens(prompt) + estimate_tokens(text))
+                    record_llm_usage(llm_span, model, input_tokens=estimate_tokens(prompt),
+                                     output_tokens=estimate_tokens(text))
+                    return text
+                response = await llm.ainvoke(prompt)
+                reservation.record_tokens(response_total_tokens(response))
+                record_llm_usage(llm_span, model, response)
+                # 清理和解析响应，去除可能的首尾空格或换行，进行小写比较以确保鲁棒性
+                return response.content
     except Exception as e:
         # 异常处理：如果LLM调用失败，记录错误并默认返回False，避免阻塞主流程
         logger.error(f"在查询主体特征 '{subject_name}' 时调用LLM失败: {str(e)}")
+        record_error(e)
         return subject_name
@@ -1,6 +1,25 @@
-from . import enhance_description
-from . import extract_subject
-from . import generate_bean_buddy_design
-from . import generate_image_from_text
-from . import identify_input_type
-from . import query_knowledge_graph
+# flake8: noqa
+# 注册模块只包含配置类与注册函数；cv2、rembg（onnxruntime）、numpy、PIL 等重量级依赖
+# 放在各工具的实现模块中，工具首次构建时才导入，导入耗时可通过
+# python -m beanbuddy_ai.utils.import_timing [--implementations] 查看
+import logging
+
+from ..utils.import_timing import PHASE_REGISTER, format_import_report, timed_import
+
+# 工具名称 -> 实现模块（相对本包，工具首次构建时导入）
+IMPLEMENTATION_MODULES = {
+    "extract_subject": "..imaging.subject_cutout",
+    "generate_bean_buddy_design": "..imaging.bead_design",
+}
+
+# NAT 框架本身的导入开销单独统计，避免计入第一个工具
+timed_import("nat.cli.register_workflow", "nat", PHASE_REGISTER)
+for _tool in ("enhance_description",
+              "extract_subject",
+              "generate_bean_buddy_design",
+              "generate_image_from_text",
+              "identify_input_type",
+              "query_knowledge_graph"):
+    timed_import(f".{_tool}", _tool, PHASE_REGISTER, package=__package__)
+
+logging.getLogger(__name__).debug(f"工具注册模块导入耗时：\n{format_import_report()}")
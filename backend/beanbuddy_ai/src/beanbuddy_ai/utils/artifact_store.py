@@ -0,0 +1,298 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .blob_store import BlobStore, get_blob_store
+
+logger = logging.getLogger(__name__)
+
+# 工具之间传递的制品引用前缀：artifact://<sha256>
+ARTIFACT_SCHEME = "artifact://"
+
+
+def is_artifact_ref(value: str) -> bool:
+    return isinstance(value, str) and value.startswith(ARTIFACT_SCHEME)
+
+
+def artifact_digest(ref: str) -> str:
+    return ref[len(ARTIFACT_SCHEME):]
+
+
+def _estimate_size(obj: Any) -> int:
+    """估算解码对象占用的内存（numpy 数组 / PIL 图像 / 字节）"""
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if hasattr(obj, "size") and hasattr(obj, "getbands"):
+        width, height = obj.size
+        return width * height * len(obj.getbands())
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    return 0
+
+
+@dataclass
+class _Artifact:
+    data: Optional[bytes]
+    media_type: str
+    created_at: float
+    last_access: float
+    # 解码结果缓存：类型标识（如 "rgba"、"rembg:isnet-general-use"）-> 对象
+    decoded: Dict[str, Any] = field(default_factory=dict)
+    decoded_bytes: int = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return (len(self.data) if self.data is not None else 0) + self.decoded_bytes
+
+
+class ArtifactStore:
+    """
+    进程内制品存储（内容寻址）
+    - 内存中保存原始字节与解码结果（PIL 图像 / numpy 数组），同一图片在工具间传递时无需网络I/O与重复解码
+    - 内存超出上限时按LRU将原始字节溢出到磁盘（解码结果直接丢弃），过期条目按TTL淘汰
+    - 磁盘溢出区按间隔清理：先删除超过 disk_ttl 的文件，再按修改时间删除最旧文件直到不超过上限
+    - persist 写入的制品（上传图片、队列任务输入）单独存放，只按 persist_ttl 过期，不受溢出区容量清理影响，
+      排队中的任务不会在被领取前丢失输入
+    - 锁内只挑选淘汰条目，溢出写盘与磁盘清理在锁外执行，读写不会排在磁盘I/O之后
+    """
+
+    def __init__(self,
+                 spill_store: BlobStore,
+                 persist_store: Optional[BlobStore] = None,
+                 max_memory_bytes: int = 512 * 1024 * 1024,
+                 max_disk_bytes: int = 4 * 1024 * 1024 * 1024,
+                 ttl: float = 6 * 3600.0,
+                 disk_ttl: float = 24 * 3600.0,
+                 persist_ttl: float = 7 * 86400.0,
+                 gc_interval: float = 60.0):
+        self.spill_store = spill_store
+        self.persist_store = persist_store or spill_store
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.disk_ttl = disk_ttl
+        self.persist_ttl = persist_ttl
+        self.gc_interval = gc_interval
+        self._last_gc = 0.0
+        self._items: "OrderedDict[str, _Artifact]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        # 正在写入磁盘溢出区的条目：摘要 -> 原始字节（写盘完成前仍可读取）
+        self._spilling: Dict[str, bytes] = {}
+        # 同一时间只有一个线程清理磁盘溢出区
+        self._gc_lock = threading.Lock()
+
+    # --------------------------
+    # 写入
+    # --------------------------
+    def put_bytes(self, data: bytes, media_type: str = "") -> str:
+        """写入原始字节，返回 artifact:// 引用（相同内容返回同一引用）"""
+        digest = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self._lock:
+            item = self._items.get(digest)
+            if item is None:
+                item = _Artifact(data=data, media_type=media_type, created_at=now, last_access=now)
+                self._items[digest] = item
+                self._memory_bytes += len(data)
+            elif item.data is None:
+                item.data = data
+                self._memory_bytes += len(data)
+            item.last_access = now
+            self._items.move_to_end(digest)
+            victims = self._evict()
+        self._spill(victims)
+        return f"{ARTIFACT_SCHEME}{digest}"
+
+    def put_decoded(self, ref: str, kind: str, obj: Any) -> None:
+        """登记某一制品的解码结果"""
+        digest = artifact_digest(ref)
+        with self._lock:
+            item = self._items.get(digest)
+            if item is None:
+                return
+            size = _estimate_size(obj)
+            previous = item.decoded.get(kind)
+            if previous is not None:
+                item.decoded_bytes -= _estimate_size(previous)
+                self._memory_bytes -= _estimate_size(previous)
+            item.decoded[kind] = obj
+            item.decoded_bytes += size
+            self._memory_bytes += size
+            victims = self._evict()
+        self._spill(victims)
+
+    def persist(self, ref: str) -> None:
+        """
+        将制品原始字节写入持久区，共享数据目录的其他进程（如设计工作进程）即可通过同一引用读取
+        持久区的文件只按 persist_ttl（从最近一次 persist 起算）过期
+        """
+        digest = artifact_digest(ref)
+        if self.persist_store.has(digest):
+            # 重新登记的制品从现在起重新计算保留时长
+            os.utime(self.persist_store.path(digest))
+        else:
+            self.persist_store.put(self.get_bytes(ref))
+        self.maybe_gc_disk()
+
+    # --------------------------
+    # 读取
+    # --------------------------
+    def has(self, ref: str) -> bool:
+        digest = artifact_digest(ref)
+        with self._lock:
+            if digest in self._items and not self._expired(self._items[digest]) or digest in self._spilling:
+                return True
+        return self.spill_store.has(digest) or self.persist_store.has(digest)
+
+    def get_bytes(self, ref: str) -> bytes:
+        """读取原始字节（内存优先，其次磁盘溢出区），不存在时抛出 KeyError"""
+        digest = artifact_digest(ref)
+        with self._lock:
+            item = self._items.get(digest)
+            if item is not None and self._expired(item):
+                self._drop(digest)
+                item = None
+            if item is not None:
+                item.last_access = time.time()
+                self._items.move_to_end(digest)
+                if item.data is not None:
+                    return item.data
+            pending = self._spilling.get(digest)
+            if pending is not None:
+                return pending
+        data = self.spill_store.get(digest)
+        if data is None and self.persist_store is not self.spill_store:
+            data = self.persist_store.get(digest)
+        if data is None:
+            raise KeyError(f"制品不存在或已过期: {ref}")
+        # 重新载入内存，便于后续工具复用
+        self.put_bytes(data, item.media_type if item is not None else "")
+        return data
+
+    def get_decoded(self, ref: str, kind: str, decoder: Optional[Callable[[bytes], Any]] = None) -> Any:
+        """
+        读取解码结果，未缓存时用 decoder 解码原始字节并缓存
+        decoder 为空且未缓存时返回 None
+        """
+        digest = artifact_digest(ref)
+        with self._lock:
+            item = self._items.get(digest)
+            if item is not None and kind in item.decoded:
+                item.last_access = time.time()
+                self._items.move_to_end(digest)
+                return item.decoded[kind]
+        if decoder is None:
+            return None
+        obj = decoder(self.get_bytes(ref))
+        self.put_decoded(ref, kind, obj)
+        return obj
+
+    # --------------------------
+    # 淘汰
+    # --------------------------
+    def _expired(self, item: _Artifact) -> bool:
+        return item.last_access + self.ttl < time.time()
+
+    def _drop(self, digest: str) -> None:
+        item = self._items.pop(digest)
+        self._memory_bytes -= item.memory_bytes
+
+    def _evict(self) -> List[Tuple[str, bytes]]:
+        """在锁内调用：移除过期与超出内存上限的条目，返回需要写入磁盘溢出区的 (摘要, 原始字节)"""
+        # 1. 过期条目（按最近访问排序，遇到未过期的即可停止）
+        while self._items:
+            digest, item = next(iter(self._items.items()))
+            if not self._expired(item):
+                break
+            self._drop(digest)
+        # 2. 超出内存上限时，从最久未访问的条目开始溢出到磁盘（由调用方在锁外写盘）
+        victims = []
+        for digest in list(self._items.keys()):
+            if self._memory_bytes <= self.max_memory_bytes:
+                break
+            item = self._items[digest]
+            if item.data is not None:
+                victims.append((digest, item.data))
+                self._spilling[digest] = item.data
+            self._drop(digest)
+        return victims
+
+    def _spill(self, victims: List[Tuple[str, bytes]]) -> None:
+        """在锁外将淘汰条目写入磁盘溢出区，写完后按间隔清理磁盘"""
+        if not victims:
+            return
+        for digest, data in victims:
+            try:
+                self.spill_store.put(data)
+            finally:
+                with self._lock:
+                    if self._spilling.get(digest) is data:
+                        del self._spilling[digest]
+        self.maybe_gc_disk()
+
+    def maybe_gc_disk(self) -> None:
+        """距上次清理超过 gc_interval 时清理磁盘（遍历目录的开销不随每次溢出发生）"""
+        if time.monotonic() - self._last_gc >= self.gc_interval:
+            self.gc_disk()
+
+    def gc_disk(self) -> Tuple[int, int]:
+        """
+        清理磁盘：溢出区删除超过 disk_ttl 的文件，再从最旧的文件开始删除直到总大小不超过 max_disk_bytes；
+        持久区只删除超过 persist_ttl 的文件。返回 (删除数, 剩余溢出区字节)
+        """
+        if not self._gc_lock.acquire(blocking=False):
+            return 0, 0
+        try:
+            self._last_gc = time.monotonic()
+            removed, total = self._sweep(self.spill_store, self.disk_ttl, self.max_disk_bytes)
+            if self.persist_store is not self.spill_store:
+                removed += self._sweep(self.persist_store, self.persist_ttl, None)[0]
+            if removed:
+                logger.info(f"制品磁盘区已清理{removed}个文件，溢出区剩余 {total} 字节")
+            return removed, total
+        finally:
+            self._gc_lock.release()
+
+    @staticmethod
+    def _sweep(store: BlobStore, max_age: float, max_bytes: Optional[int]) -> Tuple[int, int]:
+        cutoff = time.time() - max_age
+        files = []
+        for path in store.root.glob("*/*"):
+            if path.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if mtime >= cutoff and (max_bytes is None or total <= max_bytes):
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed, total
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"items": len(self._items), "memory_bytes": self._memory_bytes}
+
+
+_store: Optional[ArtifactStore] = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """获取进程内共享的制品存储"""
+    global _store
+    if _store is None:
+        _store = ArtifactStore(get_blob_store("artifacts"), get_blob_store("artifacts_persisted"))
+    return _store
@@ -0,0 +1,63 @@
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from .paths import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """
+    本地内容寻址存储：以 sha256 摘要为文件名，按前两位分片存放
+    写入先落临时文件再原子重命名，相同内容只保存一份
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def has(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def put(self, data: bytes) -> str:
+        """写入内容，返回 sha256 摘要"""
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.path(digest)
+        if target.exists():
+            return digest
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        try:
+            return self.path(digest).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, digest: str) -> None:
+        self.path(digest).unlink(missing_ok=True)
+
+
+_stores: Dict[str, BlobStore] = {}
+
+
+def get_blob_store(name: str = "blobs") -> BlobStore:
+    """获取数据目录下指定名称的内容寻址存储"""
+    if name not in _stores:
+        _stores[name] = BlobStore(get_data_dir(name))
+    return _stores[name]
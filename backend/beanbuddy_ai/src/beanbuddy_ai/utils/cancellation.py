@@ -0,0 +1,76 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+from .metrics import counter
+
+# 检查点发现请求已取消、跳过后续阶段的次数（按检查点所在阶段）
+CANCELLED_WORK = counter("beanbuddy_cancelled_work_total", "请求取消（客户端断开等）后在检查点停止的后台工作（按阶段）",
+                         ("stage",))
+
+
+class OperationCancelled(Exception):
+    """后台线程 / 工作进程在检查点发现所属请求已取消"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"已取消（{stage}）")
+        self.stage = stage
+
+
+class CancellationToken:
+    """跨线程的取消标记：事件循环中的请求被取消时置位，线程中的 CPU 密集工作在阶段之间检查"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self, stage: str) -> None:
+        if self._event.is_set():
+            CANCELLED_WORK.inc(stage=stage)
+            raise OperationCancelled(stage)
+
+
+_current_token: ContextVar[Optional[CancellationToken]] = ContextVar("beanbuddy_cancellation_token", default=None)
+
+
+def check_cancelled(stage: str) -> None:
+    """检查点：当前工作所属的请求已取消时抛出 OperationCancelled，不在可取消的上下文中时不做任何事"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled(stage)
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken) -> Iterator[CancellationToken]:
+    """在代码块内使用指定的取消标记（如设计工作进程在任务被取消时置位）"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+async def run_cancellable(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    在线程池中执行函数（同 asyncio.to_thread，继承当前上下文）
+    等待被取消时（客户端断开、对冲 / 投机分支被放弃）置位取消标记，线程中的检查点随即停止后续阶段
+    """
+    token = CancellationToken()
+    context = contextvars.copy_context()
+    context.run(_current_token.set, token)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
+    except asyncio.CancelledError:
+        token.cancel()
+        raise
@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from .hedging import HedgePolicy, run_hedged
+from .http_session import get_http_session
+from .metrics import gauge
+from .rate_limiter import RateLimitExceeded, get_rate_limiter, provider_of
+from .tracing import QUEUE_WAIT, SPAN_HTTP, span
+
+logger = logging.getLogger(__name__)
+
+# 默认服务地址，可通过环境变量 DASHSCOPE_BASE_URL 或参数指向本地桩服务
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
+# 多模态生成（qwen-image / qwen-image-edit）接口
+MULTIMODAL_GENERATION_PATH = "/services/aigc/multimodal-generation/generation"
+
+# 网络异常或超时（无HTTP响应）时使用的状态码
+NETWORK_ERROR_STATUS = 599
+# 需要退避重试的状态码
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504, NETWORK_ERROR_STATUS}
+
+_WAITING = gauge("beanbuddy_dashscope_waiting", "等待 DashScope 并发槽位的请求数", ("model",))
+_IN_FLIGHT = gauge("beanbuddy_dashscope_in_flight", "正在执行的 DashScope 请求数", ("model",))
+
+
+class DashScopeError(Exception):
+    """DashScope 接口调用失败"""
+
+    def __init__(self, status: int, code: str = "", message: str = "", request_id: str = ""):
+        self.status = status
+        self.code = code
+        self.message = message
+        self.request_id = request_id
+        super().__init__(f"HTTP返回码：{status}\n"
+                         f"错误码：{code}\n"
+                         f"错误信息：{message}")
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in _RETRYABLE_STATUS
+
+
+@dataclass
+class DashScopeImageResult:
+    """多模态生成接口的统一解析结果"""
+    image_url: str
+    request_id: str = ""
+    usage: Dict[str, Any] = field(default_factory=dict)
+    # 含重试在内的总耗时（秒）
+    latency: float = 0.0
+    attempts: int = 1
+
+
+def parse_image_result(data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """
+    解析多模态生成接口响应：output -> choices[0] -> message -> content 中第一个 image
+    返回 (图片URL, usage)
+    """
+    try:
+        choices = data["output"]["choices"]
+        content = choices[0]["message"]["content"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise DashScopeError(200, "InvalidResponse", f"在解析响应时出错，未能找到预期的字段: {e}",
+                             data.get("request_id", "") if isinstance(data, dict) else "")
+    for item in content:
+        if isinstance(item, dict) and item.get("image"):
+            return item["image"], data.get("usage") or {}
+    raise DashScopeError(200, "InvalidResponse", "响应中未找到图片URL", data.get("request_id", ""))
+
+
+class DashScopeClient:
+    """
+    基于共享 aiohttp 连接池的 DashScope 异步客户端
+    - 每个接口（路径+模型）独立的并发信号量，避免某一模型的长请求占满全部并发
+    - 429/5xx 与网络错误按带抖动的指数退避重试，优先遵循 Retry-After
+    - 每次请求（含重试）先向进程内共享的模型限流器申请配额，429 时通知限流器暂停放行
+    - 不占用线程池：请求等待期间只占用事件循环中的一个协程
+    """
+
+    def __init__(self,
+                 api_key: str,
+                 base_url: str = "",
+                 max_concurrency: int = 4,
+                 max_retries: int = 3,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 20.0):
+        self.api_key = api_key
+        self.base_url = (base_url or os.getenv("DASHSCOPE_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # 模型 -> 并发上限（未设置时使用 max_concurrency）
+        self._limits: Dict[str, int] = {}
+        # (事件循环, 接口) -> 信号量（信号量绑定事件循环）
+        self._semaphores: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Semaphore] = {}
+        # 模型 -> [请求次数, 并发排队总秒数, 最长排队秒数]
+        self._queue_stats: Dict[str, List[float]] = {}
+
+    def set_concurrency_limit(self, model: str, limit: int) -> None:
+        """设置某一模型接口的并发上限（需在该模型首次调用前设置）"""
+        self._limits[model] = max(1, limit)
+
+    def _semaphore(self, endpoint: str, model: str) -> asyncio.Semaphore:
+        key = (asyncio.get_running_loop(), endpoint)
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self._limits.get(model, self.max_concurrency))
+        return self._semaphores[key]
+
+    def _retry_after_seconds(self, retry_after: Optional[str]) -> Optional[float]:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return None
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        seconds = self._retry_after_seconds(retry_after)
+        if seconds is not None:
+            return seconds
+        # full jitter：在 [0, base * 2^attempt] 内随机等待
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record_queue_wait(self, model: str, waited: float) -> None:
+        stats = self._queue_stats.setdefault(model, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += waited
+        stats[2] = max(stats[2], waited)
+        QUEUE_WAIT.observe(waited, queue=f"dashscope/{model}")
+
+    async def multimodal_generation(self,
+                                    model: str,
+                                    messages: List[Dict[str, Any]],
+                                    parameters: Optional[Dict[str, Any]] = None,
+                                    timeout: float = 120.0,
+                                    max_retries: Optional[int] = None,
+                                    max_queue_wait: Optional[float] = None,
+                                    hedge: Optional[HedgePolicy] = None) -> DashScopeImageResult:
+        """
+        调用多模态生成接口（文生图 / 图片编辑），返回第一张生成图片
+        max_retries 为空时使用客户端默认值；预计限流排队时间超过 max_queue_wait 秒时直接失败
+        hedge 不为空时按对冲策略在慢请求上发起一个重复请求（不重试、不排队），取先成功的结果
+        """
+        payload = {
+            "model": model,
+            "input": {"messages": messages},
+            "parameters": parameters or {},
+        }
+        endpoint = f"{MULTIMODAL_GENERATION_PATH}:{model}"
+        limiter = get_rate_limiter(provider_of(self.base_url), model)
+
+        def _post(hedged: bool):
+            if hedged:
+                return self._post(MULTIMODAL_GENERATION_PATH, model, payload, timeout, 0, 0)
+            return self._post(MULTIMODAL_GENERATION_PATH, model, payload, timeout,
+                              self.max_retries if max_retries is None else max_retries, max_queue_wait)
+
+        def _has_capacity() -> bool:
+            # 对冲请求只使用空闲容量：并发槽位已满或限流器需要排队时不发起
+            return (not self._semaphore(endpoint, model).locked()
+                    and (limiter is None or limiter.estimate_wait() == 0))
+
+        started = time.monotonic()
+        with span(f"dashscope.{model}", SPAN_HTTP, model=model) as call_span:
+            try:
+                (data, attempts), hedge_won = await run_hedged(hedge, _post, _has_capacity)
+            except DashScopeError as e:
+                call_span.set(status_code=e.status, request_id=e.request_id)
+                raise
+            call_span.set(status_code=200, attempts=attempts, request_id=data.get("request_id", ""))
+            if hedge is not None:
+                call_span.set(hedge_won=hedge_won)
+            image_url, usage = parse_image_result(data)
+        return DashScopeImageResult(image_url=image_url,
+                                    request_id=data.get("request_id", ""),
+                                    usage=usage,
+                                    latency=time.monotonic() - started,
+                                    attempts=attempts)
+
+    async def _post(self, path: str, model: str, payload: Dict[str, Any],
+                    timeout: float, max_retries: int,
+                    max_queue_wait: Optional[float] = None) -> Tuple[Dict[str, Any], int]:
+        url = f"{self.base_url}{path}"
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        endpoint = f"{path}:{model}"
+        limiter = get_rate_limiter(provider_of(self.base_url), model)
+        attempt = 0
+        while True:
+            retry_after = None
+            if limiter is not None:
+                try:
+                    await limiter.acquire(max_wait=max_queue_wait)
+                except RateLimitExceeded as e:
+                    raise DashScopeError(429, "RateLimited", str(e))
+            try:
+                queued_at = time.monotonic()
+                _WAITING.inc(model=model)
+                try:
+                    await self._semaphore(endpoint, model).acquire()
+                finally:
+                    _WAITING.dec(model=model)
+                self._record_queue_wait(model, time.monotonic() - queued_at)
+                _IN_FLIGHT.inc(model=model)
+                try:
+                    session = get_http_session()
+                    async with session.post(url, json=payload, headers=headers, timeout=client_timeout) as response:
+                        try:
+                            data = await response.json(content_type=None)
+                        except ValueError:
+                            # 网关错误页等非JSON响应
+                            data = {"message": (await response.text())[:200]}
+                        if response.status == 200:
+                            return data, attempt + 1
+                        retry_after = response.headers.get("Retry-After")
+                        data = data if isinstance(data, dict) else {}
+                        error = DashScopeError(response.status, data.get("code", ""), data.get("message", ""),
+                                               data.get("request_id", ""))
+                finally:
+                    _IN_FLIGHT.dec(model=model)
+                    self._semaphore(endpoint, model).release()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = DashScopeError(NETWORK_ERROR_STATUS, type(e).__name__, str(e) or "网络异常或请求超时")
+
+            if error.status == 429 and limiter is not None:
+                limiter.penalize(self._retry_after_seconds(retry_after))
+            if not error.retryable or attempt >= max_retries:
+                raise error
+            delay = self._backoff(attempt, retry_after)
+            logger.warning(f"DashScope {model} 调用失败（{error.status} {error.code}），{delay:.1f}秒后第{attempt + 1}次重试")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+# (api_key, base_url) -> 客户端，同一进程内的工具共享并发控制
+_clients: Dict[Tuple[str, str], DashScopeClient] = {}
+
+
+def get_dashscope_client(api_key: str, base_url: str = "", **kwargs) -> DashScopeClient:
+    """获取（或按参数创建）共享的 DashScope 客户端，kwargs 仅在首次创建时生效"""
+    key = (api_key, base_url)
+    if key not in _clients:
+        _clients[key] = DashScopeClient(api_key, base_url, **kwargs)
+    return _clients[key]
+
+
+def dashscope_client_stats() -> Dict[str, Dict[str, Any]]:
+    """所有共享客户端的并发排队统计（模型 -> 统计，不含限流器排队），同一模型的多个客户端合并计数"""
+    merged: Dict[str, List[float]] = {}
+    for client in _clients.values():
+        for model, (count, total, longest) in client._queue_stats.items():
+            stats = merged.setdefault(model, [0, 0.0, 0.0])
+            stats[0] += count
+            stats[1] += total
+            stats[2] = max(stats[2], longest)
+    return {model: {"requests": int(count), "avg_queue_wait": round(total / count, 3) if count else 0.0,
+                    "max_queue_wait": round(longest, 3)}
+            for model, (count, total, longest) in merged.items()}
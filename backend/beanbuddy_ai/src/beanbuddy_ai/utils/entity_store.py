@@ -0,0 +1,310 @@
+import argparse
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .paths import CONFIGS_DIR, resolve_data_path
+
+logger = logging.getLogger(__name__)
+
+# 随包发布的精选实体特征
+DEFAULT_SEED_FILE = CONFIGS_DIR / "entities.json"
+
+# 条目来源：精选数据 / 批量导入 / LLM 回写
+SOURCE_CURATED = "curated"
+SOURCE_IMPORT = "import"
+SOURCE_LLM = "llm"
+
+# 归一化时移除的空白与标点（含全角标点）
+_STRIP_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    category TEXT NOT NULL DEFAULT '',
+    features TEXT NOT NULL,
+    source TEXT NOT NULL,
+    provenance TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    alias_norm TEXT PRIMARY KEY,
+    alias TEXT NOT NULL,
+    entity_id INTEGER NOT NULL REFERENCES entities(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_aliases_entity ON aliases(entity_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def normalize_alias(text: str) -> str:
+    """
+    别名归一化：NFKC（全角转半角）、大小写折叠、去除空白与标点
+    例如 "Pikachu " / "ＰＩＫＡＣＨＵ" / "皮卡 丘" 分别归一为 "pikachu" / "pikachu" / "皮卡丘"
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return _STRIP_PATTERN.sub("", text)
+
+
+@dataclass
+class EntityRecord:
+    """实体特征条目"""
+    name: str
+    features: str
+    category: str = ""
+    aliases: List[str] = field(default_factory=list)
+    source: str = SOURCE_CURATED
+    # 来源补充信息，如 LLM 模型名称、导入文件
+    provenance: str = ""
+    updated_at: float = 0.0
+
+
+class EntityStore:
+    """
+    本地实体特征库（SQLite）
+    - aliases 表以归一化别名为主键，精确查询为一次索引查找
+    - entity_fts 为别名的 FTS5 trigram 全文索引，用于模糊检索（SQLite 不支持时降级为 LIKE）
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        self._has_fts = self._create_fts()
+
+    def _create_fts(self) -> bool:
+        try:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS entity_fts "
+                "USING fts5(alias, entity_id UNINDEXED, tokenize='trigram')"
+            )
+            return True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"当前SQLite不支持FTS5 trigram索引，模糊检索降级为LIKE: {e}")
+            return False
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --------------------------
+    # 查询
+    # --------------------------
+    def lookup(self, name: str) -> Optional[EntityRecord]:
+        """按归一化别名精确查询实体"""
+        alias_norm = normalize_alias(name)
+        if not alias_norm:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT e.* FROM aliases a JOIN entities e ON e.id = a.entity_id WHERE a.alias_norm = ?",
+                (alias_norm,)
+            ).fetchone()
+            return self._to_record(row) if row else None
+
+    def search(self, query: str, limit: int = 5) -> List[EntityRecord]:
+        """模糊检索：trigram 全文索引（查询不足3个字符时退化为 LIKE 子串匹配）"""
+        alias_norm = normalize_alias(query)
+        if not alias_norm:
+            return []
+        with self._lock:
+            if self._has_fts and len(alias_norm) >= 3:
+                rows = self._conn.execute(
+                    "SELECT DISTINCT e.* FROM entity_fts f JOIN entities e ON e.id = f.entity_id "
+                    "WHERE entity_fts MATCH ? ORDER BY rank LIMIT ?",
+                    ('"' + alias_norm.replace('"', '""') + '"', limit)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT DISTINCT e.* FROM aliases a JOIN entities e ON e.id = a.entity_id "
+                    "WHERE a.alias_norm LIKE ? LIMIT ?",
+                    (f"%{alias_norm}%", limit)
+                ).fetchall()
+            return [self._to_record(row) for row in rows]
+
+    def _to_record(self, row: sqlite3.Row) -> EntityRecord:
+        aliases = [r["alias"] for r in self._conn.execute(
+            "SELECT alias FROM aliases WHERE entity_id = ?", (row["id"],))]
+        return EntityRecord(
+            name=row["name"],
+            features=row["features"],
+            category=row["category"],
+            aliases=aliases,
+            source=row["source"],
+            provenance=row["provenance"],
+            updated_at=row["updated_at"],
+        )
+
+    # --------------------------
+    # 写入
+    # --------------------------
+    def upsert(self, record: EntityRecord, overwrite: bool = True) -> None:
+        """写入单个实体（含名称与全部别名）"""
+        self.bulk_import([record], overwrite=overwrite)
+
+    def bulk_import(self, records: Iterable[EntityRecord], overwrite: bool = True) -> int:
+        """
+        在单个事务中批量导入实体
+        overwrite=False 时已存在的实体保持不变（用于 LLM 回写，不覆盖精选数据）
+        返回写入的实体数量
+        """
+        now = time.time()
+        count = 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for record in records:
+                    if self._write_record(record, now, overwrite):
+                        count += 1
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def _write_record(self, record: EntityRecord, now: float, overwrite: bool) -> bool:
+        row = self._conn.execute("SELECT id FROM entities WHERE name = ?", (record.name,)).fetchone()
+        if row and not overwrite:
+            return False
+        if row:
+            entity_id = row["id"]
+            self._conn.execute(
+                "UPDATE entities SET category = ?, features = ?, source = ?, provenance = ?, updated_at = ? "
+                "WHERE id = ?",
+                (record.category, record.features, record.source, record.provenance, now, entity_id)
+            )
+        else:
+            entity_id = self._conn.execute(
+                "INSERT INTO entities (name, category, features, source, provenance, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (record.name, record.category, record.features, record.source, record.provenance, now, now)
+            ).lastrowid
+
+        for alias in {record.name, *record.aliases}:
+            alias_norm = normalize_alias(alias)
+            if not alias_norm:
+                continue
+            self._conn.execute(
+                "INSERT INTO aliases (alias_norm, alias, entity_id) VALUES (?, ?, ?) "
+                "ON CONFLICT(alias_norm) DO UPDATE SET alias = excluded.alias, entity_id = excluded.entity_id",
+                (alias_norm, alias, entity_id)
+            )
+        if self._has_fts:
+            alias_norms = [r["alias_norm"] for r in self._conn.execute(
+                "SELECT alias_norm FROM aliases WHERE entity_id = ?", (entity_id,))]
+            # 别名可能从其他实体转移而来，先按实体与别名两方面清理旧索引
+            self._conn.execute("DELETE FROM entity_fts WHERE entity_id = ?", (entity_id,))
+            self._conn.executemany("DELETE FROM entity_fts WHERE alias = ?", [(a,) for a in alias_norms])
+            self._conn.executemany(
+                "INSERT INTO entity_fts (alias, entity_id) VALUES (?, ?)",
+                [(a, entity_id) for a in alias_norms]
+            )
+        return True
+
+    def import_file(self, path: Path, source: str = SOURCE_IMPORT, overwrite: bool = True) -> int:
+        """从 JSON 数组或 JSONL 文件批量导入，每个条目包含 name/features/aliases/category 字段"""
+        path = Path(path)
+        text = path.read_text(encoding="utf-8")
+        if path.suffix == ".jsonl":
+            items = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            items = json.loads(text)
+        records = [
+            EntityRecord(
+                name=item["name"],
+                features=item["features"],
+                category=item.get("category", ""),
+                aliases=item.get("aliases", []),
+                source=item.get("source", source),
+                provenance=item.get("provenance", path.name),
+            )
+            for item in items
+        ]
+        return self.bulk_import(records, overwrite=overwrite)
+
+    def ensure_seeded(self, seed_file: Path = DEFAULT_SEED_FILE) -> None:
+        """种子文件内容变化时重新导入精选数据（按文件哈希判断）"""
+        seed_file = Path(seed_file)
+        if not seed_file.exists():
+            logger.warning(f"实体种子文件不存在: {seed_file}")
+            return
+        digest = hashlib.sha256(seed_file.read_bytes()).hexdigest()
+        meta_key = f"seed:{seed_file.name}"
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (meta_key,)).fetchone()
+        if row and row["value"] == digest:
+            return
+        count = self.import_file(seed_file, source=SOURCE_CURATED)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (meta_key, digest)
+            )
+        logger.info(f"已导入实体种子数据 {count} 条: {seed_file}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute("SELECT source, COUNT(*) AS n FROM entities GROUP BY source").fetchall()
+        return {row["source"]: row["n"] for row in rows}
+
+
+# 按数据库路径缓存的实例，同一进程内的工具共享
+_store_cache: Dict[str, EntityStore] = {}
+
+
+def get_entity_store(db_path: str = "", seed_file: str = "") -> EntityStore:
+    """获取（或创建并导入种子数据）实体特征库"""
+    resolved = resolve_data_path(db_path, "knowledge_graph.db")
+    key = str(resolved)
+    if key not in _store_cache:
+        store = EntityStore(resolved)
+        store.ensure_seeded(Path(seed_file) if seed_file else DEFAULT_SEED_FILE)
+        _store_cache[key] = store
+    return _store_cache[key]
+
+
+def main() -> None:
+    """命令行批量导入：python -m beanbuddy_ai.utils.entity_store import entities.json"""
+    parser = argparse.ArgumentParser(description="BeanBuddy-AI 本地实体特征库管理")
+    parser.add_argument("--db", default="", help="数据库路径，默认位于数据目录下的 knowledge_graph.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    import_parser = sub.add_parser("import", help="从 JSON/JSONL 文件批量导入实体")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("--keep-existing", action="store_true", help="不覆盖已存在的实体")
+    lookup_parser = sub.add_parser("lookup", help="查询实体")
+    lookup_parser.add_argument("name")
+    sub.add_parser("stats", help="按来源统计实体数量")
+    args = parser.parse_args()
+
+    store = get_entity_store(args.db)
+    if args.command == "import":
+        for file in args.files:
+            count = store.import_file(Path(file), overwrite=not args.keep_existing)
+            print(f"{file}: 导入 {count} 条")
+    elif args.command == "lookup":
+        record = store.lookup(args.name) or next(iter(store.search(args.name, limit=1)), None)
+        print(json.dumps(record.__dict__ if record else None, ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(store.stats(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from .metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class HedgePolicy:
+    """
+    对冲请求策略（按模型共享）
+    - 记录最近 window 次调用的耗时；主请求超过其 percentile 分位数仍未完成时，发起一个重复请求，取先成功的结果并取消其余请求
+    - 预算：每次调用积累 max_ratio 个额度（上限 burst），每次对冲消耗 1 个，对冲调用占比长期不超过 max_ratio
+    - 样本不足 min_samples 时不对冲
+    """
+
+    def __init__(self, key: str, percentile: float = 90.0, max_ratio: float = 0.1, min_samples: int = 20,
+                 window: int = 200, burst: float = 5.0):
+        self.key = key
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.burst = burst
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._credits = 0.0
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped_budget = 0
+        self.saved_seconds = 0.0
+
+    def hedge_delay(self) -> Optional[float]:
+        """本次调用的对冲触发时间（秒），样本不足时返回 None；同时为预算积累额度"""
+        with self._lock:
+            self.calls += 1
+            self._credits = min(self.burst, self._credits + self.max_ratio)
+            if len(self._latencies) < self.min_samples:
+                return None
+            return _percentile(list(self._latencies), self.percentile)
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self._credits < 1.0:
+                self.skipped_budget += 1
+                return False
+            self._credits -= 1.0
+            self.hedged += 1
+            return True
+
+    def observe(self, latency: float) -> None:
+        """记录一次成功请求（自身发出到完成）的耗时，或被对冲请求取代的主请求已运行的时长（下界）"""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def record_hedge_win(self, elapsed: float) -> None:
+        """
+        对冲请求先完成：主请求已运行 elapsed 秒仍未完成，按历史耗时中超过 elapsed 的样本均值估算其完成时间，
+        两者之差计为节省的尾延迟（没有更慢的历史样本时不计）
+        """
+        with self._lock:
+            self.hedge_wins += 1
+            slower = [latency for latency in self._latencies if latency > elapsed]
+            if slower:
+                self.saved_seconds += sum(slower) / len(slower) - elapsed
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self._latencies)
+            stats = {"calls": self.calls, "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                     "skipped_budget": self.skipped_budget,
+                     "hedge_ratio": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+                     "estimated_saved_seconds": round(self.saved_seconds, 3)}
+        if samples:
+            stats.update(p50=round(_percentile(samples, 50), 3), p99=round(_percentile(samples, 99), 3),
+                         trigger=round(_percentile(samples, self.percentile), 3))
+        return stats
+
+
+async def run_hedged(policy: Optional[HedgePolicy],
+                     call: Callable[[bool], Awaitable[Any]],
+                     can_hedge: Callable[[], bool] = lambda: True) -> Tuple[Any, bool]:
+    """
+    执行 call(False)，超过对冲触发时间仍未完成且预算允许时再执行 call(True)（对冲请求），返回 (先成功的结果, 是否由对冲请求返回)
+    两个请求都失败时抛出主请求的异常；返回或被取消时取消仍在进行的请求
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    delay = policy.hedge_delay() if policy is not None else None
+
+    async def _timed(hedge: bool) -> Tuple[Any, float]:
+        request_started = loop.time()
+        result = await call(hedge)
+        return result, loop.time() - request_started
+
+    primary = asyncio.create_task(_timed(False))
+    pending = {primary}
+    hedge_task = None
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and can_hedge() and policy.try_hedge():
+                logger.info(f"{policy.key} 请求超过{delay:.1f}秒未完成，发起对冲请求")
+                hedge_task = asyncio.create_task(_timed(True))
+                pending.add(hedge_task)
+
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # 同时完成时优先采用主请求
+            for task in sorted(done, key=lambda t: t is not primary):
+                if task.exception() is not None:
+                    if task is primary or error is None:
+                        error = task.exception()
+                    continue
+                result, latency = task.result()
+                if policy is not None:
+                    if task is hedge_task:
+                        elapsed = loop.time() - started
+                        policy.record_hedge_win(elapsed)
+                        if primary in pending:
+                            # 被取消的慢主请求至少耗时 elapsed，作为下界样本记录，否则分位数只含较快的请求，会逐渐偏低
+                            policy.observe(elapsed)
+                    policy.observe(latency)
+                return result, task is hedge_task
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+# 模型 -> 对冲策略（参数仅在首次创建时生效）
+_policies: Dict[str, HedgePolicy] = {}
+
+
+def get_hedge_policy(key: str, **kwargs) -> HedgePolicy:
+    if key not in _policies:
+        _policies[key] = HedgePolicy(key, **kwargs)
+    return _policies[key]
+
+
+def hedge_policy_for(key: str, config: Any) -> Optional[HedgePolicy]:
+    """按工具配置（hedge_percentile / hedge_max_ratio / hedge_min_samples）获取对冲策略，未启用时返回 None"""
+    if not config.hedge_percentile:
+        return None
+    return get_hedge_policy(key, percentile=config.hedge_percentile, max_ratio=config.hedge_max_ratio,
+                            min_samples=config.hedge_min_samples)
+
+
+def hedge_stats() -> Dict[str, Dict[str, Any]]:
+    return {key: policy.as_dict() for key, policy in _policies.items()}
+
+
+def _collect_hedge_metrics():
+    stats = hedge_stats()
+    for name, help_text in (("calls", "启用对冲策略的调用次数"), ("hedged", "发起对冲请求的次数"),
+                            ("hedge_wins", "对冲请求先于主请求完成的次数"),
+                            ("skipped_budget", "因预算不足未发起对冲的次数")):
+        yield (f"beanbuddy_hedge_{name}_total", help_text, "counter",
+               [({"model": key}, item[name]) for key, item in stats.items()])
+    yield ("beanbuddy_hedge_saved_seconds_total", "对冲请求节省的尾延迟估算（秒）", "counter",
+           [({"model": key}, item["estimated_saved_seconds"]) for key, item in stats.items()])
+
+
+register_collector(_collect_hedge_metrics)
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# 每个事件循环一个共享会话（aiohttp 会话不能跨事件循环使用）
+_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+# 持有共享会话的工具数量，全部释放后关闭会话
+_ref_count = 0
+
+# 连接池参数
+_POOL_LIMIT = 100
+_POOL_LIMIT_PER_HOST = 20
+_DNS_CACHE_TTL = 300
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """获取当前事件循环的共享 HTTP 会话（连接池复用），不存在或已关闭时自动创建"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=_POOL_LIMIT,
+            limit_per_host=_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=_DNS_CACHE_TTL,
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        _sessions[loop] = session
+        logger.debug("已创建共享 HTTP 会话")
+    return session
+
+
+def acquire_http_session() -> None:
+    """工具初始化时登记对共享会话的持有，与 release_http_session 成对调用"""
+    global _ref_count
+    _ref_count += 1
+
+
+async def release_http_session() -> None:
+    """工具清理时释放持有，最后一个持有者释放后关闭全部共享会话"""
+    global _ref_count
+    _ref_count = max(0, _ref_count - 1)
+    if _ref_count == 0:
+        await close_http_sessions()
+
+
+async def close_http_sessions() -> None:
+    """关闭当前事件循环的共享会话，并丢弃其他已失效事件循环的会话"""
+    try:
+        loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    for session_loop, session in list(_sessions.items()):
+        if session_loop is loop:
+            if not session.closed:
+                await session.close()
+            del _sessions[session_loop]
+        elif session_loop.is_closed():
+            del _sessions[session_loop]
+    logger.debug("已关闭共享 HTTP 会话")
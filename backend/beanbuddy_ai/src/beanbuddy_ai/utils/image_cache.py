@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+from urllib.parse import parse_qs, urlparse
+
+import aiohttp
+
+from .artifact_store import get_artifact_store, is_artifact_ref
+from .http_session import get_http_session
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 图片URL -> artifact:// 引用（预取完成后登记），后续工具据此直接读取本地字节
+_url_index = TTLCache(max_entries=8192, ttl=7 * 86400)
+# 进行中的预取任务（保留引用，避免任务被回收）
+_prefetch_tasks: Dict[str, asyncio.Task] = {}
+_background_tasks: Set[asyncio.Task] = set()
+
+
+@dataclass(frozen=True)
+class GeneratedImage:
+    """文生图缓存条目"""
+    url: str
+    # 服务商URL的过期时间（unix 时间戳），无法解析时为空
+    expires_at: Optional[float] = None
+
+
+def image_cache_key(prompt: str, model: str, size: str, negative_prompt: str) -> str:
+    """文生图缓存键：提示词、模型、尺寸、负向提示词的哈希"""
+    raw = "\x00".join([model, size, negative_prompt, prompt])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def parse_url_expiry(url: str) -> Optional[float]:
+    """
+    解析对象存储签名URL的过期时间（unix 时间戳）
+    - V1 签名：Expires=<unix时间戳>
+    - V4 签名：x-oss-date=<YYYYMMDDTHHMMSSZ> + x-oss-expires=<秒数>
+    """
+    query = {k.lower(): v[0] for k, v in parse_qs(urlparse(url).query).items()}
+    try:
+        if "expires" in query:
+            return float(query["expires"])
+        if "x-oss-expires" in query and "x-oss-date" in query:
+            signed_at = datetime.strptime(query["x-oss-date"], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            return signed_at.timestamp() + float(query["x-oss-expires"])
+    except ValueError:
+        return None
+    return None
+
+
+class GeneratedImageCache:
+    """
+    文生图结果缓存：命中时直接返回已生成的图片URL
+    条目有效期取配置TTL与URL剩余有效期（扣除安全余量）中的较小值，URL过期后不再返回
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400.0, expiry_margin: float = 300.0):
+        self.ttl = ttl
+        self.expiry_margin = expiry_margin
+        self._entries = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[GeneratedImage]:
+        image: Optional[GeneratedImage] = self._entries.get(key)
+        if image is not None and image.expires_at is not None \
+                and image.expires_at - self.expiry_margin <= time.time():
+            self._entries.pop(key)
+            image = None
+        if image is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return image
+
+    def set(self, key: str, url: str) -> None:
+        expires_at = parse_url_expiry(url)
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - self.expiry_margin - time.time())
+        if ttl > 0:
+            self._entries.set(key, GeneratedImage(url=url, expires_at=expires_at), ttl=ttl)
+
+
+def resolve_local_image(url: str) -> Optional[str]:
+    """返回图片URL对应的 artifact:// 引用（已是引用时原样返回），未预取或已淘汰时返回 None"""
+    if is_artifact_ref(url):
+        return url if get_artifact_store().has(url) else None
+    ref = _url_index.get(url)
+    if ref is not None and not get_artifact_store().has(ref):
+        _url_index.pop(url)
+        ref = None
+    return ref
+
+
+def lookup_local_image(url: str) -> Optional[bytes]:
+    """读取已预取到本地的图片字节（支持 artifact:// 引用），未预取时返回 None"""
+    ref = resolve_local_image(url)
+    if ref is None:
+        return None
+    try:
+        return get_artifact_store().get_bytes(ref)
+    except KeyError:
+        _url_index.pop(url)
+        return None
+
+
+def register_local_image(url: str, data: bytes) -> str:
+    """将图片字节写入制品存储并登记URL映射，返回 artifact:// 引用"""
+    ref = get_artifact_store().put_bytes(data)
+    _url_index.set(url, ref)
+    return ref
+
+
+async def _download(url: str, timeout: float) -> None:
+    session = get_http_session()
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            response.raise_for_status()
+            data = await response.read()
+        # 哈希计算及可能的磁盘溢出放到线程中执行
+        ref = await asyncio.to_thread(register_local_image, url, data)
+        logger.info(f"已预取生成图片到本地（{len(data)}字节，{ref}）")
+    except Exception as e:
+        logger.warning(f"预取生成图片失败 {url}: {e}")
+    finally:
+        _prefetch_tasks.pop(url, None)
+
+
+def prefetch_image(url: str, timeout: float = 60.0) -> None:
+    """在后台下载图片到本地存储，已在本地或正在下载时不重复下载"""
+    if url in _prefetch_tasks or resolve_local_image(url) is not None:
+        return
+    task = asyncio.get_running_loop().create_task(_download(url, timeout))
+    _prefetch_tasks[url] = task
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def wait_for_prefetch(url: str, timeout: float = 30.0) -> None:
+    """等待指定URL的预取任务完成（不存在时立即返回，超时不抛出）"""
+    task = _prefetch_tasks.get(url)
+    if task is None:
+        return
+    try:
+        await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"等待图片预取超时，改为直接下载: {url}")
+
+
+async def fetch_image_artifact(url: str, timeout: float = 60.0) -> Optional[str]:
+    """
+    确保图片已下载到制品存储并返回 artifact:// 引用
+    复用进行中的预取任务；下载失败时返回 None，由调用方继续使用原URL
+    """
+    ref = resolve_local_image(url)
+    if ref is not None:
+        return ref
+    prefetch_image(url, timeout)
+    await wait_for_prefetch(url, timeout)
+    return resolve_local_image(url)
@@ -0,0 +1,88 @@
+import asyncio
+import base64
+import binascii
+import logging
+import os
+from typing import AsyncIterable, Optional
+
+from .artifact_store import get_artifact_store
+from .image_probe import sniff_image_format
+from .tracing import record_bytes
+
+logger = logging.getLogger(__name__)
+
+# 内联图片输入：data:image/<格式>;base64,<数据>
+DATA_URI_PREFIX = "data:"
+# 上传图片大小上限（字节），可通过环境变量 BEANBUDDY_MAX_UPLOAD_BYTES 调整
+DEFAULT_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+
+
+class ImageIngestError(ValueError):
+    """上传的图片无效（格式无法识别、data URI 格式错误）"""
+
+
+class ImageTooLarge(ImageIngestError):
+    """上传的图片超过大小上限"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"图片超过大小上限（{max_bytes} 字节）")
+        self.max_bytes = max_bytes
+
+
+def max_upload_bytes() -> int:
+    return int(os.getenv("BEANBUDDY_MAX_UPLOAD_BYTES") or DEFAULT_MAX_UPLOAD_BYTES)
+
+
+def is_data_uri(value: str) -> bool:
+    return isinstance(value, str) and value[:len(DATA_URI_PREFIX)].lower() == DATA_URI_PREFIX
+
+
+def ingest_image_bytes(data: bytes, media_type: str = "", persist: bool = False) -> str:
+    """
+    校验图片格式并写入制品存储，返回 artifact:// 引用，后续工具直接读取本地字节，无需上传对象存储再下载
+    persist 为 True 时同时写入磁盘溢出区，共享数据目录的其他进程（服务工作进程、设计工作进程）可读取同一引用
+    """
+    image_format = sniff_image_format(data)
+    if image_format is None:
+        raise ImageIngestError("无法识别的图片格式（支持 JPEG / PNG / GIF / WEBP）")
+    store = get_artifact_store()
+    ref = store.put_bytes(data, media_type or f"image/{image_format.lower()}")
+    if persist:
+        store.persist(ref)
+    record_bytes("image_upload", len(data))
+    logger.info(f"已接收上传图片 {ref}（{image_format}，{len(data)} 字节）")
+    return ref
+
+
+def ingest_data_uri(value: str, max_bytes: Optional[int] = None) -> str:
+    """解码 data:image/...;base64,... 形式的内联图片并写入制品存储，返回 artifact:// 引用"""
+    max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+    header, sep, payload = value.strip().partition(",")
+    media_type = header[len(DATA_URI_PREFIX):].split(";")[0].strip().lower()
+    if not sep or not header.lower().endswith(";base64") or not media_type.startswith("image/"):
+        raise ImageIngestError("仅支持 base64 编码的图片 data URI（data:image/<格式>;base64,<数据>）")
+    # 按编码长度预判，超限时不解码
+    if len(payload) * 3 // 4 > max_bytes + 2:
+        raise ImageTooLarge(max_bytes)
+    try:
+        data = base64.b64decode("".join(payload.split()), validate=True)
+    except (binascii.Error, ValueError):
+        raise ImageIngestError("data URI 中的 base64 数据无效")
+    if len(data) > max_bytes:
+        raise ImageTooLarge(max_bytes)
+    return ingest_image_bytes(data, media_type)
+
+
+async def ingest_stream(chunks: AsyncIterable[bytes], media_type: str = "", max_bytes: Optional[int] = None,
+                        persist: bool = True) -> str:
+    """逐块接收上传内容，超过大小上限时立即停止读取并抛出 ImageTooLarge，返回 artifact:// 引用"""
+    max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise ImageTooLarge(max_bytes)
+    if not buffer:
+        raise ImageIngestError("上传内容为空")
+    # 计算摘要与写盘不阻塞事件循环
+    return await asyncio.to_thread(ingest_image_bytes, bytes(buffer), media_type, persist)
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+
+from .http_session import get_http_session
+from .tracing import SPAN_HTTP, record_cache_lookup, span
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 图片格式魔术数字
+IMAGE_MAGIC_NUMBERS = {
+    b'\xFF\xD8\xFF': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'GIF87a': 'GIF',
+    b'GIF89a': 'GIF',
+    b'RIFF': 'WEBP',
+}
+
+# 嗅探魔术数字时读取的字节数（Range: bytes=0-31）
+SNIFF_BYTES = 32
+
+# HEAD 请求最多占用的超时比例，超时后用剩余时间发送 Range 请求兜底
+_HEAD_TIMEOUT_SHARE = 0.4
+
+# 无法据此判断内容类型的响应头
+_INCONCLUSIVE_CONTENT_TYPES = {"", "application/octet-stream", "binary/octet-stream"}
+
+# URL -> 探测结论 的缓存，同一 URL 再次识别时无需重复探测
+_probe_cache = TTLCache(max_entries=4096, ttl=600)
+
+
+@dataclass(frozen=True)
+class ImageProbeResult:
+    """URL 图片探测结论"""
+    url: str
+    is_image: bool
+    content_type: str = ""
+    image_format: Optional[str] = None
+
+
+def sniff_image_format(data: bytes) -> Optional[str]:
+    """根据文件头魔术数字识别图片格式，无法识别时返回 None"""
+    for magic, img_type in IMAGE_MAGIC_NUMBERS.items():
+        if data.startswith(magic):
+            # RIFF 容器还需校验第 8~12 字节是否为 WEBP
+            if img_type == 'WEBP' and len(data) >= 12 and data[8:12] != b'WEBP':
+                continue
+            return img_type
+    return None
+
+
+async def probe_image_url(url: str,
+                          timeout: float = 5.0,
+                          cache_ttl: Optional[float] = None) -> ImageProbeResult:
+    """
+    探测 URL 是否指向图片
+
+    1. 先发送 HEAD 请求（最多占用 timeout 的 _HEAD_TIMEOUT_SHARE），Content-Type 为 image/* 时直接判定；
+    2. 响应头无法判断时（缺失、octet-stream、HEAD 不被支持或超时），
+       发送 Range: bytes=0-31 的 GET 请求读取文件头，按魔术数字判定；
+    3. 结论按 URL 缓存 cache_ttl 秒（网络异常不缓存）。
+    """
+    cached = _probe_cache.get(url)
+    record_cache_lookup("image_probe", "hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached
+
+    with span("image_probe", SPAN_HTTP) as probe_span:
+        session = get_http_session()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            content_type = ""
+            head_ok = False
+            try:
+                head_timeout = aiohttp.ClientTimeout(total=timeout * _HEAD_TIMEOUT_SHARE)
+                async with session.head(url, timeout=head_timeout, allow_redirects=True) as response:
+                    head_ok = response.status < 400
+                    content_type = (response.headers.get('Content-Type') or "").split(';')[0].strip().lower()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # 部分对象存储的签名URL不支持 HEAD（或 HEAD 迟迟不响应），交给 Range 请求兜底
+                head_ok = False
+
+            if head_ok and content_type.startswith('image/'):
+                result = ImageProbeResult(url=url, is_image=True, content_type=content_type,
+                                          image_format=content_type[len('image/'):].upper())
+            elif head_ok and content_type not in _INCONCLUSIVE_CONTENT_TYPES:
+                result = ImageProbeResult(url=url, is_image=False, content_type=content_type)
+            else:
+                # 第二重校验：Range 请求读取文件头魔术数字
+                headers = {"Range": f"bytes=0-{SNIFF_BYTES - 1}"}
+                # Range 请求使用剩余的超时预算
+                range_timeout = aiohttp.ClientTimeout(total=max(deadline - loop.time(), 0.1))
+                async with session.get(url, headers=headers, timeout=range_timeout) as response:
+                    response.raise_for_status()
+                    # 服务端可能忽略 Range 返回完整内容，只读取前 SNIFF_BYTES 字节
+                    header = b""
+                    while len(header) < SNIFF_BYTES:
+                        chunk = await response.content.read(SNIFF_BYTES - len(header))
+                        if not chunk:
+                            break
+                        header += chunk
+                    content_type = content_type or (response.headers.get('Content-Type') or "").lower()
+                image_format = sniff_image_format(header)
+                result = ImageProbeResult(url=url, is_image=image_format is not None, content_type=content_type,
+                                          image_format=image_format)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"探测图片URL失败 {url}: {e}")
+            probe_span.set_error(e)
+            return ImageProbeResult(url=url, is_image=False)
+        probe_span.set(is_image=result.is_image, content_type=result.content_type)
+
+    _probe_cache.set(url, result, ttl=cache_ttl)
+    return result
+
+
+async def check_image_async(url: str, timeout: float = 5.0, cache_ttl: Optional[float] = None) -> bool:
+    """判断 URL 是否为图片（带缓存）"""
+    result = await probe_image_url(url, timeout=timeout, cache_ttl=cache_ttl)
+    return result.is_image
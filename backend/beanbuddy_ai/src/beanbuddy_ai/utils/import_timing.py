@@ -0,0 +1,73 @@
+import argparse
+import importlib
+import logging
+import time
+from collections import OrderedDict
+from types import ModuleType
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 导入阶段：注册（服务启动 / CLI 调用时）与实现（工具首次构建时）
+PHASE_REGISTER = "register"
+PHASE_IMPLEMENTATION = "implementation"
+
+# 工具名称 -> {阶段: 导入耗时（秒）}
+_import_costs: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+
+def timed_import(module_name: str, tool: str, phase: str, package: Optional[str] = None) -> ModuleType:
+    """
+    导入模块并记录耗时（按工具与阶段累计），module_name 为相对名称时需传入 package
+    说明：耗时为首次导入时的实际开销，多个工具共用的依赖计入最先导入它的工具
+    """
+    started = time.perf_counter()
+    module = importlib.import_module(module_name, package)
+    elapsed = time.perf_counter() - started
+    costs = _import_costs.setdefault(tool, {})
+    costs[phase] = costs.get(phase, 0.0) + elapsed
+    if phase == PHASE_IMPLEMENTATION and elapsed > 0.05:
+        logger.info(f"{tool} 实现模块首次加载耗时 {elapsed:.2f}秒")
+    return module
+
+
+def import_costs() -> Dict[str, Dict[str, float]]:
+    return {tool: dict(costs) for tool, costs in _import_costs.items()}
+
+
+def format_import_report() -> str:
+    """按工具输出导入耗时报告（毫秒）"""
+    rows = [f"{'tool':<32}{'register(ms)':>14}{'implementation(ms)':>20}"]
+    total_register = total_implementation = 0.0
+    for tool, costs in _import_costs.items():
+        register_cost = costs.get(PHASE_REGISTER, 0.0)
+        implementation_cost = costs.get(PHASE_IMPLEMENTATION, 0.0)
+        total_register += register_cost
+        total_implementation += implementation_cost
+        rows.append(f"{tool:<32}{register_cost * 1000:>14.1f}{implementation_cost * 1000:>20.1f}")
+    rows.append(f"{'total':<32}{total_register * 1000:>14.1f}{total_implementation * 1000:>20.1f}")
+    return "\n".join(rows)
+
+
+def main() -> None:
+    """
+    启动耗时报告：导入注册模块（服务启动时的开销），可选地再导入各工具的实现模块
+    python -m beanbuddy_ai.utils.import_timing [--implementations]
+    """
+    parser = argparse.ArgumentParser(description="BeanBuddy 工具导入耗时报告")
+    parser.add_argument("--implementations", action="store_true",
+                        help="同时导入各工具的实现模块（模拟工具首次构建的开销）")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    register = importlib.import_module("..register", __package__)
+    elapsed = time.perf_counter() - started
+    if args.implementations:
+        for tool, module_name in register.tools_register.IMPLEMENTATION_MODULES.items():
+            timed_import(module_name, tool, PHASE_IMPLEMENTATION, package=register.tools_register.__package__)
+    print(format_import_report())
+    print(f"\n注册模块总耗时（含NAT框架）：{elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from .paths import resolve_data_path
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+# 设计图生成任务
+JOB_KIND_DESIGN = "design"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    visible_at REAL NOT NULL,
+    worker TEXT NOT NULL DEFAULT '',
+    result TEXT,
+    error TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(kind, status, visible_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, updated_at);
+"""
+
+
+@dataclass
+class Job:
+    """队列中的一个任务"""
+    id: str
+    kind: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    worker: str = ""
+    result: Optional[Dict[str, Any]] = None
+    error: str = ""
+    created_at: float = 0.0
+    updated_at: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"job_id": self.id, "kind": self.kind, "status": self.status, "attempts": self.attempts,
+                "max_attempts": self.max_attempts, "worker": self.worker, "result": self.result,
+                "error": self.error, "created_at": self.created_at, "updated_at": self.updated_at}
+
+
+class JobQueue(ABC):
+    """
+    持久化任务队列接口（可替换后端）
+    - submit 写入任务；claim 领取一个可见任务并设置可见性超时（租约），期间其他工作进程不可见
+    - 工作进程需在租约到期前 heartbeat 续期；进程崩溃、租约到期后任务重新可见，由其他工作进程重试
+    - fail 时未超过最大尝试次数的任务延迟后重新排队，否则标记为失败
+    - cancel 取消未结束的任务：排队中的任务不再被领取，执行中的任务续期失败，工作进程在下一个检查点停止
+    """
+
+    @abstractmethod
+    def submit(self, kind: str, payload: Dict[str, Any], max_attempts: int = 3) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, kinds: Sequence[str], worker: str, visibility_timeout: float) -> Optional[Job]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def heartbeat(self, job_id: str, worker: str, visibility_timeout: float) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, job_id: str, worker: str, result: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def fail(self, job_id: str, worker: str, error: str, retry_delay: float = 0.0) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def purge(self, older_than: float) -> int:
+        """删除更新时间早于 older_than 秒之前的已结束任务，返回删除数；默认不清理（后端自行管理保留期）"""
+        return 0
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    SQLite 任务队列：同一主机上的多个进程通过事务原子领取任务
+    仅限单机：WAL 模式依赖同一主机上的共享内存，不支持多个节点共享数据库文件（跨节点部署需通过 register_job_queue_backend 注册其他后端）
+    领取、续期、完成都以 (任务ID, 工作进程) 为条件，租约过期后被其他进程接手的旧工作进程无法覆盖结果
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def submit(self, kind: str, payload: Dict[str, Any], max_attempts: int = 3) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, max_attempts, visible_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), STATUS_QUEUED, max(1, max_attempts),
+                 now, now, now))
+        return job_id
+
+    def claim(self, kinds: Sequence[str], worker: str, visibility_timeout: float) -> Optional[Job]:
+        """领取最早可见的任务（排队中，或运行中但租约已过期），尝试次数用尽的过期任务直接标记为失败"""
+        now = time.time()
+        placeholders = ",".join("?" * len(kinds))
+        with self._lock:
+            # BEGIN IMMEDIATE 取得写锁，多个进程同时领取时不会拿到同一任务
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    f"UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE kind IN ({placeholders}) "
+                    "AND status = ? AND visible_at <= ? AND attempts >= max_attempts",
+                    (STATUS_FAILED, "工作进程租约过期且已达到最大尝试次数", now, *kinds, STATUS_RUNNING, now))
+                row = self._conn.execute(
+                    f"SELECT * FROM jobs WHERE kind IN ({placeholders}) AND status IN (?, ?) AND visible_at <= ? "
+                    "ORDER BY visible_at LIMIT 1",
+                    (*kinds, STATUS_QUEUED, STATUS_RUNNING, now)).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, visible_at = ?, worker = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (STATUS_RUNNING, now + visibility_timeout, worker, now, row["id"]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row["status"] == STATUS_RUNNING:
+            logger.warning(f"任务 {row['id']} 的租约已过期（原工作进程 {row['worker']}），重新执行")
+        return self.get(row["id"])
+
+    def _update_owned(self, job_id: str, worker: str, sql: str, params: tuple) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(f"{sql} WHERE id = ? AND worker = ? AND status = ?",
+                                        (*params, job_id, worker, STATUS_RUNNING))
+        return cursor.rowcount > 0
+
+    def heartbeat(self, job_id: str, worker: str, visibility_timeout: float) -> bool:
+        """续期租约，任务已被其他工作进程接手时返回 False"""
+        now = time.time()
+        return self._update_owned(job_id, worker, "UPDATE jobs SET visible_at = ?, updated_at = ?",
+                                  (now + visibility_timeout, now))
+
+    def complete(self, job_id: str, worker: str, result: Dict[str, Any]) -> bool:
+        return self._update_owned(job_id, worker, "UPDATE jobs SET status = ?, result = ?, error = '', updated_at = ?",
+                                  (STATUS_SUCCEEDED, json.dumps(result, ensure_ascii=False), time.time()))
+
+    def fail(self, job_id: str, worker: str, error: str, retry_delay: float = 0.0) -> bool:
+        """记录失败：未达到最大尝试次数时延迟 retry_delay 秒后重新排队"""
+        now = time.time()
+        return self._update_owned(
+            job_id, worker,
+            "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+            "visible_at = ?, error = ?, updated_at = ?",
+            (STATUS_QUEUED, STATUS_FAILED, now + retry_delay, error[:2000], now))
+
+    def cancel(self, job_id: str) -> bool:
+        """取消排队中或执行中的任务，任务已结束时返回 False"""
+        with self._lock:
+            cursor = self._conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                                        (STATUS_CANCELLED, time.time(), job_id, STATUS_QUEUED, STATUS_RUNNING))
+        return cursor.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return Job(id=row["id"], kind=row["kind"], payload=json.loads(row["payload"]), status=row["status"],
+                   attempts=row["attempts"], max_attempts=row["max_attempts"], worker=row["worker"],
+                   result=json.loads(row["result"]) if row["result"] else None, error=row["error"],
+                   created_at=row["created_at"], updated_at=row["updated_at"])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def purge(self, older_than: float) -> int:
+        """删除更新时间早于 older_than 秒之前的已结束任务"""
+        placeholders = ",".join("?" * len(FINISHED_STATUSES))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*FINISHED_STATUSES, time.time() - older_than))
+        return cursor.rowcount
+
+
+class JobTimeout(TimeoutError):
+    """等待任务结束超时：任务不会被取消，仍可稍后按任务ID查询"""
+
+    def __init__(self, job_id: str, status: str, timeout: float):
+        super().__init__(f"任务 {job_id} 超过{timeout}秒未完成（当前状态 {status}）")
+        self.job_id = job_id
+        self.status = status
+        self.timeout = timeout
+
+
+async def wait_for_job(queue: JobQueue, job_id: str, timeout: float, poll_interval: float = 0.5) -> Job:
+    """
+    轮询任务状态直到结束，返回结束时的任务；超过 timeout 秒抛出 JobTimeout（任务保留在队列中）
+    等待本身被取消（客户端断开）时已无人需要结果，取消任务：排队中的不再执行，执行中的由工作进程在下一个检查点停止
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            job = await asyncio.to_thread(queue.get, job_id)
+            if job is None:
+                raise KeyError(f"任务 {job_id} 不存在")
+            if job.finished:
+                return job
+            if time.monotonic() > deadline:
+                raise JobTimeout(job_id, job.status, timeout)
+            await asyncio.sleep(poll_interval)
+    except asyncio.CancelledError:
+        if await asyncio.to_thread(queue.cancel, job_id):
+            logger.info(f"已取消任务 {job_id}")
+        raise
+
+
+def _sqlite_backend(location: str) -> JobQueue:
+    return SQLiteJobQueue(resolve_data_path(location, "jobs", "queue.db"))
+
+
+# 后端注册表：URL 协议 -> 构造函数（参数为协议之后的部分），可注册其他后端（如 Redis）
+_backends: Dict[str, Callable[[str], JobQueue]] = {"sqlite": _sqlite_backend}
+# 队列URL -> 队列实例
+_queues: Dict[str, JobQueue] = {}
+_default_url = ""
+
+
+def register_job_queue_backend(scheme: str, factory: Callable[[str], JobQueue]) -> None:
+    _backends[scheme] = factory
+
+
+def get_job_queue(url: str = "") -> JobQueue:
+    """
+    按URL获取共享的任务队列：sqlite://<数据库路径>（如 sqlite:///srv/beanbuddy/queue.db），为空时使用 configure_job_queue 设置的地址、
+    环境变量 BEANBUDDY_JOB_QUEUE，或数据目录下的 jobs/queue.db
+    """
+    url = url or _default_url or os.getenv("BEANBUDDY_JOB_QUEUE", "") or "sqlite://"
+    if url not in _queues:
+        scheme, _, location = url.partition("://")
+        factory = _backends.get(scheme)
+        if factory is None:
+            raise ValueError(f"不支持的任务队列后端：{scheme}（可用：{', '.join(_backends)}）")
+        _queues[url] = factory(location)
+    return _queues[url]
+
+
+def configure_job_queue(url: str) -> JobQueue:
+    """设置进程内默认的任务队列地址（任务状态查询路由使用），返回该队列"""
+    global _default_url
+    _default_url = url
+    return get_job_queue(url)
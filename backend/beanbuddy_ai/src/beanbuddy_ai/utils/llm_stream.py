@@ -0,0 +1,101 @@
+import logging
+import time
+import uuid
+from typing import Any
+
+from nat.builder.context import Context
+from nat.data_models.intermediate_step import IntermediateStepPayload, IntermediateStepType, StreamEventData
+
+logger = logging.getLogger(__name__)
+
+# 推送中间步骤的节流参数：累计新增字符数或间隔时间满足其一即推送一次
+_PUSH_MIN_CHARS = 24
+_PUSH_MIN_INTERVAL = 0.25
+
+
+def _chunk_text(chunk: Any) -> str:
+    """提取 LangChain 消息块中的文本（content 可能是字符串或内容块列表）"""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content or "")
+
+
+class _StepPublisher:
+    """将流式文本以 NAT 中间步骤（SPAN_START / SPAN_CHUNK / SPAN_END）推送给前端"""
+
+    def __init__(self, step_name: str):
+        self.step_name = step_name
+        self.step_id = str(uuid.uuid4())
+        self._manager = None
+        try:
+            self._manager = Context.get().intermediate_step_manager
+        except Exception as e:
+            logger.debug(f"无法获取中间步骤管理器，流式进度不会推送: {e}")
+
+    def _push(self, event_type: IntermediateStepType, data: StreamEventData) -> None:
+        if self._manager is None:
+            return
+        try:
+            self._manager.push_intermediate_step(
+                IntermediateStepPayload(UUID=self.step_id, event_type=event_type, name=self.step_name, data=data))
+        except Exception as e:
+            logger.debug(f"推送中间步骤失败: {e}")
+            self._manager = None
+
+    def start(self, prompt: str) -> None:
+        self._push(IntermediateStepType.SPAN_START, StreamEventData(input=prompt))
+
+    def chunk(self, text: str) -> None:
+        self._push(IntermediateStepType.SPAN_CHUNK, StreamEventData(chunk=text))
+
+    def end(self, text: str) -> None:
+        self._push(IntermediateStepType.SPAN_END, StreamEventData(output=text))
+
+
+async def stream_llm_text(llm: Any, prompt: str, step_name: str) -> str:
+    """
+    以流式方式调用 LLM（astream），边生成边通过中间步骤推送已生成的文本，返回完整回答
+    LLM 没有 astream，或在产生任何输出前抛出 NotImplementedError（不支持流式）时，回退为 ainvoke
+    """
+    publisher = _StepPublisher(step_name)
+    publisher.start(prompt)
+
+    parts = []
+    pending = ""
+    last_push = time.monotonic()
+    try:
+        streamed = False
+        if hasattr(llm, "astream"):
+            try:
+                async for chunk in llm.astream(prompt):
+                    text = _chunk_text(chunk)
+                    if not text:
+                        continue
+                    parts.append(text)
+                    pending += text
+                    now = time.monotonic()
+                    if len(pending) >= _PUSH_MIN_CHARS or now - last_push >= _PUSH_MIN_INTERVAL:
+                        publisher.chunk(pending)
+                        pending = ""
+                        last_push = now
+                streamed = True
+            except NotImplementedError as e:
+                if parts:
+                    raise
+                logger.debug(f"LLM不支持流式输出，回退为非流式调用: {e}")
+        if not streamed:
+            response = await llm.ainvoke(prompt)
+            parts = [_chunk_text(response)]
+    except Exception:
+        # 保证中间步骤成对出现，异常交由调用方处理
+        publisher.end("".join(parts))
+        raise
+
+    if pending:
+        publisher.chunk(pending)
+    result = "".join(parts)
+    publisher.end(result)
+    return result
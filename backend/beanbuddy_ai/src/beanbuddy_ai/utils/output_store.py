@@ -0,0 +1,113 @@
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .blob_store import BlobStore
+from .paths import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+# 后端提供设计图访问的路由前缀
+DESIGN_ROUTE_PREFIX = "/designs"
+
+# 输出类型 -> 文件后缀：渲染好的设计图与紧凑的拼豆网格（分块渲染的数据源）
+OUTPUT_DESIGNS = "designs"
+OUTPUT_GRIDS = "grids"
+_SUFFIXES = {OUTPUT_DESIGNS: ".png", OUTPUT_GRIDS: ".grid"}
+
+
+class OutputStore(BlobStore):
+    """
+    设计输出存储：内容哈希命名（<sha256><后缀>）、按前两位分片、临时文件写入后原子重命名
+    按最后生成时间与总大小定期清理，文件名即内容摘要，可放心设置长期缓存
+    """
+
+    def __init__(self,
+                 root: Path,
+                 suffix: str = ".png",
+                 max_age: float = 7 * 86400.0,
+                 max_bytes: int = 2 * 1024 * 1024 * 1024,
+                 gc_interval: float = 600.0):
+        super().__init__(root)
+        self.suffix = suffix
+        self._name_pattern = re.compile(rf"^[0-9a-f]{{64}}{re.escape(suffix)}$")
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.gc_interval = gc_interval
+        self._last_gc = 0.0
+        self._gc_lock = threading.Lock()
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}{self.suffix}"
+
+    def put(self, data: bytes) -> str:
+        """写入文件，返回文件名（<sha256><后缀>）；相同内容重复生成时刷新修改时间，避免被当作过期文件清理"""
+        digest = super().put(data)
+        os.utime(self.path(digest))
+        self.maybe_gc()
+        return f"{digest}{self.suffix}"
+
+    def resolve(self, name: str) -> Optional[Path]:
+        """根据文件名定位文件，名称不合法（防止路径穿越）或文件不存在时返回 None"""
+        if not self._name_pattern.match(name):
+            return None
+        path = self.path(name[:-len(self.suffix)])
+        return path if path.is_file() else None
+
+    def maybe_gc(self) -> None:
+        if time.monotonic() - self._last_gc >= self.gc_interval:
+            self.gc()
+
+    def gc(self) -> Tuple[int, int]:
+        """先删除超过 max_age 的文件，再按修改时间从旧到新删除直到总大小不超过 max_bytes，返回 (删除数, 释放字节)"""
+        if not self._gc_lock.acquire(blocking=False):
+            return 0, 0
+        try:
+            self._last_gc = time.monotonic()
+            cutoff = time.time() - self.max_age
+            files = []
+            for path in self.root.glob(f"*/*{self.suffix}"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+            files.sort()
+
+            total = sum(size for _, size, _ in files)
+            removed = freed = 0
+            for mtime, size, path in files:
+                if mtime >= cutoff and total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+                freed += size
+            if removed:
+                logger.info(f"输出目录 {self.root.name} 已清理{removed}个文件，释放{freed}字节，剩余{total}字节")
+            return removed, freed
+        finally:
+            self._gc_lock.release()
+
+
+_stores: Dict[str, OutputStore] = {}
+
+
+def get_output_store(kind: str = OUTPUT_DESIGNS) -> OutputStore:
+    """获取数据目录下共享的输出存储（designs：设计图PNG；grids：拼豆网格）"""
+    if kind not in _stores:
+        _stores[kind] = OutputStore(get_data_dir(kind), suffix=_SUFFIXES[kind])
+    return _stores[kind]
+
+
+def configure_output_store(max_age: float, max_bytes: int) -> OutputStore:
+    """按工具配置调整清理策略（设计图与网格共用同一策略），返回设计图存储"""
+    for kind in _SUFFIXES:
+        store = get_output_store(kind)
+        store.max_age = max_age
+        store.max_bytes = max_bytes
+    return get_output_store(OUTPUT_DESIGNS)
@@ -0,0 +1,26 @@
+import os
+from pathlib import Path
+
+# 包内配置目录（色卡、实体种子数据等）
+CONFIGS_DIR = Path(__file__).resolve().parent.parent / "configs"
+
+
+def get_data_dir(*parts: str) -> Path:
+    """
+    获取运行时数据目录（缓存、数据库、生成文件等），目录不存在时自动创建
+    优先使用环境变量 BEANBUDDY_DATA_DIR，默认 ~/.cache/beanbuddy_ai
+    """
+    root = Path(os.getenv("BEANBUDDY_DATA_DIR") or Path.home() / ".cache" / "beanbuddy_ai")
+    path = root.joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def resolve_data_path(path: str, *default_parts: str) -> Path:
+    """将配置中的路径解析为绝对路径：为空时使用数据目录下的默认位置，支持 ~ 展开"""
+    if not path:
+        *dirs, name = default_parts
+        return get_data_dir(*dirs) / name
+    resolved = Path(path).expanduser()
+    resolved.parent.mkdir(parents=True, exist_ok=True)
+    return resolved
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Sequence
+
+from .metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+# 完整质量档位的名称（未降级）
+FULL_QUALITY = "full"
+# 降级生成的设计结果末尾的档位说明（端到端缓存据此跳过降级结果）
+DEGRADED_NOTE_PREFIX = "*质量档位："
+# 评估耗时 SLO 所需的最少样本数
+_MIN_LATENCY_SAMPLES = 5
+
+QUALITY_LEVEL = gauge("beanbuddy_design_quality_level", "设计阶段当前的质量档位（0 为完整质量，越大降级越多）", ("tool",))
+QUALITY_DESIGNS = counter("beanbuddy_design_quality_total", "各质量档位生成的设计图数量", ("tool", "step"))
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class QualityLadder:
+    """
+    负载自适应的质量阶梯：档位 0 为完整质量，档位 i 使用第 i 个降级档位（越往后越快、质量越低）
+    - 负载（进行中的设计数或排队中的任务数）达到某档位的 min_loads 阈值时立即升到该档位（阈值为 0 的档位只由耗时触发）
+    - 最近 window 次设计耗时的 p90 超过 latency_slo 时升一级，每个冷却期最多一次
+    - 负载回落时每个冷却期降一级，逐步恢复完整质量；设置了 latency_slo 时还要求当前档位已有足够样本且 p90 不高于
+      latency_slo * recover_ratio（档位变化后样本清空，没有耗时依据时不恢复）
+    """
+
+    def __init__(self, name: str, steps: Sequence[str], min_loads: Sequence[int], latency_slo: float = 0.0,
+                 cooldown: float = 10.0, recover_ratio: float = 0.8, window: int = 20):
+        self.name = name
+        self.steps = [FULL_QUALITY, *steps]
+        self.min_loads = list(min_loads)
+        self.latency_slo = latency_slo
+        self.cooldown = cooldown
+        self.recover_ratio = recover_ratio
+        self.level = 0
+        self.in_flight = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._changed_at = time.monotonic()
+        self._lock = threading.Lock()
+        QUALITY_LEVEL.set(0, tool=name)
+
+    def _load_level(self, load: int) -> int:
+        level = 0
+        for index, threshold in enumerate(self.min_loads, start=1):
+            if threshold and load >= threshold:
+                level = index
+        return level
+
+    def select(self, load: Optional[int] = None) -> int:
+        """按当前负载（默认为进行中的设计数）与近期耗时选择本次设计使用的档位"""
+        now = time.monotonic()
+        with self._lock:
+            load = self.in_flight if load is None else load
+            by_load = self._load_level(load)
+            p90 = (_percentile(list(self._latencies), 90)
+                   if len(self._latencies) >= _MIN_LATENCY_SAMPLES else None)
+            cooled = now - self._changed_at >= self.cooldown
+            level = self.level
+            if by_load > level:
+                level = by_load
+            elif (self.latency_slo and p90 is not None and p90 > self.latency_slo
+                  and level < len(self.steps) - 1 and cooled):
+                level += 1
+            elif (level > by_load and cooled
+                  and (not self.latency_slo or (p90 is not None and p90 <= self.latency_slo * self.recover_ratio))):
+                level -= 1
+            if level != self.level:
+                reason = f"负载 {load}" + (f"，耗时 p90 {p90:.1f}秒" if p90 is not None else "")
+                logger.info(f"{self.name} 质量档位 {self.steps[self.level]} -> {self.steps[level]}（{reason}）")
+                self.level = level
+                self._changed_at = now
+                # 新档位的耗时重新统计，避免旧档位的慢样本阻碍恢复或重复升级
+                self._latencies.clear()
+            QUALITY_LEVEL.set(level, tool=self.name)
+            return level
+
+    def observe(self, level: int, latency: float) -> None:
+        """记录一次完成的设计（档位与耗时）"""
+        QUALITY_DESIGNS.inc(tool=self.name, step=self.steps[level])
+        with self._lock:
+            if level == self.level:
+                self._latencies.append(latency)
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """统计进行中的设计数（本地执行时作为负载）"""
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+# 工具名 -> 质量阶梯（参数仅在首次创建时生效）
+_ladders: Dict[str, QualityLadder] = {}
+
+
+def get_quality_ladder(name: str, **kwargs) -> QualityLadder:
+    if name not in _ladders:
+        _ladders[name] = QualityLadder(name, **kwargs)
+    return _ladders[name]
@@ -0,0 +1,337 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from .metrics import register_collector
+from .tracing import QUEUE_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """请求优先级（数值越小越先获得配额）"""
+    # 已经开始的会话中的后续调用，优先完成
+    CONTINUATION = 0
+    # 新会话的第一次调用
+    NEW = 1
+    # 预热、投机执行等可延后的调用
+    BACKGROUND = 2
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """单个模型的配额：每分钟请求数与每分钟token数，为空表示不限制"""
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+    # 令牌桶容量对应的秒数（允许的突发量），避免整分钟配额在一瞬间用完触发服务端的秒级限流
+    burst_seconds: float = 10.0
+
+
+# 默认配额（与账号等级相关，可通过环境变量 BEANBUDDY_RATE_LIMITS 覆盖，例如
+# {"qwen-plus": {"rpm": 1200, "tpm": 2000000}, "qwen-image": {"rpm": 60}}），未列出的模型不限流
+DEFAULT_RATE_LIMITS: Dict[str, RateLimit] = {
+    "qwen-plus": RateLimit(rpm=600, tpm=1_000_000),
+    "qwen-image": RateLimit(rpm=120),
+    "qwen-image-edit": RateLimit(rpm=120),
+}
+
+# 当前请求（任务上下文）的优先级：首次获得配额后自动升级为 CONTINUATION
+_current_priority: ContextVar[Priority] = ContextVar("beanbuddy_request_priority", default=Priority.NEW)
+
+
+class RateLimitExceeded(Exception):
+    """预计排队时间超过调用方可接受的上限（快速失败）"""
+
+    def __init__(self, key: str, estimated_wait: float):
+        self.key = key
+        self.estimated_wait = estimated_wait
+        super().__init__(f"{key} 配额繁忙，预计需要排队{estimated_wait:.1f}秒")
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+@contextmanager
+def priority_scope(priority: Priority) -> Iterator[None]:
+    """在代码块内以指定优先级申请配额"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class _TokenBucket:
+    """令牌桶：按每分钟额度匀速补充，余额允许为负（实际用量超出预估时从后续额度中扣除）"""
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """获得 amount 个令牌需要等待的秒数（超过桶容量的申请按桶满计算，避免永远等待）"""
+        self._refill(now)
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit / self.rate)
+
+    def estimate(self, amount: float, now: float) -> float:
+        """排队估算：不截断申请量"""
+        self._refill(now)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def consume(self, amount: float) -> None:
+        self.level -= amount
+
+    def drain(self) -> None:
+        self.level = min(self.level, 0.0)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class ModelRateLimiter:
+    """
+    单个服务商/模型的限流器
+    - 请求数与token数两个令牌桶，同时满足时才放行
+    - 等待队列按 (优先级, 到达顺序) 排序，高优先级请求先获得配额
+    - 申请前估算排队时间，超过调用方上限时直接抛出 RateLimitExceeded
+    - 服务端返回429时按 Retry-After 暂停放行，避免所有调用方同时盲目重试
+    """
+
+    def __init__(self, key: str, limit: RateLimit):
+        self.key = key
+        self.limit = limit
+        self._requests = _TokenBucket(limit.rpm, limit.burst_seconds) if limit.rpm else None
+        self._tokens = _TokenBucket(limit.tpm, limit.burst_seconds) if limit.tpm else None
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._paused_until = 0.0
+        self.granted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    def _wait_for(self, tokens: int, now: float) -> float:
+        wait = max(0.0, self._paused_until - now)
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1, now))
+        if self._tokens is not None and tokens:
+            wait = max(wait, self._tokens.wait_time(tokens, now))
+        return wait
+
+    def _consume(self, tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.consume(1)
+        if self._tokens is not None:
+            self._tokens.consume(tokens)
+
+    def estimate_wait(self, tokens: int = 0, priority: Priority = Priority.NEW) -> float:
+        """估算以指定优先级申请时的排队时间（排在前面的请求全部放行后才轮到本请求）"""
+        now = time.monotonic()
+        ahead = [w for w in self._waiters if w.priority <= priority and not w.future.done()]
+        wait = max(0.0, self._paused_until - now)
+        if self._requests is not None:
+            wait = max(wait, self._requests.estimate(len(ahead) + 1, now))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.estimate(sum(w.tokens for w in ahead) + tokens, now))
+        return wait
+
+    async def acquire(self, tokens: int = 0, priority: Optional[Priority] = None,
+                      max_wait: Optional[float] = None) -> float:
+        """
+        申请一次调用的配额，返回实际等待的秒数
+        priority 为空时使用当前上下文的优先级，获得配额后当前上下文升级为 CONTINUATION
+        """
+        from_context = priority is None
+        if from_context:
+            priority = current_priority()
+        estimated = self.estimate_wait(tokens, priority)
+        if max_wait is not None and estimated > max_wait:
+            self.rejected += 1
+            raise RateLimitExceeded(self.key, estimated)
+
+        started = time.monotonic()
+        if not self._waiters and self._wait_for(tokens, started) == 0:
+            self._consume(tokens)
+        else:
+            waiter = _Waiter(priority, next(self._seq), tokens, asyncio.get_running_loop().create_future())
+            heapq.heappush(self._waiters, waiter)
+            self._dispatch()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # 已获得配额但调用方被取消，归还配额
+                    self.refund(tokens)
+                self._dispatch()
+                raise
+            self.throttled += 1
+
+        waited = time.monotonic() - started
+        self.granted += 1
+        self.total_wait += waited
+        QUEUE_WAIT.observe(waited, queue=f"rate_limiter/{self.key}")
+        if from_context and priority == Priority.NEW:
+            _current_priority.set(Priority.CONTINUATION)
+        return waited
+
+    def _dispatch(self) -> None:
+        """按优先级依次放行队首请求，配额不足时在预计可放行的时间点再次调度"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters:
+            head = self._waiters[0]
+            if head.future.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._wait_for(head.tokens, time.monotonic())
+            if wait > 0:
+                self._timer = head.future.get_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._consume(head.tokens)
+            head.future.set_result(None)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """按实际token用量修正预估（多退少补）"""
+        if self._tokens is not None and actual_tokens != estimated_tokens:
+            self._tokens.consume(actual_tokens - estimated_tokens)
+
+    def refund(self, tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.consume(-1)
+        if self._tokens is not None:
+            self._tokens.consume(-tokens)
+
+    def penalize(self, retry_after: Optional[float] = None) -> None:
+        """服务端返回429：清空请求余额，并在 retry_after 秒内暂停放行"""
+        pause = retry_after if retry_after is not None else 1.0
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        if self._requests is not None:
+            self._requests.drain()
+        logger.warning(f"{self.key} 触发服务端限流，暂停放行{pause:.1f}秒")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"granted": self.granted, "throttled": self.throttled, "rejected": self.rejected,
+                "queued": len(self._waiters),
+                "avg_wait": round(self.total_wait / self.granted, 3) if self.granted else 0.0}
+
+
+class Reservation:
+    """一次已获得的配额，调用完成后可按实际token用量修正"""
+
+    def __init__(self, limiter: Optional[ModelRateLimiter], estimated_tokens: int):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+
+    def record_tokens(self, actual_tokens: Optional[int]) -> None:
+        if self.limiter is not None and actual_tokens is not None:
+            self.limiter.record_usage(self.estimated_tokens, actual_tokens)
+            self.estimated_tokens = actual_tokens
+
+
+@asynccontextmanager
+async def rate_limited(limiter: Optional[ModelRateLimiter],
+                       estimated_tokens: int = 0,
+                       max_wait: Optional[float] = None) -> AsyncIterator[Reservation]:
+    """在限流器允许后执行代码块；limiter 为空（模型未配置配额）时直接执行"""
+    if limiter is not None:
+        await limiter.acquire(estimated_tokens, max_wait=max_wait)
+    try:
+        yield Reservation(limiter, estimated_tokens)
+    except Exception as e:
+        # OpenAI 兼容接口的429异常带有 status_code 属性
+        if limiter is not None and getattr(e, "status_code", None) == 429:
+            limiter.penalize()
+        raise
+
+
+def provider_of(base_url: Optional[str]) -> str:
+    """服务商标识：接口地址的主机名"""
+    return urlparse(base_url or "").hostname or "default"
+
+
+def _load_rate_limits() -> Dict[str, RateLimit]:
+    limits = dict(DEFAULT_RATE_LIMITS)
+    raw = os.getenv("BEANBUDDY_RATE_LIMITS")
+    if raw:
+        try:
+            for model, values in json.loads(raw).items():
+                limits[model] = RateLimit(**values) if values else RateLimit()
+        except (ValueError, TypeError) as e:
+            logger.error(f"环境变量 BEANBUDDY_RATE_LIMITS 格式错误，使用默认配额: {e}")
+    return limits
+
+
+_rate_limits: Optional[Dict[str, RateLimit]] = None
+# (服务商, 模型) -> 限流器，同一进程内的所有工具共享
+_limiters: Dict[Tuple[str, str], Optional[ModelRateLimiter]] = {}
+
+
+def get_rate_limiter(provider: str, model: str) -> Optional[ModelRateLimiter]:
+    """获取服务商/模型的共享限流器，模型未配置配额时返回 None"""
+    global _rate_limits
+    key = (provider, model)
+    if key not in _limiters:
+        if _rate_limits is None:
+            _rate_limits = _load_rate_limits()
+        limit = _rate_limits.get(model)
+        _limiters[key] = ModelRateLimiter(f"{provider}/{model}", limit) \
+            if limit is not None and (limit.rpm or limit.tpm) else None
+    return _limiters[key]
+
+
+def get_llm_rate_limiter(llm_config: Any) -> Optional[ModelRateLimiter]:
+    """根据LLM配置（base_url + model_name）获取限流器"""
+    model = getattr(llm_config, "model_name", None) or getattr(llm_config, "model", None)
+    if not model:
+        return None
+    return get_rate_limiter(provider_of(getattr(llm_config, "base_url", None)), model)
+
+
+def response_total_tokens(response: Any) -> Optional[int]:
+    """读取 LangChain 响应中的实际token用量，不可用时返回 None"""
+    usage = getattr(response, "usage_metadata", None)
+    if isinstance(usage, dict) and usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    return None
+
+
+def rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {limiter.key: limiter.as_dict() for limiter in _limiters.values() if limiter is not None}
+
+
+def _collect_rate_limiter_metrics():
+    stats = rate_limiter_stats()
+    yield ("beanbuddy_rate_limiter_queued", "限流器当前排队的请求数", "gauge",
+           [({"limiter": key}, item["queued"]) for key, item in stats.items()])
+    for field_name in ("granted", "throttled", "rejected"):
+        yield (f"beanbuddy_rate_limiter_{field_name}_total", f"限流器累计 {field_name} 请求数", "counter",
+               [({"limiter": key}, item[field_name]) for key, item in stats.items()])
+
+
+register_collector(_collect_rate_limiter_metrics)
@@ -0,0 +1,33 @@
+import logging
+import threading
+from typing import Dict
+
+from rembg import new_session
+from rembg.sessions import BaseSession
+
+logger = logging.getLogger(__name__)
+
+# 加载失败时回退使用的模型
+DEFAULT_MODEL_NAME = "isnet-general-use"
+# 制品存储中"已是透明背景主体"的解码结果标识，设计工具遇到时跳过背景移除
+CUTOUT_KIND = "cutout"
+
+# 全局会话缓存：抠图工具与设计工具共享同一模型会话，避免重复加载
+_session_cache: Dict[str, BaseSession] = {}
+_session_lock = threading.Lock()
+
+
+def get_session(model_name: str = "birefnet-general") -> BaseSession:
+    """获取或创建模型会话（使用缓存避免重复加载模型）"""
+    with _session_lock:
+        if model_name not in _session_cache:
+            try:
+                _session_cache[model_name] = new_session(model_name)
+                logger.info(f"已加载模型: {model_name}")
+            except Exception as e:
+                logger.error(f"加载模型 {model_name} 失败: {e}")
+                # 回退到默认模型（与直接请求默认模型的调用方共用同一会话）
+                if DEFAULT_MODEL_NAME not in _session_cache:
+                    _session_cache[DEFAULT_MODEL_NAME] = new_session(DEFAULT_MODEL_NAME)
+                _session_cache[model_name] = _session_cache[DEFAULT_MODEL_NAME]
+        return _session_cache[model_name]
@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from .tracing import record_cache_lookup
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 归一化时移除的空白与标点
+_STRIP_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+# CJK 字符（估算 token 数时按 1 字 1 token 计）
+_CJK_PATTERN = re.compile(r"[㐀-鿿豈-﫿぀-ヿ가-힯]")
+
+
+def normalize_text(text: str) -> str:
+    """输入归一化：NFKC、大小写折叠、去除空白与标点（"雪山日出" 与 "雪山 日出" 归一为同一键）"""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return _STRIP_PATTERN.sub("", text)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：CJK 字符按 1 token，其余字符按 4 字符 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def template_version(template: str) -> str:
+    """提示词模版版本号（内容哈希），模版修改后旧缓存自动失效"""
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:12]
+
+
+def llm_signature(llm_config: Any) -> str:
+    """LLM 配置签名（模型、温度、最大 token 等，不含 api_key）"""
+    if hasattr(llm_config, "model_dump"):
+        data = llm_config.model_dump(exclude={"api_key"})
+    else:
+        data = {k: v for k, v in vars(llm_config).items() if k != "api_key"}
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def _char_ngrams(text: str, n: int) -> Set[str]:
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+@dataclass
+class ResponseCacheStats:
+    """缓存统计：命中（精确/近似）、未命中、并发合并次数及节省的 token 估算"""
+    hits: int = 0
+    near_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    saved_tokens: int = 0
+
+    @property
+    def requests(self) -> int:
+        return self.hits + self.near_hits + self.misses + self.coalesced
+
+    @property
+    def hit_ratio(self) -> float:
+        return (self.requests - self.misses) / self.requests if self.requests else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "requests": self.requests, "hit_ratio": round(self.hit_ratio, 4)}
+
+
+@dataclass
+class _CacheEntry:
+    value: str
+    # 一次完整调用的 token 估算（提示词 + 回答），命中时计入节省量
+    cost_tokens: int
+
+
+class ResponseCache:
+    """
+    LLM 响应缓存
+    - 键：归一化输入 + 提示词模版版本 + LLM 配置签名
+    - singleflight：相同键的并发请求只触发一次 LLM 调用，其余等待同一结果
+    - 可选近似匹配：同一模版/LLM 下字符 n-gram Jaccard 相似度不低于阈值时复用结果
+    - 调用失败（抛出异常）不写入缓存
+    """
+
+    def __init__(self,
+                 namespace: str,
+                 max_entries: int = 1024,
+                 ttl: float = 86400.0,
+                 similarity_threshold: float = 0.0,
+                 ngram_size: int = 2):
+        self.namespace = namespace
+        self.similarity_threshold = similarity_threshold
+        self.ngram_size = ngram_size
+        self.stats = ResponseCacheStats()
+        self._entries = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # (模版版本, LLM签名) -> {缓存键: 归一化文本的 n-gram 集合}，用于近似匹配
+        self._ngram_index: Dict[Tuple[str, str], "OrderedDict[str, Set[str]]"] = {}
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def make_key(self, normalized: str, template_ver: str, llm_sig: str) -> str:
+        raw = f"{self.namespace}\x00{template_ver}\x00{llm_sig}\x00{normalized}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_or_compute(self,
+                             text: str,
+                             template_ver: str,
+                             llm_sig: str,
+                             compute: Callable[[], Awaitable[str]],
+                             prompt_tokens: int = 0) -> str:
+        """读取缓存，未命中时执行 compute 并写入缓存"""
+        normalized = normalize_text(text)
+        key = self.make_key(normalized, template_ver, llm_sig)
+
+        entry: Optional[_CacheEntry] = self._entries.get(key)
+        if entry is not None:
+            self._record_hit(entry, near=False)
+            return entry.value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                value, cost = await asyncio.shield(inflight)
+                self.stats.coalesced += 1
+                self.stats.saved_tokens += cost
+                record_cache_lookup(f"llm_response/{self.namespace}", "coalesced")
+                return value
+            except asyncio.CancelledError:
+                # 发起调用的请求被取消而当前请求仍然有效时，改为自行调用
+                if asyncio.current_task().cancelling():
+                    raise
+
+        near_entry = self._find_similar(normalized, template_ver, llm_sig)
+        if near_entry is not None:
+            self._record_hit(near_entry, near=True)
+            return near_entry.value
+
+        self.stats.misses += 1
+        record_cache_lookup(f"llm_response/{self.namespace}", "miss")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            cost = prompt_tokens + estimate_tokens(value)
+            self._entries.set(key, _CacheEntry(value=value, cost_tokens=cost))
+            self._index(key, normalized, template_ver, llm_sig)
+            future.set_result((value, cost))
+            return value
+        except Exception as e:
+            # 让等待中的并发请求获得同样的异常，而不是永远挂起
+            future.set_exception(e)
+            # 没有等待者时避免 "Future exception was never retrieved" 警告
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def _record_hit(self, entry: _CacheEntry, near: bool) -> None:
+        if near:
+            self.stats.near_hits += 1
+        else:
+            self.stats.hits += 1
+        self.stats.saved_tokens += entry.cost_tokens
+        record_cache_lookup(f"llm_response/{self.namespace}", "near_hit" if near else "hit")
+        if self.stats.requests % 50 == 0:
+            self.log_stats()
+
+    def _index(self, key: str, normalized: str, template_ver: str, llm_sig: str) -> None:
+        if self.similarity_threshold <= 0:
+            return
+        with self._lock:
+            index = self._ngram_index.setdefault((template_ver, llm_sig), OrderedDict())
+            index[key] = _char_ngrams(normalized, self.ngram_size)
+            while len(index) > self._max_entries:
+                index.popitem(last=False)
+
+    def _find_similar(self, normalized: str, template_ver: str, llm_sig: str) -> Optional[_CacheEntry]:
+        if self.similarity_threshold <= 0:
+            return None
+        grams = _char_ngrams(normalized, self.ngram_size)
+        best_key, best_score = None, 0.0
+        with self._lock:
+            index = self._ngram_index.get((template_ver, llm_sig), {})
+            for key, other in index.items():
+                score = len(grams & other) / len(grams | other)
+                if score > best_score:
+                    best_key, best_score = key, score
+        if best_key is None or best_score < self.similarity_threshold:
+            return None
+        entry = self._entries.get(best_key)
+        if entry is None:
+            # 已过期或被淘汰
+            with self._lock:
+                self._ngram_index.get((template_ver, llm_sig), {}).pop(best_key, None)
+        return entry
+
+    def log_stats(self) -> None:
+        logger.info(f"LLM响应缓存[{self.namespace}]统计: {self.stats.as_dict()}")
+
+
+# 命名空间 -> 缓存实例，同一进程内的工具共享
+_caches: Dict[str, ResponseCache] = {}
+
+
+def get_response_cache(namespace: str, **kwargs) -> ResponseCache:
+    """获取（或按参数创建）指定命名空间的响应缓存"""
+    if namespace not in _caches:
+        _caches[namespace] = ResponseCache(namespace, **kwargs)
+    return _caches[namespace]
+
+
+def response_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """全部响应缓存的统计信息（命中率、节省 token 等）"""
+    return {namespace: cache.stats.as_dict() for namespace, cache in _caches.items()}
@@ -0,0 +1,201 @@
+import asyncio
+import functools
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .cancellation import OperationCancelled
+from .metrics import counter, histogram, register_collector
+
+logger = logging.getLogger(__name__)
+
+# span 类型：工具、LLM调用、HTTP/外部接口调用、本地计算（进程池、渲染等）
+SPAN_TOOL = "tool"
+SPAN_LLM = "llm"
+SPAN_HTTP = "http"
+SPAN_COMPUTE = "compute"
+
+SPAN_DURATION = histogram("beanbuddy_span_duration_seconds", "工具、外部调用与本地计算的耗时",
+                          ("kind", "name", "status"))
+LLM_TOKENS = counter("beanbuddy_llm_tokens_total", "LLM token 用量", ("model", "tool", "type"))
+TRANSFER_BYTES = counter("beanbuddy_transfer_bytes_total", "外部接口与图片传输的字节数", ("name", "direction"))
+CACHE_LOOKUPS = counter("beanbuddy_cache_lookups_total", "缓存查询次数（按结果：hit / near_hit / coalesced / miss）",
+                        ("cache", "result"))
+QUEUE_WAIT = histogram("beanbuddy_queue_wait_seconds", "限流器与外部接口并发槽位的排队等待时间", ("queue",))
+
+
+
+def _cache_hit_ratio():
+    """按缓存汇总命中率（近似命中与合并请求均视为命中）"""
+    totals: Dict[str, list] = {}
+    for (cache, result), value in CACHE_LOOKUPS.values().items():
+        hits, lookups = totals.setdefault(cache, [0.0, 0.0])
+        totals[cache] = [hits + (value if result != "miss" else 0.0), lookups + value]
+    yield ("beanbuddy_cache_hit_ratio", "缓存命中率", "gauge",
+           [({"cache": cache}, hits / lookups) for cache, (hits, lookups) in sorted(totals.items()) if lookups])
+
+
+register_collector(_cache_hit_ratio)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("beanbuddy_current_span", default=None)
+
+
+class Span:
+    """
+    一段计时区间：结束时记录耗时直方图，并以 NAT 中间步骤（SPAN_START / SPAN_END）推送，
+    由 NAT 自动挂到当前工具（函数）步骤之下，同一请求的各工具与外部调用构成一棵调用树，
+    可通过 general.telemetry.tracing 配置的导出器（本地文件、OpenTelemetry 收集器等）导出
+    """
+
+    def __init__(self, name: str, kind: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.status = "ok"
+        self.span_id = str(uuid.uuid4())
+        self.tool = None
+        self.started = time.time()
+        self._manager = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def set_error(self, error: Any) -> None:
+        self.status = "error"
+        self.attributes["error"] = str(error)[:500]
+
+    def set_cancelled(self) -> None:
+        """请求被取消（客户端断开等），耗时计入 status=cancelled，可据此统计被浪费的工作"""
+        self.status = "cancelled"
+
+    def _push(self, event_type: Any, **fields: Any) -> None:
+        from nat.data_models.intermediate_step import IntermediateStepPayload, TraceMetadata
+
+        if self._manager is None:
+            return
+        try:
+            self._manager.push_intermediate_step(IntermediateStepPayload(
+                UUID=self.span_id, event_type=event_type, name=self.name,
+                metadata=TraceMetadata(provided_metadata={"kind": self.kind, **self.attributes}), **fields))
+        except Exception as e:
+            logger.debug(f"推送 span 失败: {e}")
+            self._manager = None
+
+    def start(self) -> None:
+        # 只在事件循环线程中推送中间步骤（线程池 / 子进程中没有可用的 NAT 上下文，只记录指标）
+        try:
+            asyncio.get_running_loop()
+            from nat.builder.context import Context
+            from nat.data_models.intermediate_step import IntermediateStepType
+            self._manager = Context.get().intermediate_step_manager
+            self._push(IntermediateStepType.SPAN_START)
+        except Exception:
+            self._manager = None
+
+    def end(self) -> None:
+        duration = time.time() - self.started
+        self.attributes["duration"] = round(duration, 4)
+        SPAN_DURATION.observe(duration, kind=self.kind, name=self.name, status=self.status)
+        if self._manager is not None:
+            from nat.data_models.intermediate_step import IntermediateStepType, StreamEventData, UsageInfo
+            from nat.profiler.callbacks.token_usage_base_model import TokenUsageBaseModel
+            usage = None
+            if "total_tokens" in self.attributes:
+                usage = UsageInfo(token_usage=TokenUsageBaseModel(
+                    prompt_tokens=self.attributes.get("input_tokens", 0),
+                    completion_tokens=self.attributes.get("output_tokens", 0),
+                    total_tokens=self.attributes["total_tokens"]), num_llm_calls=1)
+            self._push(IntermediateStepType.SPAN_END, span_event_timestamp=self.started, usage_info=usage,
+                       data=StreamEventData(output=self.status))
+
+
+def llm_model_name(llm_config: Any) -> str:
+    """从LLM配置中读取模型名称，作为 token 用量的标签"""
+    return getattr(llm_config, "model_name", None) or getattr(llm_config, "model", None) or "unknown"
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, kind: str, **attributes: Any) -> Iterator[Span]:
+    """记录一段计时区间，代码块抛出异常时标记为失败、被取消时标记为已取消；嵌套的 span 继承所属工具名称"""
+    parent = _current_span.get()
+    current = Span(name, kind, attributes)
+    current.tool = name if kind == SPAN_TOOL else (parent.tool if parent is not None else None)
+    current.start()
+    token = _current_span.set(current)
+    try:
+        yield current
+    except (asyncio.CancelledError, OperationCancelled):
+        current.set_cancelled()
+        raise
+    except BaseException as e:
+        current.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced_tool(name: str) -> Callable:
+    """工具函数装饰器：每次调用记录一个工具 span（保留函数签名，FunctionInfo.from_fn 仍可推断输入输出类型）"""
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name, SPAN_TOOL):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_error(error: Any) -> None:
+    """工具捕获异常并返回降级结果时，将当前 span 标记为失败（计入错误率）"""
+    current = _current_span.get()
+    if current is not None:
+        current.set_error(error)
+
+
+def record_cache_lookup(cache: str, result: str) -> None:
+    """记录一次缓存查询结果（hit / near_hit / coalesced / miss），并作为属性附加到当前 span"""
+    CACHE_LOOKUPS.inc(cache=cache, result=result)
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[f"cache.{cache}"] = result
+
+
+def record_bytes(name: str, size: int, direction: str = "in") -> None:
+    TRANSFER_BYTES.inc(size, name=name, direction=direction)
+    current = _current_span.get()
+    if current is not None:
+        key = f"bytes_{direction}"
+        current.attributes[key] = current.attributes.get(key, 0) + size
+
+
+def record_llm_usage(llm_span: Span, model: str, response: Any = None,
+                     input_tokens: Optional[int] = None, output_tokens: Optional[int] = None) -> None:
+    """
+    记录LLM token 用量：优先读取响应中的 usage_metadata，缺失时使用调用方传入的估算值
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if isinstance(usage, dict) and usage.get("total_tokens"):
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        llm_span.set(token_source="usage")
+    elif input_tokens is None and output_tokens is None:
+        return
+    else:
+        llm_span.set(token_source="estimate")
+    input_tokens, output_tokens = int(input_tokens or 0), int(output_tokens or 0)
+    llm_span.set(model=model, input_tokens=input_tokens, output_tokens=output_tokens,
+                 total_tokens=input_tokens + output_tokens)
+    tool = llm_span.tool or "unknown"
+    LLM_TOKENS.inc(input_tokens, model=model, tool=tool, type="input")
+    LLM_TOKENS.inc(output_tokens, model=model, tool=tool, type="output")
@@ -0,0 +1,289 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Literal, Optional, Tuple
+
+from nat.builder.builder import Builder
+from nat.builder.function import Function
+from nat.builder.function_info import FunctionInfo
+from nat.cli.register_workflow import register_function
+from nat.data_models.component_ref import FunctionRef
+from nat.data_models.function import FunctionBaseConfig
+from pydantic import Field
+
+from ..models import (InputType, IdentifyInputTypeInput, IdentifyInputTypeOutput, EnhanceDescriptionInput,
+                      EnhanceDescriptionOutput, QueryKnowledgeGraphInput, QueryKnowledgeGraphOutput,
+                      ExtractSubjectInput, ExtractSubjectOutput, GenerateImageFromTextInput,
+                      GenerateImageFromTextOutput, GenerateBeanBuddyDesignInput, GenerateBeanBuddyDesignOutput)
+from ..utils.artifact_store import ARTIFACT_SCHEME
+from ..utils.image_ingest import ImageIngestError, ingest_data_uri, is_data_uri
+
+logger = logging.getLogger(__name__)
+
+# 可以直接交给设计工具的图片引用前缀（含进程内制品引用）
+_IMAGE_REFERENCE_PREFIXES = ("http://", "https://", ARTIFACT_SCHEME)
+
+
+class BeanBuddyPipelineConfig(FunctionBaseConfig, name="bean_buddy_pipeline"):
+    """
+    A deterministic workflow that runs the BeanBuddy tool graph directly in code:
+    identify -> (enhance | query -> generate image) | extract subject -> design.
+    The LLM is only used inside the tools; requests outside the graph can be handed to a fallback agent.
+    """
+    identify_input_type_name: FunctionRef = Field(
+        default="identify_input_type",
+        description="输入识别工具名称"
+    )
+    enhance_description_name: FunctionRef = Field(
+        default="enhance_description",
+        description="文本描述增强工具名称"
+    )
+    query_knowledge_graph_name: FunctionRef = Field(
+        default="query_knowledge_graph",
+        description="实体特征查询工具名称"
+    )
+    extract_subject_name: FunctionRef = Field(
+        default="extract_subject",
+        description="图片主体提取工具名称"
+    )
+    generate_image_from_text_name: FunctionRef = Field(
+        default="generate_image_from_text",
+        description="文生图工具名称"
+    )
+    generate_bean_buddy_design_name: FunctionRef = Field(
+        default="generate_bean_buddy_design",
+        description="拼豆设计图生成工具名称"
+    )
+    fallback_agent_name: Optional[FunctionRef] = Field(
+        default=None,
+        description="固定流程无法处理的请求（如长对话、流程中途失败）转交的Agent函数名称，为空时直接返回错误提示"
+    )
+    max_direct_input_chars: int = Field(
+        default=200,
+        description="直接走固定流程的文本输入最大长度，超过时视为对话类请求转交给Agent"
+    )
+    speculative_mode: Literal["off", "likely", "both"] = Field(
+        default="off",
+        description="文本输入的投机执行模式：off 关闭；likely 在分类的同时启动最可能的分支；both 同时启动两个分支。"
+                    "分类完成后保留匹配的分支，取消另一个"
+    )
+    entity_guess_max_chars: int = Field(
+        default=8,
+        description="likely 模式下，不超过该长度且不含空白/标点的文本被猜测为实体名称，否则猜测为文本描述"
+    )
+    speculative_branch_cost_tokens: int = Field(
+        default=1500,
+        description="单次投机分支的预估token消耗（提示词+回答），用于预算扣减"
+    )
+    speculative_token_budget: int = Field(
+        default=200000,
+        description="每个预算窗口内允许投机执行额外消耗的token上限，超出后退化为顺序执行"
+    )
+    speculative_budget_window: float = Field(
+        default=3600.0,
+        description="投机执行预算的统计窗口（秒）"
+    )
+
+
+class _SpeculationBudget:
+    """投机执行的token预算（滑动窗口），预留失败时不启动投机分支"""
+
+    def __init__(self, budget_tokens: int, window: float):
+        self.budget_tokens = budget_tokens
+        self.window = window
+        # (预留时间, 预留编号, token数)
+        self._spent: Deque[Tuple[float, int, int]] = deque()
+        self._next_handle = itertools.count()
+        self.wasted_tokens = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _used(self) -> int:
+        cutoff = time.monotonic() - self.window
+        while self._spent and self._spent[0][0] < cutoff:
+            self._spent.popleft()
+        return sum(tokens for _, _, tokens in self._spent)
+
+    def try_reserve(self, tokens: int) -> Optional[int]:
+        """预留token，成功时返回预留编号（用于退还），预算不足时返回None"""
+        if self._used() + tokens > self.budget_tokens:
+            return None
+        handle = next(self._next_handle)
+        self._spent.append((time.monotonic(), handle, tokens))
+        return handle
+
+    def refund(self, handle: int) -> None:
+        """投机命中时退还该次预留（命中的分支本来就要执行，不算额外消耗）；预留已滑出窗口时无需处理"""
+        for i, (_, reserved, _) in enumerate(self._spent):
+            if reserved == handle:
+                del self._spent[i]
+                return
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "wasted_tokens": self.wasted_tokens,
+                "window_used_tokens": self._used(), "window_budget_tokens": self.budget_tokens}
+
+
+def _guess_text_input_type(text: str, entity_max_chars: int) -> InputType:
+    """根据文本形态猜测分类结果：短且不含空白/标点的文本更可能是实体名称"""
+    if len(text) <= entity_max_chars and all(ch.isalnum() for ch in text):
+        return InputType.ENTITY_NAME
+    return InputType.TEXT_DESCRIPTION
+
+
+@register_function(config_type=BeanBuddyPipelineConfig)
+async def bean_buddy_pipeline_function(
+        config: BeanBuddyPipelineConfig, builder: Builder
+):
+    """
+    确定性的拼豆设计工作流
+    按固定顺序直接调用工具，不经过ReAct Agent的路由推理：
+    - "text_description" -> enhance_description -> generate_image_from_text -> generate_bean_buddy_design
+    - "entity_name" -> query_knowledge_graph -> generate_image_from_text -> generate_bean_buddy_design
+    - "image" -> extract_subject -> generate_bean_buddy_design
+    """
+    identify_fn = await builder.get_function(config.identify_input_type_name)
+    enhance_fn = await builder.get_function(config.enhance_description_name)
+    query_fn = await builder.get_function(config.query_knowledge_graph_name)
+    extract_fn = await builder.get_function(config.extract_subject_name)
+    generate_image_fn = await builder.get_function(config.generate_image_from_text_name)
+    design_fn = await builder.get_function(config.generate_bean_buddy_design_name)
+    fallback_fn: Optional[Function] = None
+    if config.fallback_agent_name:
+        fallback_fn = await builder.get_function(config.fallback_agent_name)
+
+    async def _fallback(input_message: str, reason: str) -> str:
+        if fallback_fn is None:
+            logger.warning(f"固定流程无法处理该请求（{reason}），且未配置兜底Agent")
+            return f"抱歉，暂时无法生成拼豆设计图：{reason}"
+        logger.info(f"请求转交兜底Agent处理：{reason}")
+        return await fallback_fn.ainvoke(input_message, to_type=str)
+
+    budget = _SpeculationBudget(config.speculative_token_budget, config.speculative_budget_window)
+
+    async def _describe(input_type: InputType, text: str) -> str:
+        """文本分支：实体名称查询特征，文本描述进行增强，返回文生图提示词"""
+        if input_type == InputType.ENTITY_NAME:
+            described = await query_fn.ainvoke(QueryKnowledgeGraphInput(input_data=text),
+                                               to_type=QueryKnowledgeGraphOutput)
+        else:
+            described = await enhance_fn.ainvoke(EnhanceDescriptionInput(input_data=text),
+                                                 to_type=EnhanceDescriptionOutput)
+        return described.input_data
+
+    async def _generate_image(identified: IdentifyInputTypeOutput, description: Optional[str] = None) -> str:
+        """根据识别结果生成（或提取）用于设计的主体图片，description 为已完成的文本分支结果"""
+        if identified.input_type == InputType.IMAGE:
+            extracted = await extract_fn.ainvoke(ExtractSubjectInput(input_data=identified.input_data),
+                                                 to_type=ExtractSubjectOutput)
+            return extracted.input_data
+
+        if description is None:
+            description = await _describe(identified.input_type, identified.input_data)
+        generated = await generate_image_fn.ainvoke(GenerateImageFromTextInput(input_data=description),
+                                                    to_type=GenerateImageFromTextOutput)
+        return generated.input_data
+
+    async def _identify_speculatively(raw_input: str) -> Tuple[IdentifyInputTypeOutput, Optional[str]]:
+        """
+        分类与文本分支并发执行：保留与分类结果一致的分支，取消其余分支
+        返回 (识别结果, 已完成的文本分支结果或None)
+        """
+        if config.speculative_mode == "both":
+            candidates = [InputType.ENTITY_NAME, InputType.TEXT_DESCRIPTION]
+        else:
+            candidates = [_guess_text_input_type(raw_input, config.entity_guess_max_chars)]
+
+        cost = config.speculative_branch_cost_tokens
+        branches: Dict[InputType, Tuple[asyncio.Task, int]] = {}
+        for input_type in candidates:
+            handle = budget.try_reserve(cost)
+            if handle is not None:
+                branches[input_type] = (asyncio.create_task(_describe(input_type, raw_input)), handle)
+            else:
+                logger.info("投机执行预算已用尽，退化为顺序执行")
+
+        async def _cancel(tasks: List[asyncio.Task]) -> None:
+            # 等待被取消的分支真正结束，避免遗留未回收的任务与未取回的异常
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            identified = await identify_fn.ainvoke(IdentifyInputTypeInput(input_data=raw_input),
+                                                   to_type=IdentifyInputTypeOutput)
+        except BaseException:
+            await _cancel([task for task, _ in branches.values()])
+            raise
+
+        chosen = branches.pop(identified.input_type, None)
+        losers = [task for task, _ in branches.values()]
+        if chosen is not None and identified.input_data != raw_input:
+            # 识别工具改写了输入（如解码失败兜底），投机分支的输入已不匹配
+            losers.append(chosen[0])
+            chosen = None
+        budget.wasted_tokens += cost * len(losers)
+        await _cancel(losers)
+        if chosen is None:
+            budget.misses += 1
+            return identified, None
+
+        task, handle = chosen
+        budget.hits += 1
+        budget.refund(handle)
+        return identified, await task
+
+    async def _bean_buddy_pipeline(input_message: str) -> str:
+        """
+        工作流主逻辑
+
+        Args:
+            input_message: 用户输入（文本描述、主体名称、图片URL、artifact:// 引用或图片 data URI）
+
+        Returns:
+            str: 拼豆设计图及材料清单（Markdown）
+        """
+        raw_input = input_message.strip()
+        if not raw_input:
+            return await _fallback(input_message, "输入为空")
+        if is_data_uri(raw_input):
+            # 内联图片先写入制品存储，工具之间只传递引用
+            try:
+                raw_input = await asyncio.to_thread(ingest_data_uri, raw_input)
+            except ImageIngestError as e:
+                return f"抱歉，无法读取上传的图片：{e}"
+        if not raw_input.startswith(_IMAGE_REFERENCE_PREFIXES) and len(raw_input) > config.max_direct_input_chars:
+            return await _fallback(input_message, "输入过长，不属于固定设计流程")
+
+        description: Optional[str] = None
+        if config.speculative_mode != "off" and not raw_input.startswith(_IMAGE_REFERENCE_PREFIXES):
+            identified, description = await _identify_speculatively(raw_input)
+        else:
+            identified = await identify_fn.ainvoke(IdentifyInputTypeInput(input_data=raw_input),
+                                                   to_type=IdentifyInputTypeOutput)
+        logger.info(f"输入识别结果：{identified.input_type.value}")
+
+        image_reference = await _generate_image(identified, description)
+        if not image_reference.startswith(_IMAGE_REFERENCE_PREFIXES):
+            # 工具失败时返回的是错误信息或原始文本，而不是图片引用
+            return await _fallback(input_message, f"主体图片生成失败（{image_reference[:100]}）")
+
+        design = await design_fn.ainvoke(GenerateBeanBuddyDesignInput(input_data=image_reference),
+                                         to_type=GenerateBeanBuddyDesignOutput)
+        if design.input_data == image_reference:
+            # 设计工具失败时原样返回输入
+            return await _fallback(input_message, "拼豆设计图生成失败")
+        return design.input_data
+
+    try:
+        yield FunctionInfo.from_fn(
+            _bean_buddy_pipeline,
+            description="Generate a Q-style bean design and material list by running the tool graph directly.")
+    except GeneratorExit:
+        logger.warning("Function exited early!")
+    finally:
+        if config.speculative_mode != "off":
+            logger.info(f"投机执行统计: {budget.as_dict()}")
+        logger.info("Cleaning up bean_buddy_pipeline workflow.")
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from nat.builder.builder import Builder
+from nat.builder.function_info import FunctionInfo
+from nat.cli.register_workflow import register_function
+from nat.data_models.component_ref import FunctionRef
+from nat.data_models.function import FunctionBaseConfig
+from pydantic import Field
+
+from ..utils.artifact_store import ARTIFACT_SCHEME
+from ..utils.image_ingest import DATA_URI_PREFIX
+from ..utils.output_store import DESIGN_ROUTE_PREFIX, get_output_store
+from ..utils.quality_ladder import DEGRADED_NOTE_PREFIX
+from ..utils.response_cache import normalize_text
+from ..utils.tracing import record_cache_lookup
+from ..utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 图片输入不参与缓存（URL 很少重复，归一化去除标点后也不可靠）
+_IMAGE_REFERENCE_PREFIXES = ("http://", "https://", ARTIFACT_SCHEME, DATA_URI_PREFIX)
+# 设计结果中的设计图地址：/designs/<sha256>.png
+_DESIGN_IMAGE_PATTERN = re.compile(rf"{re.escape(DESIGN_ROUTE_PREFIX)}/([0-9a-f]{{64}}\.png)")
+
+
+class BeanBuddyMemoConfig(FunctionBaseConfig, name="bean_buddy_memo"):
+    """
+    An opt-in end-to-end memo in front of a BeanBuddy workflow: repeated requests for the same
+    normalized input (e.g. popular entity names) return the stored design without running the workflow.
+    """
+    workflow_name: FunctionRef = Field(
+        default="bean_buddy_pipeline",
+        description="被缓存的工作流函数名称（固定流程或Agent）"
+    )
+    design_tool_name: FunctionRef = Field(
+        default="generate_bean_buddy_design",
+        description="设计工具名称，其配置（色卡模版、颜色数等）参与缓存键"
+    )
+    config_version: str = Field(
+        default="1",
+        description="配置版本号：修改提示词等无法自动识别的配置后递增，使旧的缓存结果失效"
+    )
+    ttl: float = Field(
+        default=86400.0,
+        description="缓存结果的有效期（秒），应小于设计图输出的保留时间"
+    )
+    max_entries: int = Field(
+        default=1024,
+        description="最多缓存的不同输入数"
+    )
+    variety: int = Field(
+        default=1,
+        ge=1,
+        description="每个输入保留的不同设计数 K：不足 K 个时继续执行完整工作流并保存新结果，达到 K 个后在其中轮换返回"
+    )
+    max_input_chars: int = Field(
+        default=50,
+        description="参与缓存的输入最大长度，更长的文本（描述、对话）通常不会重复，直接执行工作流"
+    )
+
+
+@dataclass
+class _MemoEntry:
+    """同一输入的已保存设计（最多 variety 个）与轮换位置"""
+    variants: List[str] = field(default_factory=list)
+    cursor: int = 0
+
+
+def _config_signature(*configs: FunctionBaseConfig) -> str:
+    payload = json.dumps([c.model_dump(mode="json") for c in configs], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def _design_available(markdown: str) -> bool:
+    """结果中引用的设计图仍在输出存储中（未被清理）"""
+    names = _DESIGN_IMAGE_PATTERN.findall(markdown)
+    store = get_output_store()
+    return bool(names) and all(store.resolve(name) is not None for name in names)
+
+
+@register_function(config_type=BeanBuddyMemoConfig)
+async def bean_buddy_memo_function(config: BeanBuddyMemoConfig, builder: Builder):
+    """
+    端到端结果缓存工作流
+    缓存键：归一化输入 + 设计工具配置（色卡模版等）+ 被缓存工作流的配置签名 + 配置版本号
+    只缓存成功生成设计图的结果；命中时直接返回保存的设计图与材料清单（Markdown），不调用工作流中的任何LLM或工具
+    """
+    workflow_fn = await builder.get_function(config.workflow_name)
+    signature = _config_signature(builder.get_function_config(config.workflow_name),
+                                  builder.get_function_config(config.design_tool_name))
+    entries = TTLCache(max_entries=config.max_entries, ttl=config.ttl)
+    inflight: Dict[str, asyncio.Future] = {}
+    stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def _key(normalized: str) -> str:
+        raw = f"{config.config_version}\x00{signature}\x00{normalized}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _lookup(key: str) -> Optional[str]:
+        entry: Optional[_MemoEntry] = entries.get(key)
+        if entry is None:
+            return None
+        entry.variants = [v for v in entry.variants if _design_available(v)]
+        if len(entry.variants) < config.variety:
+            # 变体数不足 K 时继续生成新设计
+            return None
+        result = entry.variants[entry.cursor % len(entry.variants)]
+        entry.cursor += 1
+        return result
+
+    def _store(key: str, result: str) -> None:
+        entry: Optional[_MemoEntry] = entries.get(key)
+        if entry is None:
+            entry = _MemoEntry()
+        if result not in entry.variants:
+            entry.variants = (entry.variants + [result])[-config.variety:]
+        # 每次写入刷新有效期
+        entries.set(key, entry)
+
+    async def _bean_buddy_memo(input_message: str) -> str:
+        """
+        带端到端缓存的工作流入口
+
+        Args:
+            input_message: 用户输入（文本描述、主体名称或图片URL）
+
+        Returns:
+            str: 拼豆设计图及材料清单（Markdown）
+        """
+        raw_input = input_message.strip()
+        if raw_input.startswith(_IMAGE_REFERENCE_PREFIXES) or len(raw_input) > config.max_input_chars:
+            return await workflow_fn.ainvoke(input_message, to_type=str)
+        normalized = normalize_text(raw_input)
+        if not normalized:
+            return await workflow_fn.ainvoke(input_message, to_type=str)
+
+        key = _key(normalized)
+        cached = _lookup(key)
+        if cached is not None:
+            stats["hits"] += 1
+            record_cache_lookup("pipeline_memo", "hit")
+            logger.info(f"端到端缓存命中：{raw_input[:20]}")
+            return cached
+
+        pending = inflight.get(key)
+        if pending is not None and key not in entries:
+            # 首次请求尚未完成，相同输入的并发请求等待同一结果
+            try:
+                result = await asyncio.shield(pending)
+                stats["coalesced"] += 1
+                record_cache_lookup("pipeline_memo", "coalesced")
+                return result
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception:
+                pass
+
+        stats["misses"] += 1
+        record_cache_lookup("pipeline_memo", "miss")
+        future = asyncio.get_running_loop().create_future()
+        inflight[key] = future
+        started = time.monotonic()
+        try:
+            result = await workflow_fn.ainvoke(input_message, to_type=str)
+            # 负载高峰时降级生成的结果不缓存，负载回落后重新生成完整质量的设计图
+            if _design_available(result) and DEGRADED_NOTE_PREFIX not in result:
+                _store(key, result)
+                logger.info(f"已缓存 {raw_input[:20]} 的设计结果（耗时{time.monotonic() - started:.1f}秒）")
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "Future exception was never retrieved" 警告
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            if inflight.get(key) is future:
+                inflight.pop(key)
+
+    try:
+        yield FunctionInfo.from_fn(
+            _bean_buddy_memo,
+            description="Return a stored bean design for repeated inputs, otherwise run the wrapped workflow.")
+    except GeneratorExit:
+        logger.warning("Function exited early!")
+    finally:
+        logger.info(f"端到端缓存统计: {stats}，缓存输入数 {len(entries)}")
+        logger.info("Cleaning up bean_buddy_memo workflow.")
@@ -0,0 +1,3 @@
+# flake8: noqa
+from . import bean_buddy_pipeline
+from . import pipeline_memo
@@ -0,0 +1,113 @@
+import os
+import time
+
+import pytest
+
+from beanbuddy_ai.utils import artifact_store
+from beanbuddy_ai.utils.artifact_store import ArtifactStore, artifact_digest
+from beanbuddy_ai.utils.blob_store import BlobStore
+
+
+class _Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(artifact_store.time, "time", clock)
+    return clock
+
+
+def _store(tmp_path, **kwargs) -> ArtifactStore:
+    return ArtifactStore(BlobStore(tmp_path / "spill"), BlobStore(tmp_path / "persist"), **kwargs)
+
+
+def _in_memory(store: ArtifactStore, ref: str) -> bool:
+    return artifact_digest(ref) in store._items
+
+
+def test_lru_entry_spills_and_is_read_back(tmp_path):
+    store = _store(tmp_path, max_memory_bytes=250)
+    first = store.put_bytes(b"a" * 100)
+    second = store.put_bytes(b"b" * 100)
+    # 访问 first 后 second 成为最久未访问的条目
+    assert store.get_bytes(first) == b"a" * 100
+    third = store.put_bytes(b"c" * 100)
+
+    assert _in_memory(store, first) and _in_memory(store, third)
+    assert not _in_memory(store, second)
+    assert store.spill_store.has(artifact_digest(second))
+    assert store.has(second)
+    # 从磁盘读回并重新载入内存
+    assert store.get_bytes(second) == b"b" * 100
+    assert _in_memory(store, second)
+    assert store.stats()["memory_bytes"] <= 250
+
+
+def test_decoded_results_count_towards_memory_and_are_dropped_on_spill(tmp_path):
+    store = _store(tmp_path, max_memory_bytes=1000)
+    ref = store.put_bytes(b"a" * 100)
+    store.get_decoded(ref, "upper", lambda data: data.upper())
+    assert store.stats()["memory_bytes"] == 200
+    store.put_bytes(b"b" * 900)
+
+    assert not _in_memory(store, ref)
+    assert store.get_decoded(ref, "upper") is None
+    assert store.get_decoded(ref, "upper", lambda data: data.upper()) == b"A" * 100
+
+
+def test_expired_entries_are_evicted(tmp_path, clock):
+    store = _store(tmp_path, ttl=60)
+    ref = store.put_bytes(b"a" * 100)
+    clock.now += 30
+    assert store.get_bytes(ref) == b"a" * 100
+    # TTL 从最近一次访问起算
+    clock.now += 59
+    assert store.has(ref)
+    clock.now += 2
+    assert not store.has(ref)
+    with pytest.raises(KeyError):
+        store.get_bytes(ref)
+    assert store.stats() == {"items": 0, "memory_bytes": 0}
+
+
+def test_disk_gc_keeps_persisted_refs_out_of_size_sweep(tmp_path):
+    store = _store(tmp_path, max_memory_bytes=0, max_disk_bytes=250, gc_interval=3600)
+    kept = store.put_bytes(os.urandom(100))
+    store.persist(kept)
+    spilled = [store.put_bytes(os.urandom(100)) for _ in range(4)]
+    now = time.time()
+    for age, ref in enumerate(reversed(spilled)):
+        os.utime(store.spill_store.path(artifact_digest(ref)), (now - age, now - age))
+    # 持久化的制品在溢出区中的副本最旧，会被清理，但持久区的副本保留
+    os.utime(store.spill_store.path(artifact_digest(kept)), (now - 10, now - 10))
+
+    removed, total = store.gc_disk()
+    # 溢出区从最旧的文件开始删除直到不超过上限，持久区不受容量清理影响
+    assert (removed, total) == (3, 200)
+    assert [store.has(ref) for ref in spilled] == [False, False, True, True]
+    assert not store.spill_store.has(artifact_digest(kept))
+    assert len(store.get_bytes(kept)) == 100
+
+
+def test_disk_gc_expires_old_files_and_is_throttled(tmp_path):
+    store = _store(tmp_path, max_memory_bytes=0, disk_ttl=60, persist_ttl=3600, gc_interval=3600)
+    spilled = store.put_bytes(b"a" * 100)
+    persisted = store.put_bytes(b"b" * 100)
+    store.persist(persisted)
+    old = time.time() - 120
+    os.utime(store.spill_store.path(artifact_digest(spilled)), (old, old))
+    os.utime(store.persist_store.path(artifact_digest(persisted)), (old, old))
+
+    # 距上次清理未超过 gc_interval，溢出不会触发遍历目录
+    store.put_bytes(b"c" * 100)
+    assert store.has(spilled)
+
+    assert store.gc_disk()[0] == 1
+    assert not store.has(spilled)
+    assert store.has(persisted)
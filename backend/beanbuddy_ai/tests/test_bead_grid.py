@@ -0,0 +1,11 @@
+import numpy as np
+import pytest
+
+from beanbuddy_ai.imaging.bead_grid import grid_from_cell_colors
+
+
+def test_unknown_color_template_is_rejected():
+    colors = np.zeros((2, 2, 3), dtype=np.uint8)
+    occupied = np.ones((2, 2), dtype=bool)
+    with pytest.raises(ValueError, match="不存在"):
+        grid_from_cell_colors(colors, occupied, "no-such-card", 10, 20, 20)
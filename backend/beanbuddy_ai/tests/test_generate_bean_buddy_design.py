@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("nat")
+
+from beanbuddy_ai.tools.generate_bean_buddy_design import (GenerateBeanBuddyDesignConfig, _pending_markdown,
+                                                            _run_design_job)
+from beanbuddy_ai.utils.job_queue import STATUS_QUEUED, JobTimeout, SQLiteJobQueue
+
+
+def test_queue_job_past_timeout_reports_job_id(tmp_path, monkeypatch):
+    monkeypatch.setenv("BEANBUDDY_DATA_DIR", str(tmp_path))
+    queue = SQLiteJobQueue(tmp_path / "queue.db")
+    config = GenerateBeanBuddyDesignConfig(execution="queue", job_timeout=0.05)
+    with pytest.raises(JobTimeout) as excinfo:
+        asyncio.run(_run_design_job(queue, "https://example.com/a.png", config, config.rembg_model_name, {}))
+    job_id = excinfo.value.job_id
+    # 没有工作进程领取，任务仍在排队
+    assert queue.get(job_id).status == STATUS_QUEUED
+    markdown = _pending_markdown(excinfo.value, "/designs")
+    assert job_id in markdown
+    assert f"(/designs/jobs/{job_id})" in markdown
+    queue.close()
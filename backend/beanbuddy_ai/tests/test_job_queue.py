@@ -0,0 +1,131 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from beanbuddy_ai.utils.job_queue import (JOB_KIND_DESIGN, STATUS_CANCELLED, STATUS_FAILED, STATUS_QUEUED,
+                                          STATUS_RUNNING, STATUS_SUCCEEDED, JobTimeout, SQLiteJobQueue, wait_for_job)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SQLiteJobQueue(tmp_path / "queue.db")
+    yield queue
+    queue.close()
+
+
+def test_wait_for_job_timeout_keeps_job_queryable(queue):
+    job_id = queue.submit(JOB_KIND_DESIGN, {"image_url": "artifact://x"})
+    with pytest.raises(JobTimeout) as excinfo:
+        asyncio.run(wait_for_job(queue, job_id, timeout=0.05, poll_interval=0.01))
+    assert excinfo.value.job_id == job_id
+    assert excinfo.value.status == STATUS_QUEUED
+    # 超时不取消任务，工作进程稍后完成后仍可查询结果
+    job = queue.claim([JOB_KIND_DESIGN], "worker-a", visibility_timeout=60)
+    assert job.id == job_id
+    assert queue.complete(job_id, "worker-a", {"image_name": "x.png"})
+    assert queue.get(job_id).status == STATUS_SUCCEEDED
+
+
+def test_wait_for_job_returns_finished_job(queue):
+    job_id = queue.submit(JOB_KIND_DESIGN, {})
+
+    async def finish_later():
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(queue.claim, [JOB_KIND_DESIGN], "worker-a", 60)
+        await asyncio.to_thread(queue.complete, job_id, "worker-a", {"ok": True})
+
+    async def main():
+        finisher = asyncio.create_task(finish_later())
+        job = await wait_for_job(queue, job_id, timeout=5.0, poll_interval=0.01)
+        await finisher
+        return job
+
+    job = asyncio.run(main())
+    assert job.status == STATUS_SUCCEEDED and job.result == {"ok": True}
+
+
+def test_cancelled_wait_cancels_job(queue):
+    job_id = queue.submit(JOB_KIND_DESIGN, {})
+
+    async def main():
+        waiter = asyncio.create_task(wait_for_job(queue, job_id, timeout=5.0, poll_interval=0.01))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(main())
+    assert queue.get(job_id).status == STATUS_CANCELLED
+
+
+def test_claim_is_exclusive_across_connections(tmp_path):
+    db_path = tmp_path / "queue.db"
+    queues = [SQLiteJobQueue(db_path) for _ in range(4)]
+    job_ids = {queues[0].submit(JOB_KIND_DESIGN, {"n": i}) for i in range(20)}
+
+    def drain(index):
+        claimed = []
+        while (job := queues[index].claim([JOB_KIND_DESIGN], f"worker-{index}", visibility_timeout=60)) is not None:
+            claimed.append(job.id)
+        return claimed
+
+    with ThreadPoolExecutor(len(queues)) as pool:
+        claimed = [job_id for ids in pool.map(drain, range(len(queues))) for job_id in ids]
+    for queue in queues:
+        queue.close()
+    # 每个任务恰好被一个工作进程领取
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_expired_lease_is_reclaimed_and_stale_worker_rejected(queue):
+    job_id = queue.submit(JOB_KIND_DESIGN, {})
+    assert queue.claim([JOB_KIND_DESIGN], "worker-a", visibility_timeout=60).id == job_id
+    # 租约未过期时其他工作进程领取不到
+    assert queue.claim([JOB_KIND_DESIGN], "worker-b", visibility_timeout=60) is None
+    assert queue.heartbeat(job_id, "worker-a", visibility_timeout=0)
+
+    job = queue.claim([JOB_KIND_DESIGN], "worker-b", visibility_timeout=60)
+    assert job.id == job_id and job.worker == "worker-b" and job.attempts == 2
+    # 租约已被接手的旧工作进程不能续期、覆盖结果或记录失败
+    assert not queue.heartbeat(job_id, "worker-a", visibility_timeout=60)
+    assert not queue.complete(job_id, "worker-a", {"stale": True})
+    assert not queue.fail(job_id, "worker-a", "stale")
+    assert queue.complete(job_id, "worker-b", {"ok": True})
+    assert queue.get(job_id).result == {"ok": True}
+
+
+def test_fail_requeues_until_max_attempts(queue):
+    job_id = queue.submit(JOB_KIND_DESIGN, {}, max_attempts=2)
+    queue.claim([JOB_KIND_DESIGN], "worker-a", visibility_timeout=60)
+    assert queue.fail(job_id, "worker-a", "boom")
+    assert queue.get(job_id).status == STATUS_QUEUED
+
+    queue.claim([JOB_KIND_DESIGN], "worker-a", visibility_timeout=60)
+    assert queue.fail(job_id, "worker-a", "boom again")
+    job = queue.get(job_id)
+    assert job.status == STATUS_FAILED and job.attempts == 2 and job.error == "boom again"
+    assert queue.claim([JOB_KIND_DESIGN], "worker-a", visibility_timeout=60) is None
+
+
+def test_expired_lease_at_max_attempts_fails_job(queue):
+    job_id = queue.submit(JOB_KIND_DESIGN, {}, max_attempts=1)
+    queue.claim([JOB_KIND_DESIGN], "worker-a", visibility_timeout=0)
+    assert queue.get(job_id).status == STATUS_RUNNING
+    # 租约过期且尝试次数已用尽：不再重新执行，直接标记为失败
+    assert queue.claim([JOB_KIND_DESIGN], "worker-b", visibility_timeout=60) is None
+    assert queue.get(job_id).status == STATUS_FAILED
+
+
+def test_purge_removes_only_old_finished_jobs(queue):
+    finished_id = queue.submit(JOB_KIND_DESIGN, {})
+    queue.claim([JOB_KIND_DESIGN], "worker-a", visibility_timeout=60)
+    queue.complete(finished_id, "worker-a", {})
+    queued_id = queue.submit(JOB_KIND_DESIGN, {})
+
+    assert queue.purge(older_than=3600) == 0
+    time.sleep(0.01)
+    assert queue.purge(older_than=0) == 1
+    assert queue.get(finished_id) is None
+    assert queue.get(queued_id).status == STATUS_QUEUED
@@ -0,0 +1,65 @@
+import heapq
+
+import pytest
+
+from beanbuddy_ai.utils import quality_ladder
+from beanbuddy_ai.utils.quality_ladder import QualityLadder
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(quality_ladder.time, "monotonic", clock)
+    return clock
+
+
+def _simulate(ladder: QualityLadder, clock: _Clock, duration: float, interval: float, latency: float) -> list:
+    """每 interval 秒到达一个请求，每次设计耗时 latency 秒，返回各请求选中的档位"""
+    levels = []
+    completions = []
+    arrival = clock.now
+    end = clock.now + duration
+    while arrival < end:
+        while completions and completions[0][0] <= arrival:
+            clock.now, level = heapq.heappop(completions)
+            ladder.observe(level, latency)
+        clock.now = arrival
+        level = ladder.select(load=0)
+        levels.append(level)
+        heapq.heappush(completions, (arrival + latency, level))
+        arrival += interval
+    return levels
+
+
+def test_sustained_overload_stays_degraded(clock):
+    ladder = QualityLadder("test_overload", steps=["fast"], min_loads=[0], latency_slo=10.0, cooldown=10.0)
+    levels = _simulate(ladder, clock, duration=600.0, interval=2.0, latency=30.0)
+    first_degraded = levels.index(1)
+    # 升级后持续过载，不会在缺少耗时依据时恢复完整质量
+    assert all(level == 1 for level in levels[first_degraded:])
+
+
+def test_recovers_after_latency_falls(clock):
+    ladder = QualityLadder("test_recover", steps=["fast"], min_loads=[0], latency_slo=10.0, cooldown=10.0)
+    _simulate(ladder, clock, duration=120.0, interval=2.0, latency=30.0)
+    assert ladder.level == 1
+    levels = _simulate(ladder, clock, duration=120.0, interval=2.0, latency=2.0)
+    assert levels[-1] == 0
+
+
+def test_load_escalates_immediately_and_recovers_step_by_step(clock):
+    ladder = QualityLadder("test_load", steps=["a", "b"], min_loads=[4, 8], cooldown=10.0)
+    assert ladder.select(load=9) == 2
+    assert ladder.select(load=0) == 2
+    clock.now += 10.0
+    assert ladder.select(load=0) == 1
+    clock.now += 10.0
+    assert ladder.select(load=0) == 0
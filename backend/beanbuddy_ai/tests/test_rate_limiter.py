@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from beanbuddy_ai.utils.rate_limiter import ModelRateLimiter, Priority, RateLimit, RateLimitExceeded
+
+
+def _limiter(rpm: float, burst_seconds: float) -> ModelRateLimiter:
+    # 桶容量为 1：每次只能放行一个请求，其余请求排队
+    return ModelRateLimiter("test/model", RateLimit(rpm=rpm, burst_seconds=burst_seconds))
+
+
+def test_waiters_are_granted_by_priority():
+    limiter = _limiter(rpm=6000, burst_seconds=0.01)
+    order = []
+
+    async def request(priority: Priority):
+        await limiter.acquire(priority=priority)
+        order.append(priority)
+
+    async def main():
+        await limiter.acquire(priority=Priority.NEW)
+        # 按优先级从低到高依次到达，放行顺序应与到达顺序相反
+        await asyncio.gather(request(Priority.BACKGROUND), request(Priority.NEW), request(Priority.CONTINUATION))
+
+    asyncio.run(main())
+    assert order == [Priority.CONTINUATION, Priority.NEW, Priority.BACKGROUND]
+    assert limiter.throttled == 3
+
+
+def test_max_wait_fails_fast():
+    limiter = _limiter(rpm=60, burst_seconds=1)
+
+    async def main():
+        await limiter.acquire()
+        started = time.monotonic()
+        with pytest.raises(RateLimitExceeded) as excinfo:
+            await limiter.acquire(max_wait=0.1)
+        return time.monotonic() - started, excinfo.value
+
+    elapsed, error = asyncio.run(main())
+    assert elapsed < 0.1
+    assert error.estimated_wait > 0.1
+    assert limiter.rejected == 1 and not limiter._waiters
+
+
+def test_cancel_after_grant_refunds_quota():
+    limiter = _limiter(rpm=6000, burst_seconds=0.01)
+
+    async def main():
+        await limiter.acquire()
+        task = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert len(limiter._waiters) == 1
+        # 补充令牌后放行，并在调用方恢复执行前取消它
+        time.sleep(0.02)
+        limiter._dispatch()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert limiter.granted == 1
+    assert limiter._requests.level == pytest.approx(limiter._requests.capacity)
+
+
+def test_cancel_while_queued_leaves_queue_usable():
+    limiter = _limiter(rpm=6000, burst_seconds=0.01)
+
+    async def main():
+        await limiter.acquire()
+        task = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.wait_for(limiter.acquire(), timeout=1.0)
+
+    asyncio.run(main())
+    assert limiter.granted == 2 and not limiter._waiters
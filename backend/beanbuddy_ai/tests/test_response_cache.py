@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from beanbuddy_ai.utils.response_cache import ResponseCache
+
+
+class _Compute:
+    """可控的 LLM 调用：放行前一直挂起，记录调用次数"""
+
+    def __init__(self, value: str = "answer"):
+        self.value = value
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await self.release.wait()
+        return self.value
+
+
+def test_concurrent_requests_share_one_call():
+    cache = ResponseCache("test")
+
+    async def main():
+        compute = _Compute()
+        # 归一化后为同一个键
+        texts = ["雪山日出", "雪山 日出", "雪山，日出", "雪山日出。", " 雪山日出 "]
+        tasks = [asyncio.create_task(cache.get_or_compute(text, "v1", "llm", compute)) for text in texts]
+        await asyncio.sleep(0.01)
+        compute.release.set()
+        return compute.calls, await asyncio.gather(*tasks)
+
+    calls, results = asyncio.run(main())
+    assert calls == 1
+    assert results == ["answer"] * 5
+    assert cache.stats.misses == 1 and cache.stats.coalesced == 4
+
+
+def test_cancelled_waiter_does_not_poison_leader():
+    cache = ResponseCache("test")
+
+    async def main():
+        compute = _Compute()
+        leader = asyncio.create_task(cache.get_or_compute("雪山日出", "v1", "llm", compute))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cache.get_or_compute("雪山日出", "v1", "llm", compute))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # 被取消的等待者不影响进行中的调用，后来的请求仍然合并到同一次调用
+        late = asyncio.create_task(cache.get_or_compute("雪山日出", "v1", "llm", compute))
+        await asyncio.sleep(0.01)
+        compute.release.set()
+        return compute.calls, await leader, await late
+
+    calls, leader_value, late_value = asyncio.run(main())
+    assert calls == 1
+    assert leader_value == late_value == "answer"
+    assert cache.stats.coalesced == 1
+
+
+def test_waiter_recomputes_when_leader_is_cancelled():
+    cache = ResponseCache("test")
+
+    async def main():
+        compute = _Compute()
+        leader = asyncio.create_task(cache.get_or_compute("雪山日出", "v1", "llm", compute))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cache.get_or_compute("雪山日出", "v1", "llm", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        compute.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return compute.calls, await waiter
+
+    calls, value = asyncio.run(main())
+    assert calls == 2 and value == "answer"
+
+
+def test_failure_reaches_waiters_and_is_not_cached():
+    cache = ResponseCache("test")
+
+    async def main():
+        release = asyncio.Event()
+
+        async def failing() -> str:
+            await release.wait()
+            raise RuntimeError("llm down")
+
+        tasks = [asyncio.create_task(cache.get_or_compute("雪山日出", "v1", "llm", failing)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        compute = _Compute()
+        compute.release.set()
+        return results, await cache.get_or_compute("雪山日出", "v1", "llm", compute), compute.calls
+
+    results, value, calls = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert value == "answer" and calls == 1
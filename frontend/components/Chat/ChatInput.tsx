@@ -40,7 +40,7 @@ export const ChatInput = ({
   const { t } = useTranslation('chat');
 
   const {
-    state: { selectedConversation, messageIsStreaming, loading, webSocketMode },
+    state: { selectedConversation, messageIsStreaming, loading, webSocketMode, chatCompletionURL },
     dispatch: homeDispatch,
   } = useContext(HomeContext);
 
@@ -107,6 +107,28 @@ export const ChatInput = ({
     }
   };
 
+    // 3. 直传后端（POST /uploads，返回 artifact:// 引用），省去OSS上传与后端工具的重复下载；后端不支持时回退到OSS
+  const uploadToBackend = async (file: File): Promise<string | null> => {
+    try {
+      const endpoint = sessionStorage.getItem('chatCompletionURL') || chatCompletionURL || '';
+      // 经前端同源的 /api/upload 转发到后端 /uploads（与聊天请求一样走代理，后端无需开启 CORS）
+      const response = await fetch(`/api/upload?endpoint=${encodeURIComponent(endpoint)}`, {
+        method: 'POST',
+        headers: { 'Content-Type': file.type || 'application/octet-stream' },
+        body: file,
+      });
+      if (!response.ok) {
+        console.warn('后端直传失败，改用OSS上传：', response.status);
+        return null;
+      }
+      const { ref } = await response.json();
+      return ref || null;
+    } catch (err) {
+      console.warn('后端直传失败，改用OSS上传：', err);
+      return null;
+    }
+  };
+
   const triggerFileUpload = () => {
     fileInputRef?.current.click();
   };
@@ -123,7 +145,7 @@ export const ChatInput = ({
   }) => {
     const file = e.target.files[0];
     if (file) {
-      const fileUrl = await uploadToOSS(file);
+      const fileUrl = (await uploadToBackend(file)) || (await uploadToOSS(file));
       if (fileUrl) {
         // 上传成功：将文件URL传入发送逻辑（例：拼接至content，或单独传给onSend）
         setContent(fileUrl);
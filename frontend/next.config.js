@@ -29,6 +29,16 @@ const nextConfig = {
     return [
     ]
   },
+  // 设计图、分块与任务状态链接默认是相对路径 /designs/...，由前端同源转发到后端
+  async rewrites() {
+    const chatURL = process.env.NEXT_PUBLIC_HTTP_CHAT_COMPLETION_URL || 'http://127.0.0.1:8001/chat/stream';
+    return [
+      {
+        source: '/designs/:path*',
+        destination: `${new URL(chatURL).origin}/designs/:path*`,
+      },
+    ];
+  },
 };
 
 module.exports = nextConfig;
@@ -0,0 +1,43 @@
+export const config = {
+  runtime: 'edge',
+};
+
+// 图片直传代理：浏览器与前端同源，无需后端开启 CORS，由此转发到后端 /uploads
+const handler = async (req: Request): Promise<Response> => {
+  const endpoint = new URL(req.url).searchParams.get('endpoint') || '';
+
+  let uploadURL;
+  try {
+    uploadURL = `${new URL(endpoint).origin}/uploads`;
+  } catch (error) {
+    return new Response(JSON.stringify({ detail: 'Invalid backend endpoint' }), {
+      status: 400,
+      headers: { 'Content-Type': 'application/json' },
+    });
+  }
+
+  try {
+    console.log('aiq - forwarding upload to', { url: uploadURL });
+    const response = await fetch(uploadURL, {
+      method: 'POST',
+      headers: {
+        'Content-Type': req.headers.get('Content-Type') || 'application/octet-stream',
+      },
+      body: await req.arrayBuffer(),
+    });
+    console.log('aiq - received upload response from server', response.status);
+
+    return new Response(await response.text(), {
+      status: response.status,
+      headers: { 'Content-Type': response.headers.get('Content-Type') || 'application/json' },
+    });
+  } catch (error) {
+    console.log('aiq - upload forwarding error', error);
+    return new Response(JSON.stringify({ detail: 'Backend unavailable' }), {
+      status: 502,
+      headers: { 'Content-Type': 'application/json' },
+    });
+  }
+};
+
+export default handler;